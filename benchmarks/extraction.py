@@ -0,0 +1,255 @@
+"""
+End to end benchmark of the extractor on synthetic multi-schema datasets. Each scenario is loaded into a MySQL
+stand-in, the component is run in a separate process against it and its wall time, rows/sec, peak RSS and number
+of queries are reported.
+
+The default target is the in-process MySQL stand-in (tests/fake_mysql_server.py) running in a separate process.
+Pass --mysql host:port:user:password to load the datasets into a local mysqld / MariaDB instead (schemas named
+bench_*, dropped and recreated on each run).
+
+Usage: python benchmarks/extraction.py [--scenario many_schemas] [--scale 1.0] [--param max_workers=4]
+                                       [--output result.json] [--compare previous.json]
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.append(REPO_PATH)
+
+from tests.fake_mysql_server import FakeMySQLServer  # noqa: E402
+
+SCHEMA_PREFIX = 'bench_'
+# name, number of schemas, tables per schema, rows per table, extra text columns
+SCENARIOS = {
+    'many_schemas': (500, 3, 20, 0),
+    'huge_tables': (2, 1, 250000, 0),
+    'wide_rows': (5, 1, 20000, 40),
+}
+# rows/sec drop reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.1
+
+
+def table_columns(wide_columns):
+    columns = [('id', 'INT'), ('amount', 'DECIMAL(12,2)'), ('created', 'DATETIME'), ('name', 'VARCHAR(50)')]
+    return columns + [(f'text_{i}', 'VARCHAR(100)') for i in range(wide_columns)]
+
+
+def generate_rows(n, wide_columns):
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(1, n + 1):
+        yield (i, f'{i % 10000}.{i % 100:02d}', start + datetime.timedelta(seconds=i), f'customer "{i}", ltd') + \
+            tuple(f'value {i} of column {c}' for c in range(wide_columns))
+
+
+def get_dataset(scenario, scale):
+    """
+    :return: list of (schema, table, columns, row count, wide columns)
+    """
+    schemas, tables, rows, wide = SCENARIOS[scenario]
+    schemas = max(1, int(schemas * scale)) if scenario == 'many_schemas' else schemas
+    rows = max(1, int(rows * scale)) if scenario != 'many_schemas' else rows
+    return [(f'{SCHEMA_PREFIX}{s:05d}', f'table_{t}', table_columns(wide), rows, wide)
+            for s in range(schemas) for t in range(tables)]
+
+
+class FakeTarget:
+
+    def __init__(self):
+        """
+        MySQL stand-in served from a separate process, so it does not compete with the measured run for the GIL
+        of the benchmark process.
+        """
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=self._serve, args=(child_conn,), daemon=True)
+        self._process.start()
+        self.host, self.port = '127.0.0.1', self._conn.recv()
+        self.user, self.password = 'user', 'pass'
+
+    @staticmethod
+    def _serve(conn):
+        server = FakeMySQLServer().start()
+        conn.send(server.port)
+        while True:
+            command, args = conn.recv()
+            if command == 'load':
+                for schema, table, columns, rows, wide in args:
+                    server.create_table(schema, table, columns, list(generate_rows(rows, wide)))
+                conn.send(None)
+            elif command == 'count':
+                conn.send(server.query_count)
+            else:
+                break
+
+    def load(self, dataset):
+        self._conn.send(('load', dataset))
+        self._conn.recv()
+
+    def query_count(self):
+        self._conn.send(('count', None))
+        return self._conn.recv()
+
+    def close(self):
+        self._conn.send(('stop', None))
+        self._process.join(5)
+
+
+class MySQLTarget:
+
+    def __init__(self, dsn):
+        """
+        :param dsn: host:port:user:password of a local server, the user must be allowed to create databases
+        """
+        import pymysql
+        self.host, port, self.user, self.password = dsn.split(':', 3)
+        self.port = int(port)
+        self._db = pymysql.connect(host=self.host, port=self.port, user=self.user, password=self.password,
+                                   autocommit=True)
+
+    def load(self, dataset):
+        cur = self._db.cursor()
+        cur.execute(f"SHOW DATABASES LIKE '{SCHEMA_PREFIX}%'")
+        for (schema,) in cur.fetchall():
+            cur.execute(f'DROP DATABASE {schema}')
+        for schema, table, columns, rows, wide in dataset:
+            cur.execute(f'CREATE DATABASE IF NOT EXISTS {schema}')
+            col_defs = ', '.join(f'{c} {t}' for c, t in columns)
+            cur.execute(f'CREATE TABLE {schema}.{table} ({col_defs}, PRIMARY KEY (id))')
+            placeholders = ', '.join(['%s'] * len(columns))
+            batch = []
+            for row in generate_rows(rows, wide):
+                batch.append(row)
+                if len(batch) >= 5000:
+                    cur.executemany(f'INSERT INTO {schema}.{table} VALUES ({placeholders})', batch)
+                    batch = []
+            if batch:
+                cur.executemany(f'INSERT INTO {schema}.{table} VALUES ({placeholders})', batch)
+
+    def query_count(self):
+        cur = self._db.cursor()
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cur.fetchone()[1])
+
+    def close(self):
+        self._db.close()
+
+
+def run_extractor(target, dataset, params, data_path):
+    """
+    Run the component in a child process.
+
+    :return: dict of the measured values
+    """
+    for folder in ('in', 'out/tables', 'out/files'):
+        os.makedirs(os.path.join(data_path, folder), exist_ok=True)
+    table_names = sorted({table for _, table, _, _, _ in dataset})
+    config = {'parameters': {'#password': target.password, 'user': target.user, 'host': target.host,
+                             'port': target.port, 'schema_pattern': f'^{SCHEMA_PREFIX}',
+                             'tables': [{'name': t, 'columns': [], 'pkey': ['id']} for t in table_names],
+                             'metrics': True, **params}}
+    with open(os.path.join(data_path, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+    queries = target.query_count()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_PATH, 'src', 'component.py')],
+                               env={**os.environ, 'KBC_DATADIR': data_path}, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    # resource usage of this very child, peak RSS in kB on Linux
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_sec = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(f'Extraction failed: {process.stderr.read().decode()[-2000:]}')
+    process.stderr.close()
+
+    with open(os.path.join(data_path, 'out', 'files', 'metrics.json')) as f:
+        totals = json.load(f)['totals']
+    return {'rows': totals['rows'], 'wall_sec': round(wall_sec, 3), 'rows_per_sec': round(totals['rows'] / wall_sec),
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1), 'queries': target.query_count() - queries,
+            'query_sec': round(totals['query_sec'], 3), 'fetch_sec': round(totals['fetch_sec'], 3),
+            'encode_sec': round(totals['encode_sec'], 3)}
+
+
+def compare(results, previous):
+    """
+    Print change of rows/sec against previous results.
+
+    :return: True if any scenario regressed by more than REGRESSION_THRESHOLD
+    """
+    regressed = False
+    for scenario, result in results['scenarios'].items():
+        before = previous.get('scenarios', {}).get(scenario)
+        if not before:
+            continue
+        change = result['rows_per_sec'] / before['rows_per_sec'] - 1
+        flag = 'REGRESSION' if change < -REGRESSION_THRESHOLD else ''
+        regressed = regressed or bool(flag)
+        print(f'{scenario}: {before["rows_per_sec"]} -> {result["rows_per_sec"]} rows/sec ({change:+.1%}) {flag}')
+    return regressed
+
+
+def parse_param(value):
+    key, _, raw = value.partition('=')
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, may be repeated, all by default')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number of schemas / rows')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, the fastest one is reported')
+    parser.add_argument('--param', action='append', default=[], help='extractor parameter key=json value')
+    parser.add_argument('--mysql', help='host:port:user:password of a local MySQL / MariaDB to use')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='previous output file, exits with 1 on regression')
+    args = parser.parse_args()
+
+    params = dict(parse_param(p) for p in args.param)
+    results = {'started': datetime.datetime.utcnow().isoformat(), 'python': platform.python_version(),
+               'target': 'mysql' if args.mysql else 'fake', 'scale': args.scale, 'params': params,
+               'scenarios': {}}
+    target = MySQLTarget(args.mysql) if args.mysql else None
+    for scenario in args.scenario or sorted(SCENARIOS):
+        dataset = get_dataset(scenario, args.scale)
+        # fresh stand-in for each scenario, it keeps all the data in memory
+        scenario_target = target or FakeTarget()
+        scenario_target.load(dataset)
+        runs = []
+        for _ in range(args.repeat):
+            data_path = tempfile.mkdtemp()
+            try:
+                runs.append(run_extractor(scenario_target, dataset, params, data_path))
+            finally:
+                shutil.rmtree(data_path, ignore_errors=True)
+        if not target:
+            scenario_target.close()
+        best = min(runs, key=lambda r: r['wall_sec'])
+        results['scenarios'][scenario] = {**best, 'schemas': len({d[0] for d in dataset}),
+                                          'tables': len(dataset), 'runs': [r['wall_sec'] for r in runs]}
+        print(f'{scenario}: {json.dumps(results["scenarios"][scenario])}')
+    if target:
+        target.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f)):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares extraction throughput of the default typed conversion and the raw values fast path
+(Client(raw_values=True)). Rows are served by the in-process MySQL stand-in running in a separate process
+with cached results, so the measured time is spent in the driver decoding rows and in CSV encoding.
+
+Usage: python benchmarks/raw_fast_path.py [--rows 200000] [--repeat 3] [--output result.json]
+"""
+import argparse
+import datetime
+import filecmp
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from tests.fake_mysql_server import FakeMySQLServer  # noqa: E402
+from mysql_connect.client import Client  # noqa: E402
+from output_writer import OutputWriter  # noqa: E402
+
+COLUMNS = [('id', 'INT'), ('amount', 'DECIMAL(12,2)'), ('ratio', 'DOUBLE'), ('created', 'DATETIME'),
+           ('name', 'VARCHAR(50)'), ('note', 'TEXT')]
+
+
+def generate_rows(n):
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(n):
+        yield (i, f'{i % 10000}.{i % 100:02d}', i / 7, start + datetime.timedelta(seconds=i),
+               f'customer "{i}", ltd', None if i % 3 else f'note {i}\nsecond line')
+
+
+def serve(rows, conn):
+    server = FakeMySQLServer(cache_results=True)
+    server.create_table('bench', 'orders', COLUMNS, list(generate_rows(rows)))
+    server.start()
+    conn.send(server.port)
+    # serve until terminated
+    conn.recv()
+
+
+def extract(port, raw_values, out_path):
+    client = Client('127.0.0.1', port, 'user', 'pass', raw_values=raw_values)
+    writer = OutputWriter(out_path)
+    rows = 0
+    start = time.perf_counter()
+    for data, col_names, last_id in client.get_table_data_chunks('orders', 'bench', sort_key_col='id'):
+        writer.write('orders', data, suffix='bench')
+        rows += len(data)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    client.db.close()
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(args.rows, child_conn), daemon=True)
+    server.start()
+    port = parent_conn.recv()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {mode: os.path.join(tmp, mode) for mode in ('typed', 'raw')}
+        for p in paths.values():
+            os.mkdir(p)
+        # warm up the server result cache
+        extract(port, False, paths['typed'])
+        for mode, raw_values in (('typed', False), ('raw', True)):
+            timings = [extract(port, raw_values, paths[mode]) for _ in range(args.repeat)]
+            rows, best = min(timings, key=lambda t: t[1])
+            results[mode] = {'rows': rows, 'seconds': round(best, 4), 'rows_per_sec': round(rows / best)}
+        results['speedup'] = round(results['raw']['rows_per_sec'] / results['typed']['rows_per_sec'], 2)
+        results['identical_output'] = filecmp.cmp(os.path.join(paths['typed'], 'orders', 'orders.csv'),
+                                                  os.path.join(paths['raw'], 'orders', 'orders.csv'),
+                                                  shallow=False)
+    parent_conn.send('stop')
+    server.terminate()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,29 @@ Template Component main class.
 
 '''
 
-import gzip
-
-import base64
-import csv
-import json
+import asyncio
+import functools
+import hashlib
 import logging
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
 from kbc.env_handler import KBCEnvHandler
 
-from mysql_connect.client import Client
+from metrics import Profiler, TableMetrics
+from mysql_connect.async_client import AsyncClientPool
+from mysql_connect.binlog import BinlogFileReader, BinlogReader, EVENT_COMMIT, EVENT_DELETE
+from mysql_connect.client import ClientError, key_order, parse_number, to_key_value
+from mysql_connect.drivers import DRIVER_PYMYSQL
+from mysql_connect.pool import ClientPool
+from mysql_connect.throttle import Throttle, CHECK_INTERVAL_SEC
+from output_writer import OutputWriter, FORMAT_CSV, FORMAT_PARQUET, ROW_GROUP_ROWS, WRITE_QUEUE_SIZE
+from state_store import StateStore
 
 # configuration variables
 KEY_DEST_BUCKET = 'dest_bucket'
@@ -33,17 +44,89 @@ KEY_USER = 'user'
 KEY_PASSWORD = '#password'
 KEY_HOST = 'host'
 KEY_PORT = 'port'
+# list of shards / replicas {host, port, user, #password, max_workers, max_connections}, unset values are taken
+# from the top level parameters
+KEY_HOSTS = 'hosts'
 KEY_TABLES = 'tables'
 KEY_INCREMENTAL_FETCH = 'incremental_fetch'
 KEY_MAX_RUNTIME_SEC = 'max_runtime_sec'
 
 KEY_VALIDATION_MODE = 'validation_mode'
+# tables with at least this many rows (information_schema estimate) are not counted, the estimate is used
+KEY_VALIDATION_ESTIMATE_MIN_ROWS = 'validation_estimate_min_rows'
+# parallel extraction
+KEY_MAX_WORKERS = 'max_workers'
+KEY_MAX_CONNECTIONS = 'max_connections'
+# number of schemas queried at once with UNION ALL
+KEY_UNION_BATCH_SIZE = 'union_batch_size'
+# max rows per query when walking tables in pages
+KEY_PAGE_SIZE = 'page_size'
+# inclusive (>= last sort key) or exclusive (strictly after last sort key + pkey tuple)
+KEY_BOUNDARY_MODE = 'boundary_mode'
+# memory available for fetched data, split between workers
+KEY_MEMORY_BUDGET_MB = 'memory_budget_mb'
+KEY_WRITER_THREADS = 'writer_threads'
+# skip conversion of fetched values to python types
+KEY_RAW_VALUES = 'raw_values'
+# output slicing
+KEY_OUTPUT_SLICE_SIZE_MB = 'output_slice_size_mb'
+KEY_OUTPUT_COMPRESSION = 'output_compression'
+# csv (default) or parquet - typed columns, written to files as the table output mapping requires csv
+KEY_OUTPUT_FORMAT = 'output_format'
+KEY_PARQUET_ROW_GROUP_ROWS = 'parquet_row_group_rows'
+# table parameter, number of sort key ranges read concurrently
+KEY_PARALLEL_RANGES = 'parallel_ranges'
+# skip tables whose metadata (UPDATE_TIME, TABLE_ROWS, AUTO_INCREMENT) did not change since the last run, off by default
+KEY_SKIP_UNCHANGED_TABLES = 'skip_unchanged_tables'
+# min seconds between state checkpoints
+KEY_CHECKPOINT_INTERVAL_SEC = 'checkpoint_interval_sec'
+# per table performance metrics and profiling of the run (cpu, memory, all)
+KEY_METRICS = 'metrics'
+KEY_PROFILE = 'profile'
+# adaptive limit of the load put on each host {max_threads_running, max_replica_lag_sec, max_query_latency_sec,
+# check_interval_sec}
+KEY_THROTTLE = 'throttle'
+# polling (default) or binlog - change data capture from the binary log of each host
+KEY_SYNC_MODE = 'sync_mode'
+KEY_BINLOG_SERVER_ID = 'binlog_server_id'
+# events read from the server are appended to / events are replayed from a local JSONL file instead of the server
+KEY_BINLOG_CAPTURE_PATH = 'binlog_capture_path'
+KEY_BINLOG_REPLAY_PATH = 'binlog_replay_path'
+# pymysql (default) or mysqlclient (C extension), compressed protocol (mysqlclient only, may be set per host)
+KEY_DRIVER = 'driver'
+KEY_COMPRESS = 'compress'
+# threads (default) or async - queries of all the schemas multiplexed on a single event loop
+KEY_ENGINE = 'engine'
+# order of the schemas: config (default) or largest_first (estimated cost, tables not fitting the remaining runtime
+# are deferred)
+KEY_SCHEDULE = 'schedule'
+BOUNDARY_EXCLUSIVE = 'exclusive'
+SCHEDULE_LARGEST_FIRST = 'largest_first'
+SYNC_MODE_BINLOG = 'binlog'
+ENGINE_ASYNC = 'async'
 
 # max runtime default 6.5hrs
 MAX_RUNTIME_SEC = 21600
+CHECKPOINT_INTERVAL_SEC = 30
+# max tables counted by a single validation query
+ROW_COUNT_BATCH_SIZE = 50
+# seconds between checks of the row count queue by the async engine
+ROW_COUNT_POLL_SEC = 0.05
+ROW_COUNT_COLUMNS = ['cnt', 'last_index', 'sort_key_col', 'table', 'is_estimate']
+MEMORY_BUDGET_MB = 512
+DEFAULT_PORT = 3306
+DEFAULT_BINLOG_SERVER_ID = 65432
+# rows of a binlog transaction buffered before they are written
+BINLOG_BUFFER_ROWS = 10000
+# output column marking rows deleted in the source, binlog mode only
+DELETED_COLUMN = 'is_deleted'
+# estimated cost of a table never downloaded before, overhead of a query and of a single row
+QUERY_COST_SEC = 0.01
+ROW_COST_SEC = 0.00001
 # #### Keep for debug
 KEY_DEBUG = 'debug'
-MANDATORY_PARS = [KEY_USER, KEY_PASSWORD, KEY_HOST, KEY_PORT, KEY_TABLES, [KEY_SCHEMA_PATTERN, KEY_SCHEMA_LIST]]
+# credentials may be set per item of hosts, validated per host
+MANDATORY_PARS = [[KEY_HOST, KEY_HOSTS], KEY_TABLES, [KEY_SCHEMA_PATTERN, KEY_SCHEMA_LIST]]
 
 
 class Component(KBCEnvHandler):
@@ -72,50 +155,194 @@ class Component(KBCEnvHandler):
         # init execution timer
         self.start_time = time.perf_counter()
         self.max_runtime_sec = float(self.cfg_params.get(KEY_MAX_RUNTIME_SEC, MAX_RUNTIME_SEC))
-        self._res_file_cache = dict()
+        self.checkpoint_interval_sec = float(self.cfg_params.get(KEY_CHECKPOINT_INTERVAL_SEC, CHECKPOINT_INTERVAL_SEC))
+        self._last_checkpoint = self.start_time
+        self._merge_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
 
     def run(self):
         '''
         Main execution code
         '''
+        self._profiler = Profiler(self.cfg_params.get(KEY_PROFILE))
+        with self._profiler:
+            self._run()
+        for f in self._profiler.write_reports(self._get_files_out_folder()):
+            self.configuration.write_file_manifest(f, file_tags=['profile'], is_permanent=False)
+
+    def _run(self):
         params = self.cfg_params  # noqa
 
-        cl = Client(params[KEY_HOST], params[KEY_PORT], params[KEY_USER], params[KEY_PASSWORD])
-        schema_pattern = params.get(KEY_SCHEMA_PATTERN)
-        schema_list = params.get(KEY_SCHEMA_LIST)
-        if not schema_list:
-            schemas = cl.get_schemas_by_pattern(schema_pattern)
-        else:
-            schemas = schema_list
+        hosts = self._get_hosts(params)
+        max_workers = sum(h[KEY_MAX_WORKERS] for h in hosts)
+        writer_threads = max(1, int(params.get(KEY_WRITER_THREADS) or 1))
+        self._async_engine = params.get(KEY_ENGINE) == ENGINE_ASYNC
+        # each running query holds a single fetched chunk, other chunks wait in the writer queues or are being written
+        in_flight = sum(h[KEY_MAX_CONNECTIONS] for h in hosts) if self._async_engine else max_workers
+        chunks_in_memory = in_flight + writer_threads * (WRITE_QUEUE_SIZE + 1)
+        chunk_memory_mb = float(params.get(KEY_MEMORY_BUDGET_MB) or MEMORY_BUDGET_MB) / chunks_in_memory
+        self._chunk_memory_mb = chunk_memory_mb
+        if self._async_engine and (params.get(KEY_PAGE_SIZE) or params.get(KEY_THROTTLE)
+                                   or any(t.get(KEY_PARALLEL_RANGES) for t in params[KEY_TABLES])):
+            logging.warning(f'{KEY_PAGE_SIZE}, {KEY_PARALLEL_RANGES} and {KEY_THROTTLE} are not used by the '
+                            f'async engine.')
+        self._metrics = TableMetrics() if params.get(KEY_METRICS) else None
+        # each host has its own connection pool and workers, schemas are extracted from the host they were found on
+        pools = []
+        self._schema_pools = dict()
+        self._binlog_mode = params.get(KEY_SYNC_MODE) == SYNC_MODE_BINLOG
+        output_format = params.get(KEY_OUTPUT_FORMAT) or FORMAT_CSV
+        self._parquet = output_format == FORMAT_PARQUET
+        # parquet columns are typed by the converted python values
+        self._raw_values = bool(params.get(KEY_RAW_VALUES, False)) and not self._parquet
+        # binlog position of each host, events are read from it, hosts without one are loaded completely first
+        last_positions = self.last_state.get('binlog') or dict()
+        self._binlog_positions = dict()
+        self._tables_metadata = dict()
+        table_names = list(dict.fromkeys(t[KEY_NAME] for t in params[KEY_TABLES]))
+        self._skip_unchanged = bool(params.get(KEY_SKIP_UNCHANGED_TABLES, False))
+        self._fingerprints = StateStore.load(self.last_state.get('fingerprints'))
+        # columns of the tables without explicit columns, each is queried in the canonical column order
+        projected_tables = list(dict.fromkeys(t[KEY_NAME] for t in params[KEY_TABLES] if not t[KEY_COLUMNS]))
+        self._tables_columns = dict()
+        try:
+            for h in hosts:
+                pool = ClientPool(h[KEY_HOST], h[KEY_PORT], h[KEY_USER], h[KEY_PASSWORD],
+                                  max_size=h[KEY_MAX_CONNECTIONS], chunk_memory_mb=chunk_memory_mb,
+                                  raw_values=self._raw_values, metrics=self._metrics,
+                                  throttle=self._get_throttle(params, h[KEY_MAX_CONNECTIONS]),
+                                  driver=params.get(KEY_DRIVER) or DRIVER_PYMYSQL, compress=h[KEY_COMPRESS])
+                pools.append(pool)
+                host_schemas = self._discover_schemas(pool, params, len(hosts) > 1)
+                # existence and change fingerprints of all the tables in a single metadata query
+                with pool.connection() as cl:
+                    if host_schemas:
+                        self._tables_metadata.update(cl.get_tables_metadata(host_schemas, table_names))
+                    # columns of all the tables to be queried in a single query
+                    queried_schemas = [s for s in host_schemas if self._binlog_mode or any(
+                        name in self._tables_metadata.get(s, {}) and not self._is_unchanged(
+                            s, name, self._tables_metadata[s][name]) for name in projected_tables)]
+                    if queried_schemas and projected_tables:
+                        self._tables_columns.update(cl.get_tables_columns(queried_schemas, projected_tables))
+                h['schemas'] = host_schemas
+                h['pool'] = pool
+                if self._binlog_mode:
+                    self._init_binlog_position(h, last_positions.get(self._get_host_id(h)), params)
+                logging.info(f'{h[KEY_HOST]}:{h[KEY_PORT]} - {len(host_schemas)} schemas, '
+                             f'{h[KEY_MAX_WORKERS]} worker(s), max {h[KEY_MAX_CONNECTIONS]} connection(s).')
+        except Exception:
+            for pool in pools:
+                pool.close_all()
+            raise
+        schemas = list(self._schema_pools)
+        self._column_order = self._get_column_order(projected_tables)
 
-        validation_mode = params.get(KEY_VALIDATION_MODE, False)
         # iterate through schemas
+        # progress of the run is stored over the last state, so schemas not reached (timeout, crash) keep their indexes
         last_state = self.get_last_state()
-        res_tables = dict()
-        last_indexes = dict()
+        last_state.retain(schemas, table_names)
+        self._last_indexes = last_state
+        self._fingerprints.retain(schemas, table_names)
+        # seconds spent downloading each table by the previous runs
+        self._timings = StateStore.load(self.last_state.get('timings'))
+        self._timings.retain(schemas, table_names)
+        # tables loaded completely by queries, binlog mode only - changes of these are read from the binlog
+        self._loaded = StateStore.load(self.last_state.get('loaded'))
+        self._loaded.retain(schemas, table_names)
+        self._streamed_schemas = {s for h in hosts if h.get('binlog_stream') for s in h['schemas']}
+        self._schedule_by_cost = params.get(KEY_SCHEDULE) == SCHEDULE_LARGEST_FIRST
+        self._res_tables = dict()
+        self._processed_schemas = 0
         total_schemas = len(schemas)
         logging.info(f'{total_schemas} schemas found matching the filter/pattern.')
-        for i, s in enumerate(schemas):
-            logging.info(f'Dowloading all tables from schema {s}')
-            if i % 10 == 0:
-                logging.info(f'Processing {i}. schema out of {total_schemas}.')
-            table_cols, downloaded_tables_indexes = self.download_tables(s, params, last_state, cl)
-            last_indexes = {**last_indexes, **downloaded_tables_indexes}
-            res_tables = {**res_tables, **table_cols}
-            # get table counts if validation
-            if validation_mode:
-                table_cols = self.download_table_row_counts(s, params, downloaded_tables_indexes, cl)
-                res_tables = {**res_tables, **table_cols}
-            if self.is_timed_out():
-                logging.warning(f'Max exection time of {self.max_runtime_sec}s has been reached. '
-                                f'Terminating. Job will continue next run.')
-                break
+        logging.info(f'Extracting using {max_workers} worker(s) on {len(hosts)} host(s).')
+
+        self._writer = OutputWriter(self._get_files_out_folder() if self._parquet else self.tables_out_path,
+                                    writer_threads=writer_threads,
+                                    slice_size_mb=params.get(KEY_OUTPUT_SLICE_SIZE_MB),
+                                    compression=params.get(KEY_OUTPUT_COMPRESSION) or None,
+                                    metrics=self._metrics, output_format=output_format,
+                                    row_group_rows=params.get(KEY_PARQUET_ROW_GROUP_ROWS) or ROW_GROUP_ROWS,
+                                    suffix_columns=['schema_nm', DELETED_COLUMN])
+
+        # work units are batches of schemas, single schema unless UNION ALL batching is enabled
+        batch_size = max(1, int(params.get(KEY_UNION_BATCH_SIZE) or 1))
+        if self._binlog_mode or self._async_engine:
+            # all rows of a table get the deleted marker, rows of UNION ALL batches are written as fetched
+            # the async engine runs many small queries at once instead
+            batch_size = 1
+        stop_event = threading.Event()
+        # validation row counts of the downloaded tables, counted in batches alongside the extraction, per host
+        self._row_count_queues = dict()
+        if params.get(KEY_VALIDATION_MODE, False):
+            self._row_count_queues = {h['pool']: queue.Queue() for h in hosts}
+        try:
+            binlog_hosts = [h for h in hosts if h.get('binlog_stream')]
+            # built before the row count workers start, they only stop once the extraction finishes
+            schema_queues = []
+            for h in hosts:
+                host_schemas = h['schemas']
+                if h.get('binlog_stream'):
+                    # changes are read from the binlog, only schemas with tables not loaded yet are queried
+                    host_schemas = [s for s in host_schemas if not all(self._is_loaded(s, n) for n in table_names)]
+                schema_queues.append(self._get_schema_queue(host_schemas, batch_size, table_names, params))
+            if self._async_engine:
+                # the async engine runs all the queries incl. the row counts on its own pools, so the connections
+                # of each host stay within max_connections
+                for pool in pools:
+                    pool.close_all()
+            with ThreadPoolExecutor(max_workers=max_workers + len(self._row_count_queues)
+                                    + len(binlog_hosts)) as executor:
+                counters = [] if self._async_engine else [
+                    executor.submit(self._profiler.wrap(self._row_count_worker), pool)
+                    for pool in self._row_count_queues]
+                futures = [executor.submit(self._profiler.wrap(self._binlog_worker), h, params, stop_event)
+                           for h in binlog_hosts]
+                if self._async_engine:
+                    futures.append(executor.submit(self._profiler.wrap(self._run_async_engine), hosts, schema_queues,
+                                                   total_schemas, params, last_state, stop_event))
+                else:
+                    for h, schema_queue in zip(hosts, schema_queues):
+                        futures += [executor.submit(self._profiler.wrap(self._schema_worker), schema_queue,
+                                                    total_schemas, params, last_state, h['pool'], stop_event)
+                                    for _ in range(h[KEY_MAX_WORKERS])]
+                try:
+                    for f in futures:
+                        try:
+                            f.result()
+                        except Exception:
+                            # stop the remaining workers and propagate the first error
+                            stop_event.set()
+                            raise
+                finally:
+                    for q in self._row_count_queues.values():
+                        q.put(None)
+                for f in counters:
+                    f.result()
+        finally:
+            for pool in pools:
+                pool.close_all()
+
+        if self.is_timed_out():
+            logging.warning(f'Max exection time of {self.max_runtime_sec}s has been reached. '
+                            f'Terminating. Job will continue next run.')
+
+        res_tables = self._res_tables
+        # make sure all the data is written before storing the state
+        self._close_res_stream()
 
         # gzip and store state
-        data = json.dumps(last_indexes)
-        data_gzipped = gzip.compress(bytes(data, 'utf-8'))
-        data_gzipped = str(base64.b64encode(data_gzipped), 'utf-8')
-        self.write_state_file({'data': data_gzipped})
+        self.write_state_file(self._dump_state())
+
+        if self._metrics:
+            self._metrics.log_summary()
+            metrics_path = os.path.join(self._get_files_out_folder(), 'metrics.json')
+            self._metrics.write_json(metrics_path)
+            self.configuration.write_file_manifest(metrics_path, file_tags=['metrics'], is_permanent=False)
+
+        if self._parquet:
+            self._write_parquet_manifests(res_tables)
+            return
 
         # store manifest
         default_bucket = f'in.c-kds-team-ex-mysql-multi-schema-{os.getenv("KBC_CONFIGID")}'
@@ -126,53 +353,406 @@ class Component(KBCEnvHandler):
                                                     destination=f'{default_bucket}.{t}',
                                                     columns=res_tables[t]['columns'],
                                                     incremental=True, primary_key=res_tables[t]['pk'])
-        self._close_res_stream()
+
+    def _write_parquet_manifests(self, res_tables):
+        """
+        Parquet slices are stored as files tagged with the table name, moved from the table folders to the files
+        output root (file names are prefixed by the table name).
+        """
+        files_path = self._get_files_out_folder()
+        for t in res_tables:
+            folder_path = os.path.join(files_path, t)
+            for file_name in sorted(os.listdir(folder_path)):
+                file_path = os.path.join(files_path, file_name)
+                os.replace(os.path.join(folder_path, file_name), file_path)
+                self.configuration.write_file_manifest(file_path, file_tags=['parquet', t], is_permanent=True)
+            os.rmdir(folder_path)
+
+    def _get_hosts(self, params):
+        """
+        Hosts to extract from, the single top level host unless a list of hosts is configured.
+
+        :return: list of dicts with host, port, user, password, max_workers, max_connections and compress
+        """
+        hosts = []
+        for h in params.get(KEY_HOSTS) or [{}]:
+            host = {key: h.get(key, params.get(key)) for key in (KEY_HOST, KEY_USER, KEY_PASSWORD)}
+            host[KEY_PORT] = int(h.get(KEY_PORT) or params.get(KEY_PORT) or DEFAULT_PORT)
+            host[KEY_COMPRESS] = bool(h.get(KEY_COMPRESS, params.get(KEY_COMPRESS, False)))
+            max_workers = max(1, int(h.get(KEY_MAX_WORKERS) or params.get(KEY_MAX_WORKERS) or 1))
+            host[KEY_MAX_CONNECTIONS] = int(h.get(KEY_MAX_CONNECTIONS) or params.get(KEY_MAX_CONNECTIONS)
+                                            or max_workers)
+            # more workers than connections would just wait on the pool
+            host[KEY_MAX_WORKERS] = min(max_workers, host[KEY_MAX_CONNECTIONS])
+            if not host[KEY_HOST]:
+                raise ValueError(f'Host is not specified in {KEY_HOSTS} item {len(hosts)}!')
+            missing = [key for key in (KEY_USER, KEY_PASSWORD) if host[key] is None]
+            if missing:
+                raise ValueError(f'Missing {", ".join(missing)} of host {host[KEY_HOST]}, set it in the {KEY_HOSTS} '
+                                 f'item or at the top level!')
+            hosts.append(host)
+        return hosts
+
+    @staticmethod
+    def _get_throttle(params, max_concurrency):
+        """
+        Throttle of a single host, None unless configured.
+        """
+        throttle_cfg = params.get(KEY_THROTTLE)
+        if not throttle_cfg:
+            return None
+        return Throttle(max_concurrency, max_threads_running=throttle_cfg.get('max_threads_running'),
+                        max_replica_lag_sec=throttle_cfg.get('max_replica_lag_sec'),
+                        max_query_latency_sec=throttle_cfg.get('max_query_latency_sec'),
+                        check_interval_sec=throttle_cfg.get('check_interval_sec', CHECK_INTERVAL_SEC))
+
+    def _discover_schemas(self, pool, params, multiple_hosts):
+        """
+        Schemas of the host matching the pattern or the list. Schemas already found on another host
+        (e.g. a replica listed after its primary) are left to that host.
+        """
+        schema_list = params.get(KEY_SCHEMA_LIST)
+        if not schema_list:
+            with pool.connection() as cl:
+                schemas = cl.get_schemas_by_pattern(params.get(KEY_SCHEMA_PATTERN))
+        elif multiple_hosts:
+            with pool.connection() as cl:
+                available = {s[0] for s in cl.get_available_schemas()}
+            schemas = [s for s in schema_list if s in available]
+        else:
+            schemas = schema_list
+
+        host_schemas = []
+        for s in schemas:
+            if s in self._schema_pools:
+                logging.warning(f'Schema {s} found on multiple hosts, extracting it from the first one only.')
+                continue
+            self._schema_pools[s] = pool
+            host_schemas.append(s)
+        return host_schemas
+
+    def _get_schema_queue(self, schemas, batch_size, table_names, params):
+        """
+        Work units of a host - batches of schemas, single schema unless UNION ALL batching is enabled.
+        """
+        batches = [schemas[i:i + batch_size] for i in range(0, len(schemas), batch_size)]
+        if self._schedule_by_cost:
+            # longest processing time first, workers pulling from the shared queue end up evenly loaded
+            # and the smallest batches are left for the end of the runtime
+            row_limit = params.get(KEY_ROW_LIMIT)
+            costs = {tuple(b): sum(self._estimate_cost(s, n, row_limit) for s in b for n in table_names)
+                     for b in batches}
+            batches.sort(key=lambda b: costs[tuple(b)], reverse=True)
+        schema_queue = queue.Queue()
+        for batch in batches:
+            schema_queue.put(batch)
+        return schema_queue
+
+    @staticmethod
+    def _get_host_id(host):
+        return f'{host[KEY_HOST]}:{host[KEY_PORT]}'
+
+    def _init_binlog_position(self, host, last_position, params):
+        """
+        Continue reading the binlog of the host from the stored position. Without one the current position
+        is stored and the schemas are loaded completely by queries, changes made meanwhile are read next run.
+        """
+        host_id = self._get_host_id(host)
+        if last_position is not None:
+            self._binlog_positions[host_id] = list(last_position)
+            host['binlog_stream'] = True
+            return
+        with host['pool'].connection() as cl:
+            position = cl.get_binlog_position()
+        if position is None:
+            if not params.get(KEY_BINLOG_REPLAY_PATH):
+                raise ClientError(f'Binary logging is not enabled on {host_id}!')
+            # replayed from the beginning of the capture
+            position = (None, None)
+        logging.info(f'{host_id} - no binlog position stored, loading all the tables, '
+                     f'binlog is read from {position[0]}:{position[1]} next run.')
+        self._binlog_positions[host_id] = list(position)
+
+    def _binlog_worker(self, host, params, stop_event):
+        """
+        Read changes of the tables in the schemas of the host from its binlog until all the events written so far
+        are read or the run times out. Inserted and updated rows are written as they are after the change, deleted
+        rows as they were before with the deleted marker set. Position is stored at the end of each transaction.
+        """
+        host_id = self._get_host_id(host)
+        log_file, log_pos = self._binlog_positions[host_id]
+        table_names = list(dict.fromkeys(t[KEY_NAME] for t in params[KEY_TABLES]))
+        if params.get(KEY_BINLOG_REPLAY_PATH):
+            reader = BinlogFileReader(params[KEY_BINLOG_REPLAY_PATH], host['schemas'], table_names, log_file,
+                                      log_pos)
+        else:
+            reader = BinlogReader(host[KEY_HOST], host[KEY_PORT], host[KEY_USER], host[KEY_PASSWORD],
+                                  params.get(KEY_BINLOG_SERVER_ID) or DEFAULT_BINLOG_SERVER_ID, host['schemas'],
+                                  table_names, log_file, log_pos, capture_path=params.get(KEY_BINLOG_CAPTURE_PATH))
+        logging.info(f'{host_id} - reading binlog from {log_file}:{log_pos}.')
+        buffered = dict()
+        buffered_rows = 0
+        total_rows = 0
+        events = reader.read()
+        try:
+            for event in events:
+                if event['type'] == EVENT_COMMIT:
+                    self._store_binlog_rows(buffered, params)
+                    buffered, buffered_rows = dict(), 0
+                    with self._merge_lock:
+                        self._binlog_positions[host_id] = [event['log_file'], event['log_pos']]
+                    self._checkpoint()
+                else:
+                    deleted = 1 if event['type'] == EVENT_DELETE else 0
+                    rows = buffered.setdefault((event['schema'], event['table']), [])
+                    rows.extend((values, deleted) for values in event['rows'])
+                    buffered_rows += len(event['rows'])
+                    total_rows += len(event['rows'])
+                    if buffered_rows >= BINLOG_BUFFER_ROWS:
+                        self._store_binlog_rows(buffered, params)
+                        buffered, buffered_rows = dict(), 0
+                if stop_event.is_set() or self.is_timed_out():
+                    break
+        finally:
+            events.close()
+        # rows of a transaction not finished yet are read again next run
+        self._store_binlog_rows(buffered, params)
+        logging.info(f'{host_id} - {total_rows} changed rows read from binlog, position '
+                     f'{":".join(str(p) for p in self._binlog_positions[host_id])}.')
+
+    def _store_binlog_rows(self, buffered, params):
+        """
+        Queue changed rows for writing in the column order of the table.
+
+        :param buffered: dict {(schema, table): [(column values dict, deleted), ...]}
+        """
+        for (schema, name), changes in buffered.items():
+            with self._merge_lock:
+                table = self._res_tables.get(name)
+                if table is None:
+                    t = next(t for t in params[KEY_TABLES] if t[KEY_NAME] == name)
+                    pkey = t.get(KEY_PKEY)
+                    pkey = list(pkey) if isinstance(pkey, list) else [pkey]
+                    columns = t[KEY_COLUMNS] or self._column_order.get(name) or list(changes[0][0])
+                    table = self._res_tables[name] = {'columns': columns + ['schema_nm', DELETED_COLUMN],
+                                                      'pk': pkey + ['schema_nm']}
+            columns = table['columns'][:-2]
+            self._writer.write(name, [tuple(values.get(c) for c in columns) + (schema, deleted)
+                                      for values, deleted in changes],
+                               description=[(c,) for c in table['columns']])
+
+    def _schema_worker(self, schema_queue, total_schemas, params, last_state, pool, stop_event):
+        """
+        Pulls schema batches from the shared queue until it is empty, the run times out or another worker fails.
+        Each batch is downloaded on a connection borrowed from the pool.
+        """
+        while not stop_event.is_set() and not self.is_timed_out():
+            try:
+                batch = schema_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._merge_lock:
+                i = self._processed_schemas
+                self._processed_schemas += len(batch)
+            logging.info(f'Dowloading all tables from schema {", ".join(batch)}')
+            if i % 10 == 0 or len(batch) > 1:
+                logging.info(f'Processing {i}. schema out of {total_schemas}.')
+
+            with pool.connection() as cl:
+                if len(batch) > 1:
+                    table_cols, downloaded_tables_indexes = self.download_tables_union(batch, params, last_state,
+                                                                                       cl)
+                else:
+                    table_cols, downloaded_tables_indexes = self.download_tables(batch[0], params, last_state, cl)
+            self._merge_batch(batch, table_cols, downloaded_tables_indexes, params)
+
+    def _merge_batch(self, batch, table_cols, downloaded_tables_indexes, params):
+        """
+        Merge result of a downloaded schema batch into the run state and queue its validation row counts.
+        """
+        self._save_progress(downloaded_tables_indexes)
+        with self._merge_lock:
+            if self._binlog_mode:
+                for table in table_cols.values():
+                    table['columns'] = table['columns'] + [DELETED_COLUMN]
+            self._res_tables.update(table_cols)
+        # get table counts if validation
+        if self._row_count_queues:
+            for s in batch:
+                self.queue_table_row_counts(s, params, downloaded_tables_indexes)
+
+    def _run_async_engine(self, hosts, schema_queues, total_schemas, params, last_state, stop_event):
+        """
+        Download the schemas of all the hosts on a single event loop, up to max_connections queries of each host
+        at once. Chunks are queued for the writer threads off the loop, so a full writer queue blocks only the
+        task that produced the chunk.
+        """
+        asyncio.run(self._async_workers(hosts, schema_queues, total_schemas, params, last_state, stop_event))
+
+    async def _async_workers(self, hosts, schema_queues, total_schemas, params, last_state, stop_event):
+        pools = []
+        tasks = []
+        counters = []
+        try:
+            for h, schema_queue in zip(hosts, schema_queues):
+                pool = AsyncClientPool(h[KEY_HOST], h[KEY_PORT], h[KEY_USER], h[KEY_PASSWORD],
+                                       max_size=h[KEY_MAX_CONNECTIONS], chunk_memory_mb=self._chunk_memory_mb,
+                                       raw_values=self._raw_values, metrics=self._metrics)
+                pools.append(await pool.open())
+                tasks += [asyncio.ensure_future(self._async_schema_worker(schema_queue, total_schemas, params,
+                                                                          last_state, pool.client(), stop_event))
+                          for _ in range(h[KEY_MAX_CONNECTIONS])]
+                if h['pool'] in self._row_count_queues:
+                    counters.append(asyncio.ensure_future(self._async_row_count_worker(
+                        self._row_count_queues[h['pool']], pool.client())))
+            try:
+                await asyncio.gather(*tasks)
+                for q in self._row_count_queues.values():
+                    q.put(None)
+                await asyncio.gather(*counters)
+            except Exception:
+                # stop the remaining workers, their connections must be released before the pools are closed
+                stop_event.set()
+                for t in tasks + counters:
+                    t.cancel()
+                await asyncio.gather(*tasks, *counters, return_exceptions=True)
+                raise
+        finally:
+            for pool in pools:
+                await pool.close_all()
+
+    async def _async_schema_worker(self, schema_queue, total_schemas, params, last_state, client, stop_event):
+        """
+        Async counterpart of the schema worker, pulls single schemas from the shared queue.
+        """
+        loop = asyncio.get_running_loop()
+        while not stop_event.is_set() and not self.is_timed_out():
+            try:
+                batch = schema_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._merge_lock:
+                i = self._processed_schemas
+                self._processed_schemas += len(batch)
+            logging.debug(f'Dowloading all tables from schema {batch[0]}')
+            if i % 100 == 0:
+                logging.info(f'Processing {i}. schema out of {total_schemas}.')
+            table_cols, downloaded_tables_indexes = await self.download_tables_async(batch[0], params, last_state,
+                                                                                     client)
+            # checkpoint waits for the output to be flushed
+            await loop.run_in_executor(None, self._merge_batch, batch, table_cols, downloaded_tables_indexes,
+                                       params)
+
+    def _row_count_worker(self, pool):
+        """
+        Counts rows of the tables queued for the host of the pool until None is received. Tables queued while
+        a count is running are counted together by the next query.
+        """
+        finished = False
+        while not finished:
+            batch, finished = self._get_row_count_batch(self._row_count_queues[pool])
+            if not batch:
+                continue
+            if self.is_timed_out():
+                logging.warning(f'Max exection time reached, skipping row counts of {len(batch)} tables.')
+                continue
+            with pool.connection() as cl:
+                self.download_table_row_counts(batch, cl)
+
+    async def _async_row_count_worker(self, row_count_queue, client):
+        """
+        Async counterpart of the row count worker, the counts share the connections of the host with the
+        extraction.
+
+        :param client: AsyncClient
+        """
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            batch, finished = self._get_row_count_batch(row_count_queue, block=False)
+            if not batch:
+                if not finished:
+                    await asyncio.sleep(ROW_COUNT_POLL_SEC)
+                continue
+            if self.is_timed_out():
+                logging.warning(f'Max exection time reached, skipping row counts of {len(batch)} tables.')
+                continue
+            logging.debug(f'Downloading row counts of {len(batch)} tables.')
+            data, _ = await client.get_table_row_counts(batch)
+            if data:
+                await loop.run_in_executor(None, self.store_table_count_data, data)
+
+    @staticmethod
+    def _get_row_count_batch(row_count_queue, block=True):
+        """
+        Tables queued for counting, at most ROW_COUNT_BATCH_SIZE of them.
+
+        :param block: wait for the first table, an empty batch is returned if none is queued otherwise
+        :return: (batch, finished) - finished once None is received
+        """
+        batch = []
+        try:
+            item = row_count_queue.get(block=block)
+        except queue.Empty:
+            return batch, False
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= ROW_COUNT_BATCH_SIZE:
+                return batch, False
+            try:
+                item = row_count_queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
 
     def download_tables(self, schema, params, last_state, client):
         """
-        Download tables using buffered cursor (in-mem full result)
+        Download tables of a single schema, streamed in chunks bounded by the memory budget
         """
         cl = client
         downloaded_tables = {}
         downloaded_tables_indexes = dict()
         for t in params[KEY_TABLES]:
-            incremental_fetch = t.get(KEY_INCREMENTAL_FETCH, True)
-            name = t[KEY_NAME]
-            columns = t[KEY_COLUMNS]
-            pkey = t.get(KEY_PKEY)
+            name, columns, pkey, incremental_fetch, row_limit, sort_key = self._get_table_params(t, params)
             last_index = None
-            row_limit = None
-            sort_key = dict()
-            if not isinstance(pkey, list):
-                pkey = [pkey]
             if incremental_fetch:
-                row_limit = params.get(KEY_ROW_LIMIT)
-                sort_key = t.get(KEY_SORT_KEY, {KEY_SORTKEY_TYPE: 'numeric', KEY_SORT_KEY_COL: ','.join(pkey)})
-                last_index = last_state.get(schema, {}).get(name)
-
-            # get sort key
-            # validate
-            if incremental_fetch and len(pkey) > 1 and not t.get(KEY_SORT_KEY):
-                raise Exception(
-                    f'Table "{name}" containing a composite pkey is set to incremental fetch '
-                    f'but no sort key is specified! ')
+                last_index = last_state.get(schema, name)
+            if not self._is_table_changed(schema, name) or self._is_deferred([schema], name, row_limit):
+                # the stored index is kept by the state
+                continue
 
             logging.debug(f"Downloading table '{name}' from schema '{schema}''.")
+            start = time.perf_counter()
+            columns = self._get_projection(schema, name, columns)
 
-            buffered_cursor = False if not incremental_fetch or (
-                    incremental_fetch and int(row_limit) > 500000) else True
-            if buffered_cursor:
-                downloaded_tables, downloaded_tables_indexes = self.get_table_data(name, schema, columns, pkey,
-                                                                                   row_limit, last_index,
-                                                                                   sort_key,
-                                                                                   downloaded_tables,
-                                                                                   downloaded_tables_indexes, cl)
+            page_size = int(params.get(KEY_PAGE_SIZE) or 0)
+            if not (sort_key.get(KEY_SORT_KEY_COL) or pkey[0]):
+                # nothing to page by
+                page_size = 0
+            parallel_ranges = int(t.get(KEY_PARALLEL_RANGES) or 1)
+            incomplete = set()
+            if parallel_ranges > 1 and sort_key.get(KEY_SORTKEY_TYPE) == 'numeric':
+                downloaded_tables, downloaded_tables_indexes = self.get_table_data_ranges(name, schema, columns, pkey,
+                                                                                          row_limit, last_index,
+                                                                                          sort_key,
+                                                                                          downloaded_tables,
+                                                                                          downloaded_tables_indexes, cl,
+                                                                                          parallel_ranges,
+                                                                                          page_size=page_size,
+                                                                                          incomplete=incomplete)
             else:
                 downloaded_tables, downloaded_tables_indexes = self.get_table_data_chunks(name, schema, columns, pkey,
                                                                                           row_limit, last_index,
                                                                                           sort_key,
                                                                                           downloaded_tables,
-                                                                                          downloaded_tables_indexes, cl)
+                                                                                          downloaded_tables_indexes, cl,
+                                                                                          page_size=page_size,
+                                                                                          incomplete=incomplete)
+            self._update_fingerprint(schema, name, complete=schema not in incomplete)
+            self._update_timing([schema], name, time.perf_counter() - start)
+            self._save_progress(downloaded_tables_indexes)
             if self.is_timed_out():
                 logging.warning(f'Max exection time of {self.max_runtime_sec}s has been reached. '
                                 f'Terminating. Job will continue next run.')
@@ -180,10 +760,387 @@ class Component(KBCEnvHandler):
 
         return downloaded_tables, downloaded_tables_indexes
 
+    async def download_tables_async(self, schema, params, last_state, client):
+        """
+        Download tables of a single schema with the async engine, each table with a single streamed query.
+
+        :param client: AsyncClient
+        """
+        loop = asyncio.get_running_loop()
+        downloaded_tables = {}
+        downloaded_tables_indexes = dict()
+        for t in params[KEY_TABLES]:
+            name, columns, pkey, incremental_fetch, row_limit, sort_key = self._get_table_params(t, params)
+            last_index = None
+            if incremental_fetch:
+                last_index = last_state.get(schema, name)
+            if not self._is_table_changed(schema, name) or self._is_deferred([schema], name, row_limit):
+                # the stored index is kept by the state
+                continue
+
+            logging.debug(f"Downloading table '{name}' from schema '{schema}''.")
+            start = time.perf_counter()
+            sort_key_col, since_index, key_cols, after_key = self._get_incremental_filter(sort_key, pkey, last_index)
+            chunks = client.get_table_data_chunks(name, schema, columns=self._get_projection(schema, name, columns),
+                                                  row_limit=row_limit, since_index=since_index,
+                                                  sort_key_col=sort_key_col,
+                                                  sort_key_type=sort_key.get(KEY_SORTKEY_TYPE),
+                                                  key_cols=key_cols, after_key=after_key)
+            fetched = 0
+            col_names = []
+            last_id = None
+            try:
+                async for data, col_names, last_id in chunks:
+                    fetched += len(data)
+                    # the writer queue blocks while the writers fall behind
+                    await loop.run_in_executor(None, functools.partial(self.store_table_data, data, name, schema,
+                                                                       description=client.description))
+                    if self._is_exclusive_boundary() and sort_key_col:
+                        last_id = self._get_last_key(data, col_names, key_cols, client.description)
+                    if self.is_timed_out():
+                        # stop at the last written chunk, the table continues from it next run
+                        break
+            finally:
+                await chunks.aclose()
+
+            if fetched:
+                downloaded_tables[name] = {'columns': col_names + ['schema_nm'], 'pk': pkey + ['schema_nm']}
+                downloaded_tables_indexes.setdefault(schema, dict())[name] = last_id
+            complete = not (self.is_timed_out() or row_limit and fetched >= int(row_limit))
+            self._update_fingerprint(schema, name, complete=complete)
+            self._update_timing([schema], name, time.perf_counter() - start)
+            if self.is_timed_out():
+                break
+
+        return downloaded_tables, downloaded_tables_indexes
+
+    def download_tables_union(self, schemas, params, last_state, client):
+        """
+        Download tables of several schemas at once, each table with a single UNION ALL query over all the schemas.
+        """
+        downloaded_tables = {}
+        downloaded_tables_indexes = dict()
+        for t in params[KEY_TABLES]:
+            name, columns, pkey, incremental_fetch, row_limit, sort_key = self._get_table_params(t, params)
+            last_indexes = dict()
+            if incremental_fetch:
+                last_indexes = {s: last_state.get(s, name) for s in schemas}
+            table_schemas = [s for s in schemas if self._is_table_changed(s, name)]
+            if self._is_deferred(table_schemas, name, row_limit):
+                table_schemas = []
+            if not table_schemas:
+                continue
+            since_indexes = dict()
+            after_keys = dict()
+            key_cols = None
+            sort_key_col = sort_key.get(KEY_SORT_KEY_COL)
+            for s in table_schemas:
+                sort_key_col, since_indexes[s], key_cols, after_keys[s] = self._get_incremental_filter(
+                    sort_key, pkey, last_indexes.get(s))
+
+            logging.debug(f"Downloading table '{name}' from schemas {table_schemas}.")
+            start = time.perf_counter()
+            has_data = False
+            col_names = []
+            fetched_rows = dict()
+            last_keys = dict()
+            columns = {s: self._get_projection(s, name, columns) for s in table_schemas}
+            chunks = client.get_union_table_data_chunks(name, table_schemas, columns=columns, row_limit=row_limit,
+                                                        since_indexes=since_indexes, sort_key_col=sort_key_col,
+                                                        sort_key_type=sort_key.get(KEY_SORTKEY_TYPE),
+                                                        key_cols=key_cols, after_keys=after_keys)
+            for data, col_names, last_ids in chunks:
+                if data:
+                    has_data = True
+                    # rows already contain the schema column
+                    self.store_table_data(data, name, description=client.description)
+                    if row_limit:
+                        for r in data:
+                            fetched_rows[r[-1]] = fetched_rows.get(r[-1], 0) + 1
+                    if self._is_exclusive_boundary():
+                        last_ids = self._get_last_keys_by_schema(data, col_names, key_cols, client.description,
+                                                                 last_keys)
+                    for s, last_id in last_ids.items():
+                        downloaded_tables_indexes.setdefault(s, dict())[name] = last_id
+                if self.is_timed_out():
+                    chunks.close()
+                    break
+
+            for s in table_schemas:
+                complete = not self.is_timed_out() and (not row_limit or fetched_rows.get(s, 0) < int(row_limit))
+                self._update_fingerprint(s, name, complete=complete)
+            self._update_timing(table_schemas, name, time.perf_counter() - start)
+            self._save_progress(downloaded_tables_indexes)
+            if has_data:
+                pkey.append('schema_nm')
+                downloaded_tables[name] = {'columns': col_names, 'pk': pkey}
+            if self.is_timed_out():
+                logging.warning(f'Max exection time of {self.max_runtime_sec}s has been reached. '
+                                f'Terminating. Job will continue next run.')
+                break
+
+        return downloaded_tables, downloaded_tables_indexes
+
+    def _get_table_params(self, table, params):
+        """
+        Parse table configuration.
+
+        :return: name, columns, pkey, incremental_fetch, row_limit, sort_key
+        """
+        incremental_fetch = table.get(KEY_INCREMENTAL_FETCH, True)
+        name = table[KEY_NAME]
+        columns = table[KEY_COLUMNS]
+        pkey = table.get(KEY_PKEY)
+        # copy, the list is extended with schema column per schema
+        pkey = list(pkey) if isinstance(pkey, list) else [pkey]
+        row_limit = None
+        sort_key = dict()
+        if incremental_fetch:
+            row_limit = params.get(KEY_ROW_LIMIT)
+            sort_key = table.get(KEY_SORT_KEY, {KEY_SORTKEY_TYPE: 'numeric', KEY_SORT_KEY_COL: ','.join(pkey)})
+
+        # validate
+        if incremental_fetch and len(pkey) > 1 and not table.get(KEY_SORT_KEY):
+            raise Exception(
+                f'Table "{name}" containing a composite pkey is set to incremental fetch '
+                f'but no sort key is specified! ')
+        if incremental_fetch and self._is_exclusive_boundary() and not pkey[0]:
+            raise Exception(f'Table "{name}" must have a pkey to be fetched with exclusive boundary!')
+        return name, columns, pkey, incremental_fetch, row_limit, sort_key
+
+    def _is_exclusive_boundary(self):
+        return self.cfg_params.get(KEY_BOUNDARY_MODE) == BOUNDARY_EXCLUSIVE
+
+    @staticmethod
+    def _get_key_cols(sort_key, pkey):
+        """
+        Sort key column(s) followed by the remaining pkey columns, i.e. unique ordering key of the table.
+        """
+        return list(dict.fromkeys(Component._get_sort_cols(sort_key) + [c for c in pkey if c]))
+
+    @staticmethod
+    def _get_sort_cols(sort_key):
+        return [c.strip() for c in (sort_key.get(KEY_SORT_KEY_COL) or '').split(',') if c.strip()]
+
+    def _get_incremental_filter(self, sort_key, pkey, last_index):
+        """
+        Translate stored last index into query filter. In the exclusive boundary mode the state holds
+        the full key of the last row [sort key cols..., pkey cols...] and the fetch continues strictly after it.
+        Plain sort key value stored by the inclusive mode is still used as the starting point (>=).
+
+        :return: sort_key_col, since_index, key_cols, after_key
+        """
+        sort_key_col = sort_key.get(KEY_SORT_KEY_COL)
+        if not self._is_exclusive_boundary() or not sort_key_col:
+            return sort_key_col, last_index, None, None
+
+        key_cols = self._get_key_cols(sort_key, pkey)
+        if isinstance(last_index, list):
+            after_key = list(last_index)
+            if sort_key.get(KEY_SORTKEY_TYPE) == 'numeric':
+                # decimals are stored as text, compared as numbers
+                sort_cols = len(self._get_sort_cols(sort_key))
+                after_key[:sort_cols] = [parse_number(v) for v in after_key[:sort_cols]]
+            return key_cols[0], None, key_cols, after_key
+        return key_cols[0], last_index, key_cols, None
+
+    @staticmethod
+    def _get_last_key(rows, col_names, key_cols, description=None):
+        """
+        :param description: cursor description of the rows, values of numeric columns are stored as numbers
+        """
+        last_row = rows[-1]
+        key = []
+        for c in key_cols:
+            i = col_names.index(c)
+            value = to_key_value(last_row[i], description[i][1]) if description else last_row[i]
+            key.append(_to_state_value(value))
+        return key
+
+    @staticmethod
+    def _get_last_keys_by_schema(rows, col_names, key_cols, description=None, last_keys=None):
+        """
+        Last key of each schema in rows tagged with the schema name in the last column - the greatest key
+        returned so far, rows of the UNION ALL branches are not returned in the branch order.
+
+        :param last_keys: dict {schema: key} of the previous chunks of the query, updated in place
+        :return: dict {schema: key} of the schemas in the rows
+        """
+        last_keys = dict() if last_keys is None else last_keys
+        indexes = [col_names.index(c) for c in key_cols]
+        for r in rows:
+            key = [to_key_value(r[i], description[i][1]) if description else r[i] for i in indexes]
+            last = last_keys.get(r[-1])
+            if last is None or key_order(key) > key_order(last):
+                last_keys[r[-1]] = key
+        return {s: [_to_state_value(v) for v in last_keys[s]] for s in dict.fromkeys(r[-1] for r in rows)}
+
+    def _save_progress(self, downloaded_tables_indexes):
+        """
+        Merge indexes of the downloaded tables into the run state and checkpoint it.
+        """
+        with self._merge_lock:
+            for s, indexes in downloaded_tables_indexes.items():
+                for name, last_index in indexes.items():
+                    self._last_indexes.set(s, name, last_index)
+        self._checkpoint()
+
+    def _checkpoint(self):
+        """
+        Write state of the data queued so far, once it is flushed to the output files. At most once per
+        checkpoint interval, skipped if another worker is checkpointing at the moment.
+        """
+        if time.perf_counter() - self._last_checkpoint < self.checkpoint_interval_sec:
+            return
+        if not self._checkpoint_lock.acquire(blocking=False):
+            return
+        try:
+            # indexes are merged after their data is queued, the flush covers all of them and finalizes
+            # parquet slices, so the state never points past rows of an unreadable file
+            with self._merge_lock:
+                state = self._dump_state()
+            self._writer.flush()
+            self.write_state_file(state)
+            self._last_checkpoint = time.perf_counter()
+            logging.debug('State checkpoint stored.')
+        finally:
+            self._checkpoint_lock.release()
+
+    def _dump_state(self):
+        return {'indexes': self._last_indexes.dump(), 'fingerprints': self._fingerprints.dump(),
+                'timings': self._timings.dump(), 'binlog': dict(self._binlog_positions), 'loaded': self._loaded.dump(),
+                'columns': self._column_order}
+
+    def _get_column_order(self, table_names):
+        """
+        Canonical column order of each table - the order of the last run followed by columns not seen before,
+        so the output columns stay in the same order even if the tables differ between schemas or change.
+
+        :return: dict {table: [column names]}
+        """
+        last_order = self.last_state.get('columns') or dict()
+        column_order = {name: list(last_order[name]) for name in table_names if name in last_order}
+        for tables in self._tables_columns.values():
+            for name, columns in tables.items():
+                order = column_order.setdefault(name, [])
+                known = set(order)
+                order.extend(c for c in columns if c not in known)
+        return column_order
+
+    def _get_projection(self, schema, name, columns):
+        """
+        Columns to select from the table of the schema. Tables without explicit columns are selected in the canonical
+        column order, columns missing in the schema are selected as NULL.
+        """
+        schema_columns = self._tables_columns.get(schema, {}).get(name)
+        if columns or not schema_columns:
+            return columns
+        schema_columns = set(schema_columns)
+        quoted = ['`' + c.replace('`', '``') + '`' for c in self._column_order[name]]
+        return [q if c in schema_columns else f'NULL AS {q}' for c, q in zip(self._column_order[name], quoted)]
+
+    def _estimate_cost(self, schema, name, row_limit):
+        """
+        Estimated seconds to download a table: time it took the last run or, for tables not downloaded yet,
+        a guess from the information_schema row count. Tables missing in the schema or skipped as unchanged
+        cost nothing.
+        """
+        metadata = self._tables_metadata.get(schema, {}).get(name)
+        if metadata is None or self._is_loaded(schema, name) or self._is_unchanged(schema, name, metadata):
+            return 0
+        timing = self._timings.get(schema, name)
+        if timing is not None:
+            return timing
+        # text when fetched with raw values
+        table_rows = int(metadata[1] or 0)
+        if row_limit:
+            table_rows = min(table_rows, int(row_limit))
+        return QUERY_COST_SEC + table_rows * ROW_COST_SEC
+
+    def _is_deferred(self, schemas, name, row_limit):
+        """
+        Defer a table to the next run if it is not expected to finish in the remaining runtime, smaller tables
+        are downloaded instead. Tables that would not fit even a whole run are started anyway.
+        """
+        if not self._schedule_by_cost or not schemas:
+            return False
+        cost = sum(self._estimate_cost(s, name, row_limit) for s in schemas)
+        remaining = self.max_runtime_sec - (time.perf_counter() - self.start_time)
+        if remaining < cost <= self.max_runtime_sec:
+            logging.info(f'Table {name} of schemas {", ".join(schemas)} is estimated to take {cost:.1f}s, '
+                         f'{remaining:.1f}s left. Deferring to the next run.')
+            return True
+        return False
+
+    def _update_timing(self, schemas, name, elapsed):
+        """
+        Remember time spent downloading a table, split evenly between schemas downloaded at once.
+        """
+        with self._merge_lock:
+            for s in schemas:
+                self._timings.set(s, name, round(elapsed / len(schemas), 3))
+
+    def _is_table_changed(self, schema, name):
+        """
+        Check table against the metadata pre-pass. Tables missing in the schema are skipped, as well as tables
+        whose fingerprint did not change since they were last downloaded completely and, in binlog mode,
+        tables already loaded.
+        """
+        if self._is_loaded(schema, name):
+            logging.debug(f'Table {schema}.{name} has been loaded, changes are read from the binlog.')
+            return False
+        metadata = self._tables_metadata.get(schema, {}).get(name)
+        if metadata is None:
+            logging.warning(f'Table {name} does not exist in schema {schema}, '
+                            f'skipping!')
+            return False
+        if self._is_unchanged(schema, name, metadata):
+            logging.debug(f'Table {schema}.{name} did not change since the last run, skipping.')
+            # still valid for the next run
+            self._update_fingerprint(schema, name, complete=True)
+            return False
+        return True
+
+    def _is_loaded(self, schema, name):
+        """
+        Table of a schema streamed from the binlog whose initial load has been completed.
+        """
+        return schema in self._streamed_schemas and bool(self._loaded.get(schema, name))
+
+    def _is_unchanged(self, schema, name, metadata):
+        if not self._skip_unchanged:
+            return False
+        fingerprint = self._get_fingerprint(metadata)
+        return fingerprint is not None and fingerprint == self._fingerprints.get(schema, name)
+
+    def _update_fingerprint(self, schema, name, complete):
+        """
+        Remember fingerprint of a table that has been downloaded completely, forget it otherwise so the table
+        is queried again next run. In binlog mode the table is marked as loaded once complete.
+        """
+        fingerprint = self._get_fingerprint(self._tables_metadata[schema][name]) if complete else None
+        with self._merge_lock:
+            self._fingerprints.set(schema, name, fingerprint)
+            if complete and self._binlog_mode:
+                self._loaded.set(schema, name, 1)
+
+    @staticmethod
+    def _get_fingerprint(metadata):
+        """
+        Compact fingerprint of table metadata, None if the table can't be fingerprinted reliably: UPDATE_TIME
+        unknown (e.g. InnoDB after restart) or in the second of the check, so a later change within the same
+        second would not change it.
+        """
+        update_time, table_rows, auto_increment, checked_at = metadata
+        if update_time is None or str(update_time)[:19] >= str(checked_at)[:19]:
+            return None
+        value = f'{update_time}|{table_rows}|{auto_increment}'
+        return hashlib.blake2b(value.encode('utf-8'), digest_size=8).hexdigest()
+
     def get_table_data_chunks(self, name, schema, columns, pkey, row_limit, last_index, sort_key, downloaded_tables,
-                              downloaded_tables_indexes, client):
+                              downloaded_tables_indexes, client, page_size=None, incomplete=None):
         """
-        Download tables using sccursor (in chunks)
+        Download tables using sscursor (in chunks) or in separate page queries if page_size is set
         :param name:
         :param schema:
         :param columns:
@@ -194,147 +1151,299 @@ class Component(KBCEnvHandler):
         :param downloaded_tables:
         :param downloaded_tables_indexes:
         :param client:
+        :param page_size: max rows per page query, single streamed query if not set
+        :param incomplete: optional set, schema is added if the row limit or timeout was reached and rows may remain
         :return:
         """
         has_data = False
+        fetched = 0
         col_names = []
-        for data, col_names, last_id in client.get_table_data_chunks(name, schema, columns=columns,
-                                                                     row_limit=row_limit, since_index=last_index,
-                                                                     sort_key_col=sort_key.get(KEY_SORT_KEY_COL),
-                                                                     sort_key_type=sort_key.get(KEY_SORTKEY_TYPE)):
+        sort_key_col, since_index, key_cols, after_key = self._get_incremental_filter(sort_key, pkey, last_index)
+        if page_size:
+            # sort key followed by pkey columns to make the paging key unique
+            key_cols = key_cols or self._get_key_cols(sort_key, pkey)
+            chunks = client.get_table_data_pages(name, schema, columns=columns, row_limit=row_limit,
+                                                 since_index=since_index, sort_key_col=sort_key_col,
+                                                 sort_key_type=sort_key.get(KEY_SORTKEY_TYPE), page_size=page_size,
+                                                 key_cols=key_cols, after_key=after_key)
+        else:
+            chunks = client.get_table_data_chunks(name, schema, columns=columns, row_limit=row_limit,
+                                                  since_index=since_index, sort_key_col=sort_key_col,
+                                                  sort_key_type=sort_key.get(KEY_SORTKEY_TYPE),
+                                                  key_cols=key_cols, after_key=after_key)
+        for data, col_names, last_id in chunks:
 
             if data:
                 has_data = True
+                fetched += len(data)
                 col_names = col_names
-                self.store_table_data(data, name, schema)
+                self.store_table_data(data, name, schema, description=client.description)
+                if self._is_exclusive_boundary() and sort_key_col:
+                    last_id = self._get_last_key(data, col_names, key_cols, client.description)
+            if self.is_timed_out():
+                # stop at the last written chunk, the table continues from it next run
+                chunks.close()
+                break
 
+        if incomplete is not None and (self.is_timed_out() or row_limit and fetched >= int(row_limit)):
+            incomplete.add(schema)
         if has_data:
             # append schema col
             col_names.append('schema_nm')
             pkey.append('schema_nm')
             downloaded_tables[name] = {'columns': col_names, 'pk': pkey}
-            downloaded_tables_indexes[schema] = {**downloaded_tables_indexes.get(schema, dict()), **{name: last_id}}
+            downloaded_tables_indexes.setdefault(schema, dict())[name] = last_id
 
         return downloaded_tables, downloaded_tables_indexes
 
-    def get_table_data(self, name, schema, columns, pkey, row_limit, last_index, sort_key, downloaded_tables,
-                       downloaded_tables_indexes, client):
-        data, col_names, last_id = client.get_table_data_buffered(name, schema, columns=columns,
-                                                                  row_limit=row_limit, since_index=last_index,
-                                                                  sort_key_col=sort_key.get(KEY_SORT_KEY_COL),
-                                                                  sort_key_type=sort_key.get(KEY_SORTKEY_TYPE))
+    def get_table_data_ranges(self, name, schema, columns, pkey, row_limit, last_index, sort_key, downloaded_tables,
+                              downloaded_tables_indexes, client, parallel_ranges, page_size=0, incomplete=None):
+        """
+        Split numeric sort key into ranges and read them concurrently, each on its own connection and into its own
+        output slice. Ranges are read on the current connection plus any connection that is idle in the pool.
 
-        if data:
-            # append schema col
+        The stored index is the progress of the leading ranges that were read completely, so the ranges that
+        did not finish (timeout, row limit) are continued next run. With row_limit the ranges split the first
+        row_limit rows, the last range reads the rest of the limit.
+
+        :param incomplete: optional set, schema is added if any of the ranges did not finish
+        """
+        sort_key_col, since_index, key_cols, after_key = self._get_incremental_filter(sort_key, pkey, last_index)
+        sort_key_type = sort_key.get(KEY_SORTKEY_TYPE)
+        lower = since_index if after_key is None else after_key[0]
+        row_limit = int(row_limit) if row_limit else None
+        # the bounded ranges hold less than row_limit rows, so they finish and the state advances past them
+        min_val, max_val = client.get_sort_key_range(name, schema, sort_key_col, sort_key_type, lower,
+                                                     row_limit=row_limit)
+        if min_val is None:
+            return downloaded_tables, downloaded_tables_indexes
+
+        split_points = self._get_split_points(min_val, max_val, parallel_ranges)
+        # first range keeps the original filter, the last one is not bounded to include rows added meanwhile
+        last_limit = -(-row_limit // (len(split_points) + 1)) if row_limit else None
+        ranges = []
+        for i in range(len(split_points) + 1):
+            bounded = i < len(split_points)
+            ranges.append({'part': f'r{i:03d}',
+                           'since_index': since_index if i == 0 else split_points[i - 1],
+                           'after_key': after_key if i == 0 else None,
+                           'before_index': split_points[i] if bounded else None,
+                           'limit': row_limit if bounded else last_limit,
+                           'last': None, 'finished': False, 'col_names': None})
+        logging.info(f'Downloading {schema}.{name} in {len(ranges)} sort key ranges.')
+
+        range_queue = queue.Queue()
+        for r in ranges:
+            range_queue.put(r)
+
+        def read_ranges(cl):
+            while not self.is_timed_out():
+                try:
+                    r = range_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._read_range(r, name, schema, columns, pkey, r['limit'], sort_key, cl, page_size)
+
+        helpers = []
+        for _ in range(len(ranges) - 1):
+            helper_client = self._schema_pools[schema].acquire(block=False)
+            if helper_client is None:
+                break
+            helpers.append(helper_client)
+        try:
+            with ThreadPoolExecutor(max_workers=len(helpers) + 1) as executor:
+                futures = [executor.submit(self._profiler.wrap(read_ranges), c) for c in helpers + [client]]
+                for f in futures:
+                    f.result()
+        finally:
+            for c in helpers:
+                self._schema_pools[schema].release(c)
+
+        last_id, complete = self._get_ranges_progress(ranges, last_index)
+        if incomplete is not None and not complete:
+            incomplete.add(schema)
+        col_names = next((r['col_names'] for r in ranges if r['col_names']), None)
+        if col_names:
             col_names.append('schema_nm')
             pkey.append('schema_nm')
-            self.store_table_data(data, name, schema)
             downloaded_tables[name] = {'columns': col_names, 'pk': pkey}
-            downloaded_tables_indexes[schema] = {**downloaded_tables_indexes.get(schema, dict()), **{name: last_id}}
-
+            downloaded_tables_indexes.setdefault(schema, dict())[name] = last_id
         return downloaded_tables, downloaded_tables_indexes
 
-    def download_table_row_counts(self, schema, params, table_indexes, client):
+    @staticmethod
+    def _get_ranges_progress(ranges, last_index):
+        """
+        Index to continue from next run - progress of the leading ranges read completely and of the first range
+        that did not finish, the ranges after it are read again.
+
+        :return: (last_id, complete) - complete if all the ranges finished
+        """
+        last_id = last_index
+        for r in ranges:
+            if r['last'] is not None:
+                last_id = r['last']
+            if not r['finished']:
+                return last_id, False
+        return last_id, True
+
+    def _read_range(self, key_range, name, schema, columns, pkey, row_limit, sort_key, client, page_size):
+        """
+        Read single sort key range into its own output part, recording the progress in the range dict.
         """
-        Get count of rows until provided last index
+        sort_key_col, _, key_cols, _ = self._get_incremental_filter(sort_key, pkey, None)
+        if page_size:
+            key_cols = key_cols or self._get_key_cols(sort_key, pkey)
+            chunks = client.get_table_data_pages(name, schema, columns=columns, row_limit=row_limit,
+                                                 since_index=key_range['since_index'], sort_key_col=sort_key_col,
+                                                 sort_key_type=sort_key.get(KEY_SORTKEY_TYPE),
+                                                 page_size=page_size, key_cols=key_cols,
+                                                 after_key=key_range['after_key'],
+                                                 before_index=key_range['before_index'])
+        else:
+            chunks = client.get_table_data_chunks(name, schema, columns=columns, row_limit=row_limit,
+                                                  since_index=key_range['since_index'], sort_key_col=sort_key_col,
+                                                  sort_key_type=sort_key.get(KEY_SORTKEY_TYPE), key_cols=key_cols,
+                                                  after_key=key_range['after_key'],
+                                                  before_index=key_range['before_index'])
+        fetched = 0
+        for data, col_names, last_id in chunks:
+            self._writer.write(name, data, suffix=self._get_row_suffix(schema), part=key_range['part'],
+                               description=client.description)
+            fetched += len(data)
+            key_range['col_names'] = col_names
+            if self._is_exclusive_boundary():
+                key_range['last'] = self._get_last_key(data, col_names, key_cols, client.description)
+            else:
+                key_range['last'] = last_id
+            if self.is_timed_out():
+                # leave the range unfinished, it continues next run
+                chunks.close()
+                return
+        key_range['finished'] = not row_limit or fetched < row_limit
+
+    @staticmethod
+    def _get_split_points(min_val, max_val, parts):
+        """
+        Split numeric interval into parts of equal width.
+
+        :return: ascending list of at most parts - 1 inner boundaries
+        """
+        low, high = Decimal(str(min_val)), Decimal(str(max_val))
+        integral = low == low.to_integral_value() and high == high.to_integral_value()
+        points = []
+        for i in range(1, parts):
+            p = low + (high - low) * i / parts
+            p = int(p) if integral else p
+            if p > low and (not points or p > points[-1]):
+                points.append(p)
+        return points
+
+    def queue_table_row_counts(self, schema, params, table_indexes):
+        """
+        Queue count of rows until the last index of each table of the schema downloaded by this run. Tables with
+        at least validation_estimate_min_rows rows get the information_schema estimate instead.
         :param schema:
         :param params:
-        :param table_indexes:
-        :param client: MySQL client instance
+        :param table_indexes: indexes of the tables that returned rows in this run
         :return:
         """
-        cl = client
-        downloaded_tables = {}
-        # downloaded_tables_indexes = dict()
+        estimate_min_rows = params.get(KEY_VALIDATION_ESTIMATE_MIN_ROWS)
+        estimates = []
         for t in params[KEY_TABLES]:
             name = t[KEY_NAME]
-            if name not in table_indexes.get(schema, {}).keys():
+            # tables skipped (missing, unchanged, deferred) keep their stored index, they are not counted
+            if name not in table_indexes.get(schema, {}) or name not in self._tables_metadata.get(schema, {}):
                 continue
             last_index = table_indexes[schema][name]
-            logging.debug(f"Downloading row count of table '{name}' from schema '{schema}''.")
+            if isinstance(last_index, list):
+                # exclusive boundary key, count up to its sort key value
+                last_index = last_index[0]
             pkey = t.get(KEY_PKEY)
             if not isinstance(pkey, list):
                 pkey = [pkey]
             sort_key = t.get(KEY_SORT_KEY, {KEY_SORTKEY_TYPE: 'numeric', KEY_SORT_KEY_COL: ','.join(pkey)})
-            data, col_names = cl.get_table_row_count(name, schema, last_index,
-                                                     sort_key.get(KEY_SORT_KEY_COL),
-                                                     sort_key.get(KEY_SORTKEY_TYPE))
+            sort_key_col = self._get_key_cols(sort_key, [])[0]
 
-            if data:
-                # append schema col
-                col_names.append('table')
-                self.store_table_count_data(data, name, schema)
-                downloaded_tables['row_counts'] = {'columns': col_names, 'pk': ['table']}
-            if self.is_timed_out():
-                logging.warning(f'Max exection time of {self.max_runtime_sec}s has been reached. '
-                                f'Terminating. Job will continue next run.')
-                break
+            table_rows = self._tables_metadata.get(schema, {}).get(name, (None, None))[1]
+            if estimate_min_rows and table_rows is not None and int(table_rows) >= int(estimate_min_rows):
+                estimates.append((table_rows, str(last_index), sort_key_col, f'{schema}.{name}', 1))
+            else:
+                # counted on the host of the schema
+                self._row_count_queues[self._schema_pools[schema]].put((schema, name, last_index, sort_key_col,
+                                                                        sort_key.get(KEY_SORTKEY_TYPE)))
+        if estimates:
+            self.store_table_count_data(estimates)
 
-        return downloaded_tables
+    def download_table_row_counts(self, tables, client):
+        """
+        Get count of rows until provided last index of several tables with a single query
+        :param tables: list of (schema, table_name, last_index, sort_key_col, sort_key_type) tuples
+        :param client: MySQL client instance
+        :return:
+        """
+        logging.debug(f'Downloading row counts of {len(tables)} tables.')
+        data, col_names = client.get_table_row_counts(tables)
+        if data:
+            self.store_table_count_data(data)
 
-    def store_table_count_data(self, data, name, schema):
-        folder_path = os.path.join(self.tables_out_path, 'row_counts')
-        if not os.path.exists(folder_path):
-            os.mkdir(folder_path)
+    def store_table_count_data(self, data):
+        self._writer.write('row_counts', data, description=[(c,) for c in ROW_COUNT_COLUMNS])
+        with self._merge_lock:
+            self._res_tables['row_counts'] = {'columns': list(ROW_COUNT_COLUMNS), 'pk': ['table']}
 
-        file_path = os.path.join(folder_path, 'row_counts' + '.csv')
+    def store_table_data(self, data, name, schema=None, description=None):
+        """
+        Queue chunk for writing, rows get schema name appended unless it is already present (schema=None).
 
-        # append if exists
-        if self._res_file_cache.get(file_path):
-            out_file = self._res_file_cache.get(file_path)
-        else:
-            out_file = open(file_path, 'w+', encoding='utf-8', newline='')
-            self._res_file_cache[file_path] = out_file
-
-        writer = csv.writer(out_file)
-        for r in data:
-            # append schema name
-            r = list(r)
-            r.append(f'{schema}.{name}')
-            writer.writerow(r)
-
-    def store_table_data(self, data, name, schema):
-        folder_path = os.path.join(self.tables_out_path, name)
-        if not os.path.exists(folder_path):
-            os.mkdir(folder_path)
-
-        file_path = os.path.join(folder_path, name + '.csv')
-
-        # append if exists
-        if self._res_file_cache.get(file_path):
-            out_file = self._res_file_cache.get(file_path)
-        else:
-            out_file = open(file_path, 'w+', encoding='utf-8', newline='')
-            self._res_file_cache[file_path] = out_file
+        :param description: cursor description of the rows, column types of the parquet output
+        """
+        self._writer.write(name, data, suffix=self._get_row_suffix(schema), description=description)
 
-        writer = csv.writer(out_file)
-        for r in data:
-            # append schema name
-            r = list(r)
-            r.append(schema)
-            writer.writerow(r)
+    def _get_row_suffix(self, schema):
+        """
+        Values appended to the fetched rows - schema name and, in binlog mode, the deleted marker.
+        """
+        if schema is None or not self._binlog_mode:
+            return schema
+        return schema, 0
+
+    def _get_files_out_folder(self):
+        if not os.path.exists(self.files_out_path):
+            os.makedirs(self.files_out_path)
+        return self.files_out_path
 
     def is_timed_out(self):
         elapsed = time.perf_counter() - self.start_time
         return elapsed >= self.max_runtime_sec
 
     def get_last_state(self):
-        last_state = self.last_state
-        if not last_state.get('data'):
-            return dict()
-        else:
-            # unzip
-            val = gzip.decompress(base64.b64decode(last_state['data'].encode('utf-8'))).decode()
-            return json.loads(val)
+        """
+        Last indexes of the tables, state stored by the previous versions under the 'data' key is loaded as well.
+        """
+        return StateStore.load(self.last_state.get('indexes') or self.last_state.get('data'))
 
     def _close_res_stream(self):
         """
-        Close all output streams / files. Has to be called at end of extraction, before result processing.
+        Write remaining data and close all output streams / files. Has to be called at end of extraction,
+        before result processing.
 
         :return:
         """
-        for res in self._res_file_cache:
-            self._res_file_cache[res].close()
+        self._writer.close()
+
+
+def _to_state_value(value):
+    """
+    JSON serializable representation of a key value, numbers are kept to be compared as numbers. Integral decimals
+    are stored as integers, the others as text.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, Decimal) and value == value.to_integral_value():
+        return int(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
 
 
 """
@@ -0,0 +1,142 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+
+PROFILE_CPU = 'cpu'
+PROFILE_MEMORY = 'memory'
+PROFILE_ALL = 'all'
+
+# summed, except the peak_ values which keep the maximum
+METRIC_FIELDS = ['queries', 'rows', 'bytes', 'query_sec', 'first_row_sec', 'fetch_sec', 'encode_sec', 'write_sec',
+                 'peak_chunk_bytes']
+PROFILE_TOP_ENTRIES = 50
+
+
+class TableMetrics:
+
+    def __init__(self):
+        """
+        Thread safe collector of performance metrics per schema and table. Query latency, time to first row and
+        fetch time are recorded by Client, encode and write time by OutputWriter.
+        """
+        self._tables = dict()
+        self._lock = threading.Lock()
+
+    def add(self, schema, table, **values):
+        with self._lock:
+            metrics = self._tables.setdefault((schema or '', table), dict.fromkeys(METRIC_FIELDS, 0))
+            for key, value in values.items():
+                if key.startswith('peak_'):
+                    metrics[key] = max(metrics[key], value)
+                else:
+                    metrics[key] += value
+
+    def get_rows(self):
+        with self._lock:
+            return [{'schema': schema, 'table': table, **{k: round(v, 6) for k, v in metrics.items()}}
+                    for (schema, table), metrics in sorted(self._tables.items())]
+
+    def get_totals(self):
+        totals = dict.fromkeys(METRIC_FIELDS, 0)
+        for row in self.get_rows():
+            for key in METRIC_FIELDS:
+                totals[key] = max(totals[key], row[key]) if key.startswith('peak_') else totals[key] + row[key]
+        return totals
+
+    def write_json(self, file_path):
+        with open(file_path, 'w') as out:
+            json.dump({'totals': self.get_totals(), 'tables': self.get_rows()}, out, indent=2)
+
+    def log_summary(self):
+        t = self.get_totals()
+        logging.info(f'Fetched {t["rows"]} rows (~{t["bytes"] / 1024 / 1024:.1f} MB) in {t["queries"]} queries. '
+                     f'Query latency {t["query_sec"]:.1f}s, time to first row {t["first_row_sec"]:.1f}s, '
+                     f'fetch {t["fetch_sec"]:.1f}s, CSV encoding {t["encode_sec"]:.1f}s, write {t["write_sec"]:.1f}s '
+                     f'(summed over threads).')
+
+
+class Profiler:
+
+    def __init__(self, mode=None):
+        """
+        Optional cProfile and tracemalloc hook. CPU profile covers the thread entering the profiler and the threads
+        running functions wrapped by wrap().
+
+        :param mode: 'cpu', 'memory', 'all' or None to disable
+        """
+        self.cpu = mode in (PROFILE_CPU, PROFILE_ALL)
+        self.memory = mode in (PROFILE_MEMORY, PROFILE_ALL)
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._memory_snapshot = None
+        self._memory_peak = 0
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self._main = self._start_cpu()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_cpu(self._main)
+        if self.memory:
+            self._memory_snapshot = tracemalloc.take_snapshot()
+            self._memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def wrap(self, func):
+        """
+        Profile func when run in a worker thread.
+        """
+        if not self.cpu:
+            return func
+
+        def profiled(*args, **kwargs):
+            profile = self._start_cpu()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._stop_cpu(profile)
+        return profiled
+
+    def write_reports(self, folder_path):
+        """
+        Write collected profiles to the folder.
+
+        :return: list of written file paths
+        """
+        files = []
+        if self._profiles:
+            stats = pstats.Stats(*self._profiles)
+            stats.dump_stats(os.path.join(folder_path, 'profile_cpu.prof'))
+            out = io.StringIO()
+            pstats.Stats(*self._profiles, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP_ENTRIES)
+            with open(os.path.join(folder_path, 'profile_cpu.txt'), 'w') as f:
+                f.write(out.getvalue())
+            files += [os.path.join(folder_path, 'profile_cpu.prof'), os.path.join(folder_path, 'profile_cpu.txt')]
+        if self._memory_snapshot:
+            with open(os.path.join(folder_path, 'profile_memory.txt'), 'w') as f:
+                f.write(f'Peak traced memory: {self._memory_peak / 1024 / 1024:.1f} MB\n\n')
+                for stat in self._memory_snapshot.statistics('lineno')[:PROFILE_TOP_ENTRIES]:
+                    f.write(f'{stat}\n')
+            files.append(os.path.join(folder_path, 'profile_memory.txt'))
+        return files
+
+    def _start_cpu(self):
+        if not self.cpu:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def _stop_cpu(self, profile):
+        if profile is None:
+            return
+        profile.disable()
+        with self._lock:
+            self._profiles.append(profile)
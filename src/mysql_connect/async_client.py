@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import pymysql
+
+from mysql_connect.client import ChunkSizer, ClientError, DEFAULT_CHUNK_MEMORY_MB, MAX_RETRIES, MISSING_TABLE_CODE, \
+    RETRY_CODES, build_row_count_query, build_select_query
+from mysql_connect.drivers import RAW_CONVERSIONS
+
+
+class AsyncClientPool:
+
+    def __init__(self, host, port, user, password, max_size=1, **client_kwargs):
+        """
+        Connection pool of the async engine. Queries of many schemas are multiplexed on a single event loop, at most
+        max_size of them run at once, each on its own connection.
+
+        Requires the optional aiomysql package.
+
+        :param client_kwargs: additional AsyncClient parameters
+        """
+        self._conn_args = {'host': host, 'port': int(port), 'user': user, 'password': password}
+        self._client_kwargs = client_kwargs
+        self.max_size = max(1, int(max_size))
+        self.cursor_class = None
+        self._pool = None
+        self._semaphore = None
+
+    async def open(self):
+        try:
+            import aiomysql
+        except ImportError as e:
+            raise ClientError('Async engine requires the aiomysql package (pip install aiomysql)!') from e
+        if self._client_kwargs.get('raw_values'):
+            self._conn_args['conv'] = RAW_CONVERSIONS
+        # bound to the running loop
+        self._semaphore = asyncio.Semaphore(self.max_size)
+        self.cursor_class = aiomysql.SSCursor
+        self._pool = await aiomysql.create_pool(minsize=0, maxsize=self.max_size, **self._conn_args)
+        return self
+
+    def client(self):
+        """
+        New client of the pool, one per concurrent task.
+        """
+        return AsyncClient(self, **self._client_kwargs)
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Borrow a connection, waits while max_size queries are running. Closed connections are dropped on release.
+        """
+        async with self._semaphore:
+            conn = await self._pool.acquire()
+            try:
+                yield conn
+            finally:
+                self._pool.release(conn)
+
+    async def close_all(self):
+        if self._pool:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+
+class AsyncClient:
+
+    def __init__(self, pool, chunk_memory_mb=DEFAULT_CHUNK_MEMORY_MB, raw_values=False, metrics=None):
+        """
+        Async counterpart of Client, each query borrows a connection of the shared AsyncClientPool. A client is used
+        by a single task at a time (description of the last fetched chunk).
+
+        :param raw_values: skip conversion of values to python types, see Client
+        :param metrics: optional TableMetrics collecting timing of the data queries
+        """
+        self.pool = pool
+        self.chunk_memory_bytes = int(float(chunk_memory_mb) * 1024 * 1024)
+        self.raw_values = raw_values
+        self.metrics = metrics
+        # cursor description of the last fetched chunk, column types of the typed output
+        self.description = None
+
+    async def get_table_data_chunks(self, table_name, schema, columns=None, row_limit=None, since_index=None,
+                                    sort_key_col=None, sort_key_type=None, key_cols=None, after_key=None,
+                                    before_index=None):
+        """
+        :return: async generator of (rows, col_names, last_id) chunks, no chunks if the table does not exist
+        """
+        async with self.pool.connection() as conn:
+            sql = build_select_query(conn.escape, columns, sort_key_col, sort_key_type, since_index, row_limit, schema,
+                                     table_name, key_cols=key_cols, after_key=after_key, before_index=before_index)
+            col_names = None
+            stream = self.__stream_query(conn, sql, table_name, schema)
+            try:
+                async for rows, description in stream:
+                    if col_names is None:
+                        col_names = [i[0] for i in description]
+                    last_id = rows[-1][col_names.index(sort_key_col)] if sort_key_col else None
+                    yield rows, list(col_names), str(last_id)
+            finally:
+                # abandoned result closes the connection before it is released
+                await stream.aclose()
+
+    async def get_table_row_counts(self, tables):
+        """
+        Count rows of several tables up to their last index with a single UNION ALL query, tables that do not
+        exist are skipped (see Client.get_table_row_counts).
+
+        :param tables: list of (schema, table_name, last_index, sort_key_col, sort_key_type) tuples
+        :return: rows (cnt, last_index, sort_key_col, table, is_estimate), col_names
+        """
+        try:
+            rows, description = await self.__fetch_all(build_row_count_query(tables))
+        except ClientError as e:
+            if not (isinstance(e.__cause__, pymysql.Error) and e.__cause__.args[0] == MISSING_TABLE_CODE):
+                raise
+            if len(tables) == 1:
+                schema, table_name = tables[0][:2]
+                logging.warning(f'Table {table_name} does not exist in schema {schema}, skipping its row count!')
+                return [], []
+            logging.debug(f'Some of the {len(tables)} counted tables do not exist, counting separately.')
+            rows = []
+            col_names = []
+            for t in tables:
+                table_rows, table_col_names = await self.get_table_row_counts([t])
+                rows.extend(table_rows)
+                col_names = table_col_names or col_names
+            return rows, col_names
+        return rows, [i[0] for i in description]
+
+    async def __stream_query(self, conn, sql, table_name, schema):
+        """
+        Execute query with unbuffered cursor and fetch the result in chunks sized by the memory budget.
+
+        :return: async generator of (rows, cursor description) chunks
+        """
+        start = time.perf_counter()
+        try:
+            if logging.DEBUG == logging.root.level:
+                logging.debug(f'Executing query: {sql}')
+            cur = await self.__try_execute(conn, sql, buffered=False)
+        except pymysql.Error as e:
+            conn.close()
+            if e.args[0] == MISSING_TABLE_CODE:
+                logging.warning(f'Table {table_name} does not exist in schema {schema}, skipping!')
+                return
+            raise ClientError(f'Failed to execute query {sql}!') from e
+
+        query_sec = time.perf_counter() - start
+        first_row_sec = 0
+        fetch_sec = 0
+        fetched_rows = 0
+        fetched_bytes = 0
+        peak_chunk_bytes = 0
+        sizer = ChunkSizer(self.chunk_memory_bytes)
+        try:
+            while True:
+                fetch_start = time.perf_counter()
+                rows = await cur.fetchmany(sizer.size)
+                fetch_sec += time.perf_counter() - fetch_start
+                if not rows:
+                    break
+                if not fetched_rows:
+                    first_row_sec = time.perf_counter() - start
+                sizer.observe(rows)
+                fetched_rows += len(rows)
+                fetched_bytes += sizer.chunk_bytes
+                peak_chunk_bytes = max(peak_chunk_bytes, sizer.chunk_bytes)
+                self.description = cur.description
+                yield rows, cur.description
+        except (GeneratorExit, asyncio.CancelledError):
+            # the caller stopped reading (timeout, failure), closing the connection is faster than reading the rest
+            conn.close()
+            raise
+        except pymysql.Error as e:
+            conn.close()
+            raise ClientError(f'Failed to fetch result of query {sql}!') from e
+        finally:
+            if self.metrics:
+                self.metrics.add(schema, table_name, queries=1, rows=fetched_rows, bytes=int(fetched_bytes),
+                                 query_sec=query_sec, first_row_sec=first_row_sec, fetch_sec=fetch_sec,
+                                 peak_chunk_bytes=int(peak_chunk_bytes))
+
+    async def __fetch_all(self, sql):
+        async with self.pool.connection() as conn:
+            try:
+                cur = await self.__try_execute(conn, sql)
+                rows = await cur.fetchall()
+            except pymysql.Error as e:
+                conn.close()
+                raise ClientError(f'Failed to execute query {sql}! {e}') from e
+            description = cur.description
+            await cur.close()
+        return rows, description
+
+    async def __try_execute(self, conn, query, buffered=True):
+        retries = 1
+        while True:
+            cursor = await conn.cursor() if buffered else await conn.cursor(self.pool.cursor_class)
+            try:
+                await cursor.execute(query)
+                return cursor
+            except pymysql.Error as e:
+                if e.args[0] not in RETRY_CODES or retries > MAX_RETRIES:
+                    raise
+                logging.warning(f'Query failed retrying {retries}x')
+                await asyncio.sleep(2 ** retries)
+                retries += 1
+                # reconnects the closed connection
+                conn.close()
+                await conn.ping(reconnect=True)
@@ -0,0 +1,123 @@
+import json
+
+from mysql_connect.client import ClientError
+
+EVENT_WRITE = 'write'
+EVENT_UPDATE = 'update'
+EVENT_DELETE = 'delete'
+# end of a transaction, the only position it is safe to continue from
+EVENT_COMMIT = 'commit'
+
+
+class BinlogReader:
+
+    def __init__(self, host, port, user, password, server_id, schemas, tables, log_file=None, log_pos=None,
+                 capture_path=None):
+        """
+        Reads row events of the tables from the binlog of a server (requires binlog_format=ROW and
+        binlog_row_image=FULL, binlog_row_metadata=FULL for the column names on MySQL 8), starting at the position
+        and ending once all the events written so far are read.
+
+        Requires the optional python-mysql-replication package.
+
+        :param server_id: replica server id, unique among the replicas of the server
+        :param schemas: schemas to read the events of
+        :param tables: table names to read the events of
+        :param capture_path: optional JSONL file the events are appended to, to be replayed by BinlogFileReader
+        """
+        self._connection_settings = {'host': host, 'port': int(port), 'user': user, 'passwd': password}
+        self.server_id = int(server_id)
+        self.schemas = list(schemas)
+        self.tables = list(tables)
+        self.log_file = log_file
+        self.log_pos = log_pos
+        self.capture_path = capture_path
+        self._stream = None
+
+    def read(self):
+        """
+        :return: generator of event dicts {type, schema, table, rows, log_file, log_pos}, rows are lists of
+        column value dicts - values after the change, values before the change for deletes. Commit events have
+        neither schema, table nor rows.
+        """
+        try:
+            from pymysqlreplication import BinLogStreamReader
+            from pymysqlreplication.event import XidEvent
+            from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+        except ImportError as e:
+            raise ClientError('Binlog mode requires the python-mysql-replication package '
+                              '(pip install mysql-replication)!') from e
+
+        self._stream = BinLogStreamReader(connection_settings=self._connection_settings, server_id=self.server_id,
+                                          only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent],
+                                          only_schemas=self.schemas, only_tables=self.tables,
+                                          log_file=self.log_file, log_pos=self.log_pos, resume_stream=True,
+                                          blocking=False)
+        capture = open(self.capture_path, 'a') if self.capture_path else None
+        try:
+            for binlog_event in self._stream:
+                if isinstance(binlog_event, XidEvent):
+                    event = {'type': EVENT_COMMIT}
+                elif isinstance(binlog_event, UpdateRowsEvent):
+                    event = {'type': EVENT_UPDATE, 'rows': [r['after_values'] for r in binlog_event.rows]}
+                else:
+                    event = {'type': EVENT_WRITE if isinstance(binlog_event, WriteRowsEvent) else EVENT_DELETE,
+                             'rows': [r['values'] for r in binlog_event.rows]}
+                if event['type'] != EVENT_COMMIT:
+                    event['schema'] = binlog_event.schema
+                    event['table'] = binlog_event.table
+                event['log_file'] = self._stream.log_file
+                event['log_pos'] = self._stream.log_pos
+                if capture:
+                    capture.write(json.dumps(event, default=_to_json_value) + '\n')
+                yield event
+        finally:
+            if capture:
+                capture.close()
+            self.close()
+
+    def close(self):
+        if self._stream:
+            self._stream.close()
+            self._stream = None
+
+
+class BinlogFileReader:
+
+    def __init__(self, path, schemas, tables, log_file=None, log_pos=None):
+        """
+        Replays events captured by BinlogReader from a local JSONL file, events up to the position are skipped.
+        Values are replayed as captured - numbers as numbers, other types as text.
+        """
+        self.path = path
+        self.schemas = set(schemas)
+        self.tables = set(tables)
+        self.log_file = log_file
+        self.log_pos = log_pos
+
+    def read(self):
+        with open(self.path) as capture:
+            for line in capture:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if self.log_file and (event['log_file'], event['log_pos']) <= (self.log_file, self.log_pos):
+                    continue
+                if event['type'] != EVENT_COMMIT and (event['schema'] not in self.schemas
+                                                      or event['table'] not in self.tables):
+                    continue
+                yield event
+
+    def close(self):
+        """
+        Nothing to release, the file is closed once read.
+        """
+
+
+def _to_json_value(value):
+    """
+    Dates, decimals, sets, ... are captured as text.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
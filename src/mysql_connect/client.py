@@ -1,16 +1,33 @@
 import logging
+import sys
 import time
+from decimal import Decimal, InvalidOperation
 
-import pymysql
 import regex
+from pymysql.constants import FIELD_TYPE
+
+from mysql_connect.drivers import DRIVER_PYMYSQL, get_driver
 
 MAX_CHUNK_SIZE = 500000
+# rows fetched before the row width is known, small so that even wide rows stay within the budget
+INITIAL_CHUNK_SIZE = 10
+# rows sampled from each chunk to estimate the row width
+ROW_SIZE_SAMPLE = 100
+# memory budget of a single fetched chunk
+DEFAULT_CHUNK_MEMORY_MB = 256
 
 READ_TIMEOUT = 1800
 
 MAX_RETRIES = 2
 
 RETRY_CODES = [2013]
+# table dropped after the metadata pre-pass, skipped like tables missing in the metadata
+MISSING_TABLE_CODE = 1146
+
+# key values of these column types are kept numbers, see to_key_value
+INTEGER_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24,
+                 FIELD_TYPE.YEAR}
+DECIMAL_TYPES = {FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
 
 
 class ClientError(Exception):
@@ -19,19 +36,71 @@ class ClientError(Exception):
     """
 
 
+class ChunkSizer:
+
+    def __init__(self, memory_budget_bytes, max_size=MAX_CHUNK_SIZE):
+        """
+        Derives number of rows fetched at once from the memory budget and the row width observed so far. The first
+        chunk is a small probe of the row width.
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_size = max_size
+        self.size = min(INITIAL_CHUNK_SIZE, max_size)
+        self.row_size = None
+        self.chunk_bytes = 0
+
+    def observe(self, rows):
+        row_size = self.estimate_row_size(rows)
+        # wider rows shrink the chunk immediately, narrower ones only once they prevail
+        self.row_size = row_size if self.row_size is None else max(row_size, (self.row_size + row_size) / 2)
+        self.chunk_bytes = row_size * len(rows)
+        self.size = int(max(1, min(self.max_size, self.memory_budget_bytes // self.row_size)))
+
+    @staticmethod
+    def estimate_row_size(rows):
+        """
+        Approximate in-memory size of a fetched row in bytes, based on a sample of the rows.
+        """
+        step = max(1, len(rows) // ROW_SIZE_SAMPLE)
+        sample = rows[::step]
+        total = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in sample)
+        return max(1, total / len(sample))
+
+
 class Client:
 
-    def __init__(self, host, port, user, password):
-        """Creates a mysql client and initiates connection"""
-        db_opts = {
+    def __init__(self, host, port, user, password, chunk_memory_mb=DEFAULT_CHUNK_MEMORY_MB, raw_values=False,
+                 metrics=None, throttle=None, driver=DRIVER_PYMYSQL, compress=False):
+        """
+        Creates a mysql client and initiates connection
+
+        :param raw_values: skip conversion of values to python types, values are returned as text
+        (bytes for binary columns) exactly as sent by the server. Fast path for extraction to CSV.
+        :param metrics: optional TableMetrics collecting timing of the data queries
+        :param throttle: optional Throttle limiting the data queries and page size by the server load
+        :param driver: pymysql (pure python) or mysqlclient (C extension), see drivers
+        :param compress: use the compressed protocol, mysqlclient driver only
+        """
+        try:
+            self.driver = get_driver(driver)
+        except ImportError as e:
+            raise ClientError(f'Driver {driver} requires the {driver} package!') from e
+        self._connect_opts = {
             'user': user,
             'password': password,
             'host': host,
             'port': port,
-            'read_timeout': READ_TIMEOUT
+            'read_timeout': READ_TIMEOUT,
+            'raw_values': raw_values,
+            'compress': compress
         }
 
-        self.db = pymysql.connect(**db_opts)
+        self.db = self.driver.connect(**self._connect_opts)
+        self.chunk_memory_bytes = int(float(chunk_memory_mb) * 1024 * 1024)
+        self.metrics = metrics
+        self.throttle = throttle
+        # cursor description of the last fetched chunk, column types of the typed output
+        self.description = None
 
     def get_available_schemas(self):
         cur = self.__get_cursor()
@@ -51,131 +120,376 @@ class Client:
         schemas = self.get_available_schemas()
         return [s[0] for s in schemas if regex.search(pattern, s[0])]
 
-    def get_table_data_buffered(self, table_name, schema, columns=None, row_limit=None, since_index=None,
-                                sort_key_col=None, sort_key_type=None):
-        cur = self.db.cursor()
+    def get_table_data_chunks(self, table_name, schema, columns=None, row_limit=None, since_index=None,
+                              sort_key_col=None, sort_key_type=None, key_cols=None, after_key=None,
+                              before_index=None):
+        sql = self.__build_select_query(columns, sort_key_col, sort_key_type, since_index, row_limit, schema,
+                                        table_name, key_cols=key_cols, after_key=after_key,
+                                        before_index=before_index)
+        col_names = None
+        for rows, description in self.__stream_query(sql, table_name, schema):
+            if col_names is None:
+                col_names = [i[0] for i in description]
+            last_id = self._get_last_id(rows, col_names, sort_key_col)
+            yield rows, list(col_names), str(last_id)
+
+    def get_table_data_pages(self, table_name, schema, columns=None, row_limit=None, since_index=None,
+                             sort_key_col=None, sort_key_type=None, page_size=MAX_CHUNK_SIZE, key_cols=None,
+                             after_key=None, before_index=None):
+        """
+        Download table in bounded pages walking the sort key (keyset pagination). Each page is a separate short query
+        continuing strictly after the key of the last row of the previous page, so a dropped connection repeats
+        only the current page, from the last row returned.
+
+        :param page_size: max rows per page query
+        :param key_cols: sort key column followed by columns making it unique (pkey), defaults to the sort key
+        :param after_key: values of key_cols to start strictly after, since_index is used if not set
+        :param before_index: optional exclusive upper bound of the sort key
+        :return: generator of (rows, col_names, last_id) chunks
+        """
+        key_cols = key_cols or [sort_key_col]
+        col_names = None
+        key_indexes = []
+        fetched = 0
+        retries = 0
+        while True:
+            limit = self.throttle.get_page_size(page_size) if self.throttle else page_size
+            limit = limit if not row_limit else min(limit, int(row_limit) - fetched)
+            if limit <= 0:
+                break
+            sql = self.__build_select_query(columns, sort_key_col, sort_key_type, since_index, limit, schema,
+                                            table_name, key_cols=key_cols, after_key=after_key,
+                                            before_index=before_index)
+            page_rows = 0
+            try:
+                for rows, description in self.__stream_query(sql, table_name, schema):
+                    if col_names is None:
+                        col_names = [i[0] for i in description]
+                        try:
+                            key_indexes = [col_names.index(c) for c in key_cols]
+                        except ValueError as e:
+                            raise ClientError(f'Paging key columns {key_cols} must be included in the downloaded '
+                                              f'columns of {schema}.{table_name}!') from e
+
+                    page_rows += len(rows)
+                    after_key = tuple(to_key_value(rows[-1][i], description[i][1]) for i in key_indexes)
+                    last_id = after_key[0] if sort_key_col else None
+                    yield rows, list(col_names), str(last_id)
+            except ClientError as e:
+                cause = e.__cause__
+                if not (isinstance(cause, self.driver.Error) and cause.args[0] in RETRY_CODES) \
+                        or retries >= MAX_RETRIES:
+                    raise
+                retries += 1
+                logging.warning(f'Connection lost while fetching {schema}.{table_name}, repeating the page '
+                                f'{retries}x.')
+                self.__reconnect()
+                fetched += page_rows
+                continue
+
+            retries = 0
+            fetched += page_rows
+            if page_rows < limit:
+                break
+
+    def __stream_query(self, sql, table_name, schema, skip_missing=True):
+        """
+        Execute query with unbuffered cursor and fetch the result in chunks sized by the memory budget.
+
+        :param skip_missing: log and return no rows if the table does not exist, raise otherwise
+        :return: generator of (rows, cursor description) chunks
+        """
+        if not self.db.open:
+            # closed after an abandoned result
+            self.__reconnect()
+        if self.throttle:
+            self.throttle.acquire(self)
+        cur = self.db.cursor(self.driver.ss_cursor_class)
 
         start = time.perf_counter()
-        sql = self.__build_select_query(columns, sort_key_col, sort_key_type, since_index, row_limit, schema,
-                                        table_name)
-        rows = []
-        col_names = []
-        last_id = None
         try:
             if logging.DEBUG == logging.root.level:
-                # wait before each message
-                # time.sleep(0.5)
                 logging.debug(f'Executing query: {sql}')
-            cur = self.__try_execute(cur, sql, buffered=True)
-            rows = cur.fetchall()
-            if rows:
-                if logging.DEBUG == logging.root.level:
-                    logging.info(f'Fetched {len(rows)} rows from {schema}.{table_name}')
-                for i in cur.description:
-                    col_names.append(i[0])
-                last_id = self._get_last_id(rows, col_names, sort_key_col)
-
-            # timer
-            elapsed = time.perf_counter() - start
-            logging.debug(f'Query took: {elapsed:.5f}s')
-
-        except pymysql.Error as e:
-            if e.args[0] == 1146:
-                logging.warning(f'Table {table_name} does not exist in schema {schema}, '
-                                f'skipping!')
-            else:
-                raise ClientError(f'Failed to execute query {sql}!') from e
-            pass
+            cur = self.__try_execute(cur, sql, buffered=False)
         except Exception as e:
-            self.db.close()
+            if self.throttle:
+                self.throttle.release()
+            missing_table = self.__is_missing_table_error(e)
+            if missing_table and skip_missing:
+                logging.warning(f'Table {table_name} does not exist in schema {schema}, skipping!')
+                return
+            if not missing_table:
+                self.db.close()
             raise ClientError(f'Failed to execute query {sql}!') from e
 
-        return rows, col_names, str(last_id)
-
-    def get_table_data_chunks(self, table_name, schema, columns=None, row_limit=None, since_index=None,
-                              sort_key_col=None, sort_key_type=None):
-        cur = self.db.cursor(pymysql.cursors.SSCursor)
-
-        start = time.perf_counter()
-        sql = self.__build_select_query(columns, sort_key_col, sort_key_type, since_index, row_limit, schema,
-                                        table_name)
-        rows = []
-        last_id = None
+        query_sec = time.perf_counter() - start
+        first_row_sec = 0
+        fetch_sec = 0
+        fetched_rows = 0
+        fetched_bytes = 0
+        peak_chunk_bytes = 0
+        sizer = ChunkSizer(self.chunk_memory_bytes)
         try:
-            if logging.DEBUG == logging.root.level:
-                # wait before each message
-                # time.sleep(0.5)
-                logging.debug(f'Executing query: {sql}')
-            cur = self.__try_execute(cur, sql, buffered=False)
             while True:
-                rows = cur.fetchmany(MAX_CHUNK_SIZE)
-                if rows:
-                    col_names = []
-                    if logging.DEBUG == logging.root.level:
-                        logging.info(f'Fetched {len(rows)} rows from {schema}.{table_name}')
-                    for i in cur.description:
-                        col_names.append(i[0])
-                    last_id = self._get_last_id(rows, col_names, sort_key_col)
-                    yield rows, col_names, str(last_id)
-                else:
+                fetch_start = time.perf_counter()
+                rows = cur.fetchmany(sizer.size)
+                fetch_sec += time.perf_counter() - fetch_start
+                if not rows:
                     break
-            # timer
-            elapsed = time.perf_counter() - start
-            logging.debug(f'Query took: {elapsed:.5f}s')
-
-        except pymysql.Error as e:
-            if e.args[0] == 1146:
-                logging.warning(f'Table {table_name} does not exist in schema {schema}, '
-                                f'skipping!')
-            else:
-                raise ClientError(f'Failed to execute query {sql}!') from e
-            pass
-        except Exception as e:
-            self.db.close()
+                if not fetched_rows:
+                    first_row_sec = time.perf_counter() - start
+                if logging.DEBUG == logging.root.level:
+                    logging.info(f'Fetched {len(rows)} rows from {schema}.{table_name}')
+                sizer.observe(rows)
+                fetched_rows += len(rows)
+                fetched_bytes += sizer.chunk_bytes
+                peak_chunk_bytes = max(peak_chunk_bytes, sizer.chunk_bytes)
+                self.description = cur.description
+                yield rows, cur.description
+        except GeneratorExit:
+            # the caller stopped reading (timeout), closing the connection is faster than reading the rest
+            cur.connection = None
+            # already closed if the pool was closed after a failure
+            if self.db.open:
+                self.db.close()
+            raise
+        except self.driver.Error as e:
+            # the rest of the result can't be read
+            self.driver.discard_result(cur)
+            if self.db.open:
+                self.db.close()
+            raise ClientError(f'Failed to fetch result of query {sql}!') from e
+        finally:
+            if self.throttle:
+                self.throttle.release(query_sec)
+            if self.metrics:
+                self.metrics.add(schema, table_name, queries=1, rows=fetched_rows, bytes=int(fetched_bytes),
+                                 query_sec=query_sec, first_row_sec=first_row_sec, fetch_sec=fetch_sec,
+                                 peak_chunk_bytes=int(peak_chunk_bytes))
+
+        # timer
+        elapsed = time.perf_counter() - start
+        logging.debug(f'Query took: {elapsed:.5f}s')
+
+    def get_union_table_data_chunks(self, table_name, schemas, columns=None, row_limit=None, since_indexes=None,
+                                    sort_key_col=None, sort_key_type=None, key_cols=None, after_keys=None):
+        """
+        Download the same table from several schemas with a single UNION ALL query. Each branch keeps its own
+        since index, order and limit; the schema name is returned as the last column `schema_nm`.
+        The table should exist in all the schemas (see get_tables_metadata), if it is missing in any of them
+        (dropped since) the schemas are queried one by one instead.
+
+        :param schemas: list of schema names
+        :param columns: list of columns or dict of lists per schema, all selecting the same columns
+        :param since_indexes: dict of last index per schema
+        :param after_keys: dict of key_cols values per schema to continue strictly after
+        :return: generator of (rows, col_names, {schema: last_id}) chunks
+        """
+        since_indexes = since_indexes or dict()
+        after_keys = after_keys or dict()
+        columns_by_schema = columns if isinstance(columns, dict) else dict.fromkeys(schemas, columns)
+        branches = [self.__build_select_query(columns_by_schema.get(s), sort_key_col, sort_key_type,
+                                              since_indexes.get(s), row_limit, s, table_name, schema_literal=True,
+                                              key_cols=key_cols, after_key=after_keys.get(s))
+                    for s in schemas]
+        sql = ' UNION ALL '.join(f'({b})' for b in branches)
+        try:
+            yield from self.__get_schema_tagged_chunks(sql, table_name, ', '.join(schemas), sort_key_col,
+                                                       skip_missing=False)
+        except ClientError as e:
+            if not self.__is_missing_table_error(e.__cause__):
+                raise
+            logging.debug(f'Table {table_name} missing in some of the schemas {schemas}, querying separately.')
+            for s, branch in zip(schemas, branches):
+                yield from self.__get_schema_tagged_chunks(branch, table_name, s, sort_key_col)
+
+    def __get_schema_tagged_chunks(self, sql, table_name, schema_label, sort_key_col, skip_missing=True):
+        """
+        Stream result of a query whose last column is the schema name, tracking last id per schema - the greatest
+        sort key value returned so far. Rows of the UNION ALL branches are not returned in the branch order,
+        MySQL ignores ORDER BY of a branch without LIMIT.
+
+        :return: generator of (rows, col_names, {schema: last_id}) chunks, last ids of the schemas in the chunk
+        """
+        col_names = None
+        sort_key_index = None
+        last_keys = dict()
+        for rows, description in self.__stream_query(sql, table_name, schema_label, skip_missing=skip_missing):
+            if col_names is None:
+                col_names = [i[0] for i in description]
+                sort_key_index = col_names.index(sort_key_col) if sort_key_col else None
+            last_ids = dict()
+            for r in rows:
+                if sort_key_index is None:
+                    last_ids[r[-1]] = str(None)
+                    continue
+                key = to_key_value(r[sort_key_index], description[sort_key_index][1])
+                if r[-1] not in last_keys or key_order([key]) > key_order([last_keys[r[-1]]]):
+                    last_keys[r[-1]] = key
+                last_ids[r[-1]] = str(last_keys[r[-1]])
+            yield rows, list(col_names), last_ids
+
+    def __build_select_query(self, columns, sort_key_col, sort_key_type, since_index, row_limit, schema, table_name,
+                             schema_literal=False, key_cols=None, after_key=None, before_index=None):
+        return build_select_query(self.__escape, columns, sort_key_col, sort_key_type, since_index, row_limit, schema,
+                                  table_name, schema_literal=schema_literal, key_cols=key_cols, after_key=after_key,
+                                  before_index=before_index)
+
+    def get_sort_key_range(self, table_name, schema, sort_key_col, sort_key_type, since_index=None, row_limit=None):
+        """
+        Get boundaries of the sort key values to be downloaded.
+
+        :param row_limit: boundaries of the first row_limit rows only
+        :return: (min, max) tuple, (None, None) if there are no rows
+        """
+        sql = f'SELECT {sort_key_col} AS sort_key FROM {schema}.{table_name}'
+        if since_index not in [None, 'None']:
+            sql += f' WHERE {sort_key_col} >= {format_index(since_index, sort_key_type)}'
+        if row_limit:
+            sql += f' ORDER BY {sort_key_col} LIMIT {int(row_limit)}'
+        sql = f'SELECT MIN(sort_key), MAX(sort_key) FROM ({sql}) sort_keys'
+
+        cur = self.__get_cursor()
+        try:
+            cur = self.__try_execute(cur, sql)
+            return cur.fetchone()
+        except self.driver.Error as e:
             raise ClientError(f'Failed to execute query {sql}!') from e
 
-    def __build_select_query(self, columns, sort_key_col, sort_key_type, since_index, row_limit, schema, table_name):
-        if columns and columns != []:
-            columns = ','.join(columns)
-        else:
-            columns = '*'
+    def get_load_signals(self):
+        """
+        Read the server load, signals that can not be read (privileges, not a replica) are None.
 
-        sql = f'SELECT {columns} FROM {schema}.{table_name}'
+        :return: (threads_running, replica_lag_sec) tuple
+        """
+        cur = self.__get_cursor()
+        threads_running = None
+        try:
+            cur.execute("SHOW GLOBAL STATUS LIKE 'Threads_running'")
+            row = cur.fetchone()
+            threads_running = int(row[1]) if row else None
+        except self.driver.Error as e:
+            logging.debug(f'Threads_running can not be read: {e}')
+
+        replica_lag = None
+        # SHOW SLAVE STATUS before MySQL 8.0.22
+        for sql, lag_column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+            try:
+                cur.execute(sql)
+                row = cur.fetchone()
+            except self.driver.Error as e:
+                logging.debug(f'Replica status can not be read: {e}')
+                continue
+            col_names = [d[0] for d in cur.description or []]
+            if row and lag_column in col_names and row[col_names.index(lag_column)] is not None:
+                replica_lag = int(row[col_names.index(lag_column)])
+            break
+        return threads_running, replica_lag
+
+    def get_binlog_position(self):
+        """
+        Current position of the binary log of the server.
+
+        :return: (log_file, log_pos) tuple, None if binary logging is not enabled
+        """
+        cur = self.__get_cursor()
+        # SHOW MASTER STATUS before MySQL 8.2
+        for sql in ('SHOW BINARY LOG STATUS', 'SHOW MASTER STATUS'):
+            try:
+                cur.execute(sql)
+                row = cur.fetchone()
+            except self.driver.Error as e:
+                logging.debug(f'Binlog position can not be read by {sql}: {e}')
+                continue
+            return (row[0], int(row[1])) if row else None
+        return None
+
+    def get_tables_metadata(self, schemas, table_names):
+        """
+        Read metadata of the tables in all the schemas with a single information_schema query. Tables that
+        are not returned do not exist (or are not accessible) and must not be queried.
+
+        :return: dict {schema: {table: (update_time, table_rows, auto_increment, checked_at)}}, checked_at is
+        the server time of the query
+        """
+        cur = self.__get_cursor()
+        try:
+            # MySQL 8 caches the statistics for a day by default
+            cur.execute('SET SESSION information_schema_stats_expiry = 0')
+        except self.driver.Error as e:
+            logging.debug(f'Statistics expiry can not be set, older server? {e}')
+
+        schema_list = ','.join(self.__escape(s) for s in schemas)
+        table_list = ','.join(self.__escape(t) for t in table_names)
+        sql = f'SELECT TABLE_SCHEMA, TABLE_NAME, UPDATE_TIME, TABLE_ROWS, AUTO_INCREMENT, NOW() AS checked_at ' \
+              f'FROM information_schema.TABLES WHERE TABLE_SCHEMA IN ({schema_list}) AND TABLE_NAME IN ({table_list})'
+        try:
+            cur = self.__try_execute(cur, sql)
+            rows = cur.fetchall()
+        except self.driver.Error as e:
+            raise ClientError(f'Failed to read tables metadata! {e}') from e
+
+        metadata = dict()
+        for schema, table, *values in rows:
+            metadata.setdefault(schema, dict())[table] = tuple(values)
+        return metadata
+
+    def get_tables_columns(self, schemas, table_names):
+        """
+        Read columns of the tables in all the schemas with a single information_schema query.
+
+        :return: dict {schema: {table: [column names in the table order]}}
+        """
+        schema_list = ','.join(self.__escape(s) for s in schemas)
+        table_list = ','.join(self.__escape(t) for t in table_names)
+        sql = f'SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS ' \
+              f'WHERE TABLE_SCHEMA IN ({schema_list}) AND TABLE_NAME IN ({table_list}) ' \
+              f'ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION'
+        cur = self.__get_cursor()
+        try:
+            cur = self.__try_execute(cur, sql)
+            rows = cur.fetchall()
+        except self.driver.Error as e:
+            raise ClientError(f'Failed to read tables columns! {e}') from e
 
-        if sort_key_col and since_index not in [None, 'None']:
-            if sort_key_type == 'string':
-                since_index = f"'{since_index}'"
-            sql += f' WHERE {sort_key_col} >= {since_index} ORDER BY {sort_key_col}'
-        elif sort_key_col:
-            sql += f' ORDER BY {sort_key_col}'
+        columns = dict()
+        for schema, table, column in rows:
+            columns.setdefault(schema, dict()).setdefault(table, []).append(column)
+        return columns
 
-        if row_limit:
-            sql += f' LIMIT {row_limit}'
-        return sql
-
-    def get_table_row_count(self, table_name, schema, last_index, sort_key_col, sort_key_type):
-        cur = self.db.cursor()
-        sql = f"SELECT COUNT(*) as cnt, '{last_index}' as last_index, " \
-              f"'{sort_key_col}' as sort_key_col  FROM {schema}.{table_name}"
-        if sort_key_type == 'string':
-            last_index = f"'{last_index}'"
-        if last_index and last_index != 'None':
-            sql += f' WHERE {sort_key_col} <= {last_index};'
+    def get_table_row_counts(self, tables):
+        """
+        Count rows of several tables up to their last index with a single UNION ALL query. If any of the tables
+        does not exist (dropped since the metadata pre-pass) the tables are counted one by one instead, missing
+        tables are skipped.
 
-        rows = []
-        col_names = []
+        :param tables: list of (schema, table_name, last_index, sort_key_col, sort_key_type) tuples
+        :return: rows (cnt, last_index, sort_key_col, table, is_estimate), col_names
+        """
+        sql = build_row_count_query(tables)
+
+        cur = self.__get_cursor()
         try:
-            cur.execute(sql)
+            cur = self.__try_execute(cur, sql)
             rows = cur.fetchall()
-            if rows:
-                for i in cur.description:
-                    col_names.append(i[0])
-
         except Exception as e:
-            self.db.close()
-            raise ClientError(f'Failed to execute query {sql}! {e}')
-
-        return rows, col_names
+            if not self.__is_missing_table_error(e):
+                self.db.close()
+                raise ClientError(f'Failed to execute query {sql}! {e}')
+            if len(tables) == 1:
+                schema, table_name = tables[0][:2]
+                logging.warning(f'Table {table_name} does not exist in schema {schema}, skipping its row count!')
+                return [], []
+            logging.debug(f'Some of the {len(tables)} counted tables do not exist, counting separately.')
+            rows = []
+            col_names = []
+            for t in tables:
+                table_rows, table_col_names = self.get_table_row_counts([t])
+                rows.extend(table_rows)
+                col_names = table_col_names or col_names
+            return rows, col_names
+        return rows, [i[0] for i in cur.description]
 
     def __try_execute(self, cursor, query, buffered=True):
         retries = 1
@@ -184,33 +498,144 @@ class Client:
             try:
                 cursor.execute(query)
                 retry = False
-            except pymysql.Error as e:
+            except self.driver.Error as e:
                 if e.args[0] in RETRY_CODES and retries <= MAX_RETRIES:
                     logging.warning(f'Query failed retrying {retries}x')
                     time.sleep(2 ^ retries)
                     retries += 1
-                    self.db.close()
-                    self.db.connect()
+                    self.__reconnect()
                     if buffered:
                         cursor = self.db.cursor()
                     else:
-                        cursor = self.db.cursor(pymysql.cursors.SSCursor)
+                        cursor = self.db.cursor(self.driver.ss_cursor_class)
                 else:
                     raise e
         return cursor
 
+    def __is_missing_table_error(self, e):
+        return isinstance(e, self.driver.Error) and e.args[0] == MISSING_TABLE_CODE
+
     def __get_cursor(self):
         try:
-            self.db.ping(reconnect=True)
-        except pymysql.Error as err:
+            self.db.ping()
+        except self.driver.Error as err:
             logging.debug(f'Ping failed, reconnecting. {err}')
             # reconnect your cursor
-            self.db.close()
-            self.db.connect()
+            self.__reconnect()
         return self.db.cursor()
 
+    def __reconnect(self):
+        if self.db.open:
+            self.db.close()
+        self.db = self.driver.connect(**self._connect_opts)
+
+    def __escape(self, value):
+        return self.driver.escape(self.db, value)
+
     def _get_last_id(self, rows, col_names, index_column):
         if not index_column:
             return None
         pk_index = col_names.index(index_column)
         return rows[-1][pk_index]
+
+
+def build_select_query(escape, columns, sort_key_col, sort_key_type, since_index, row_limit, schema, table_name,
+                       schema_literal=False, key_cols=None, after_key=None, before_index=None):
+    """
+    SELECT of a single table, shared by the sync and async clients.
+
+    :param escape: literal escaping function of the connection
+    """
+    if columns and columns != []:
+        columns = ','.join(columns)
+    else:
+        columns = '*'
+
+    if schema_literal:
+        columns += f", {escape(schema)} AS schema_nm"
+
+    sql = f'SELECT {columns} FROM {schema}.{table_name}'
+
+    order_by = ','.join(key_cols) if key_cols else sort_key_col
+    conditions = []
+    if key_cols and after_key is not None:
+        # continue strictly after the last seen key
+        key_values = ','.join(escape(v) for v in after_key)
+        conditions.append(f'({order_by}) > ({key_values})')
+    elif sort_key_col and since_index not in [None, 'None']:
+        conditions.append(f'{sort_key_col} >= {format_index(since_index, sort_key_type)}')
+    if sort_key_col and before_index is not None:
+        conditions.append(f'{sort_key_col} < {format_index(before_index, sort_key_type)}')
+
+    if conditions:
+        sql += f' WHERE {" AND ".join(conditions)}'
+    if order_by:
+        sql += f' ORDER BY {order_by}'
+
+    if row_limit:
+        sql += f' LIMIT {row_limit}'
+    return sql
+
+
+def to_key_value(value, type_code):
+    """
+    Key value of the last row to continue after. Values of integer and decimal columns fetched as text (raw values)
+    are converted to numbers, so they are written to the query unquoted - MySQL compares a number column with
+    a quoted literal as doubles, rows would be skipped above 2^53.
+
+    :param type_code: type code of the column in the cursor description
+    """
+    if not isinstance(value, (str, bytes)):
+        return value
+    if type_code in INTEGER_TYPES:
+        return int(value)
+    if type_code in DECIMAL_TYPES:
+        return Decimal(value.decode() if isinstance(value, bytes) else value)
+    return value
+
+
+def key_order(key):
+    """
+    Comparable form of key values, NULL sorts first as in MySQL.
+
+    :param key: list of key values of a single row
+    """
+    return tuple((v is not None, v) for v in key)
+
+
+def parse_number(value):
+    """
+    Number of a numeric key value stored as text, the value as is if it is not a number.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return value
+
+
+def format_index(index, sort_key_type):
+    if sort_key_type == 'string':
+        return f"'{index}'"
+    return index
+
+
+def build_row_count_query(tables):
+    """
+    Count rows of several tables up to their last index with a single UNION ALL query.
+
+    :param tables: list of (schema, table_name, last_index, sort_key_col, sort_key_type) tuples
+    """
+    branches = []
+    for schema, table_name, last_index, sort_key_col, sort_key_type in tables:
+        sql = f"SELECT COUNT(*) AS cnt, '{last_index}' AS last_index, '{sort_key_col}' AS sort_key_col, " \
+              f"'{schema}.{table_name}' AS `table`, 0 AS is_estimate FROM {schema}.{table_name}"
+        if last_index and last_index != 'None':
+            sql += f' WHERE {sort_key_col} <= {format_index(last_index, sort_key_type)}'
+        branches.append(sql)
+    return ' UNION ALL '.join(f'({b})' for b in branches)
@@ -0,0 +1,104 @@
+import pymysql
+from pymysql import converters
+from pymysql.constants import FIELD_TYPE
+
+DRIVER_PYMYSQL = 'pymysql'
+DRIVER_MYSQLCLIENT = 'mysqlclient'
+
+# keeps only python -> SQL literal encoders, result values are returned as received (text or bytes)
+RAW_CONVERSIONS = {k: v for k, v in converters.conversions.items() if not isinstance(k, int)}
+
+# temporal values decoded as by pymysql - invalid values (zero dates) are kept as text
+PYMYSQL_TEMPORAL_DECODERS = {FIELD_TYPE.DATETIME: converters.convert_datetime,
+                             FIELD_TYPE.TIMESTAMP: converters.convert_datetime,
+                             FIELD_TYPE.DATE: converters.convert_date,
+                             FIELD_TYPE.TIME: converters.convert_timedelta}
+
+
+class PyMySQLDriver:
+
+    def __init__(self):
+        """
+        Pure python driver, the default.
+        """
+        self.name = DRIVER_PYMYSQL
+        self.Error = pymysql.Error
+        self.ss_cursor_class = pymysql.cursors.SSCursor
+
+    @staticmethod
+    def connect(host, port, user, password, read_timeout, raw_values=False, compress=False):
+        if compress:
+            raise ValueError(f'Compressed protocol is supported by the {DRIVER_MYSQLCLIENT} driver only!')
+        db_opts = {
+            'user': user,
+            'password': password,
+            'host': host,
+            'port': port,
+            'read_timeout': read_timeout
+        }
+        if raw_values:
+            db_opts['conv'] = RAW_CONVERSIONS
+        return pymysql.connect(**db_opts)
+
+    @staticmethod
+    def escape(db, value):
+        return db.escape(value)
+
+    @staticmethod
+    def discard_result(cursor):
+        """
+        Drop unbuffered result of a lost connection, it would be read to the end once collected otherwise.
+        """
+        result = cursor._result
+        if result is not None:
+            result.unbuffered_active = False
+        cursor.connection = None
+
+
+class MySQLClientDriver:
+
+    def __init__(self):
+        """
+        Driver backed by the mysqlclient C extension (libmysqlclient), rows are decoded in C and the protocol may be
+        compressed. Values are converted to the same python types as by pymysql, so the output of both drivers is
+        identical (see tests/test_drivers.py).
+
+        Requires the optional mysqlclient package.
+        """
+        import MySQLdb
+        import MySQLdb.converters
+        import MySQLdb.cursors
+
+        self.name = DRIVER_MYSQLCLIENT
+        self.Error = MySQLdb.Error
+        self.ss_cursor_class = MySQLdb.cursors.SSCursor
+        self._connect = MySQLdb.connect
+        self._conversions = {**MySQLdb.converters.conversions, **PYMYSQL_TEMPORAL_DECODERS}
+        self._raw_conversions = {k: v for k, v in MySQLdb.converters.conversions.items() if not isinstance(k, int)}
+
+    def connect(self, host, port, user, password, read_timeout, raw_values=False, compress=False):
+        return self._connect(host=host, port=int(port), user=user, passwd=password, read_timeout=read_timeout,
+                             charset='utf8mb4', compress=bool(compress),
+                             conv=self._raw_conversions if raw_values else self._conversions)
+
+    @staticmethod
+    def escape(db, value):
+        # quoted literal in the connection charset
+        return db.literal(value).decode(db.encoding)
+
+    @staticmethod
+    def discard_result(cursor):
+        cursor.connection = None
+
+
+DRIVERS = {DRIVER_PYMYSQL: PyMySQLDriver, DRIVER_MYSQLCLIENT: MySQLClientDriver}
+
+
+def get_driver(name=DRIVER_PYMYSQL):
+    """
+    :param name: pymysql or mysqlclient
+    :raise ImportError: the driver package is not installed
+    """
+    if name not in DRIVERS:
+        raise ValueError(f'Unsupported driver "{name}", use one of {", ".join(DRIVERS)}!')
+    return DRIVERS[name]()
@@ -0,0 +1,80 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+from mysql_connect.client import Client
+
+
+class ClientPool:
+
+    def __init__(self, host, port, user, password, max_size=1, **client_kwargs):
+        """
+        Bounded pool of Client connections. Connections are opened lazily, never more than max_size at once.
+
+        :param client_kwargs: additional Client parameters
+        """
+        self._conn_args = (host, port, user, password)
+        self._client_kwargs = client_kwargs
+        self.max_size = max(1, int(max_size))
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, block=True, timeout=None):
+        """
+        Get an idle connection or open a new one if the cap is not reached yet.
+
+        :param block: wait for a connection to be released if the pool is exhausted
+        :param timeout: max seconds to wait when blocking
+        :return: Client instance or None if non-blocking and no connection is available
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                logging.debug(f'Opening connection {self._created}/{self.max_size}')
+                return Client(*self._conn_args, **self._client_kwargs)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        if not block:
+            return None
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, client):
+        self._idle.put(client)
+
+    @contextmanager
+    def connection(self):
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def close_all(self):
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                client.db.close()
+            except Exception as e:
+                logging.debug(f'Failed to close connection: {e}')
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+# seconds between checks of the server load
+CHECK_INTERVAL_SEC = 10
+# multiplicative decrease of the allowed concurrency and page size when the server is overloaded
+DECREASE_FACTOR = 0.5
+# share of the configured page size added back per check once the load is fine
+PAGE_INCREASE_STEP = 0.1
+MIN_PAGE_FACTOR = 0.05
+# pause before each query while the server stays overloaded at a single query
+MAX_PAUSE_SEC = 30
+
+
+class Throttle:
+
+    def __init__(self, max_concurrency, max_threads_running=None, max_replica_lag_sec=None,
+                 max_query_latency_sec=None, check_interval_sec=CHECK_INTERVAL_SEC):
+        """
+        Adaptive (AIMD) limit of the load put on a single server, shared by all clients of its pool.
+
+        Before a query is started the server load is checked at most once per check interval - Threads_running,
+        replica lag and the latency of the queries since the last check. The number of concurrently running
+        queries and the page size are halved while any of the signals exceeds its limit and grow back by a step
+        per check once the server is fine again. Overloaded server with a single query running pauses the queries
+        with a growing delay.
+
+        :param max_concurrency: max concurrently running queries, reached while the server is not loaded
+        :param max_threads_running: Threads_running (SHOW GLOBAL STATUS) considered an overload
+        :param max_replica_lag_sec: replica lag (SHOW REPLICA STATUS) considered an overload
+        :param max_query_latency_sec: average query latency (time to execute, not to fetch) considered an overload
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_threads_running = max_threads_running
+        self.max_replica_lag_sec = max_replica_lag_sec
+        self.max_query_latency_sec = max_query_latency_sec
+        self.check_interval_sec = float(check_interval_sec)
+        self.concurrency = float(self.max_concurrency)
+        self.page_factor = 1.0
+        self.pause_sec = 0
+        self._running = 0
+        self._latencies = []
+        self._last_check = None
+        self._checking = False
+        self._condition = threading.Condition()
+
+    def acquire(self, client):
+        """
+        Wait until another query may be started, checks the server load on the client if it is due.
+
+        :param client: idle Client, used to read the server status
+        """
+        if self._is_check_due():
+            try:
+                self.check(client)
+            finally:
+                with self._condition:
+                    self._checking = False
+        if self.pause_sec:
+            time.sleep(self.pause_sec)
+        with self._condition:
+            while self._running >= int(self.concurrency):
+                self._condition.wait()
+            self._running += 1
+
+    def release(self, latency_sec=None):
+        """
+        :param latency_sec: time the finished query took to execute
+        """
+        with self._condition:
+            self._running -= 1
+            if latency_sec is not None:
+                self._latencies.append(latency_sec)
+            self._condition.notify_all()
+
+    def get_page_size(self, page_size):
+        return max(1, int(page_size * self.page_factor))
+
+    def check(self, client):
+        """
+        Read the load signals and adjust the limits.
+        """
+        threads_running, replica_lag = client.get_load_signals()
+        with self._condition:
+            latencies, self._latencies = self._latencies, []
+            latency = sum(latencies) / len(latencies) if latencies else None
+            overloaded = []
+            if self.max_threads_running and threads_running is not None \
+                    and threads_running > self.max_threads_running:
+                overloaded.append(f'{threads_running} threads running')
+            if self.max_replica_lag_sec and replica_lag is not None and replica_lag > self.max_replica_lag_sec:
+                overloaded.append(f'replica lag {replica_lag}s')
+            if self.max_query_latency_sec and latency is not None and latency > self.max_query_latency_sec:
+                overloaded.append(f'query latency {latency:.2f}s')
+
+            previous = (int(self.concurrency), self.page_factor, self.pause_sec)
+            if overloaded:
+                if self.concurrency <= 1 and self.page_factor <= MIN_PAGE_FACTOR:
+                    self.pause_sec = min(MAX_PAUSE_SEC, max(1, self.pause_sec * 2))
+                self.concurrency = max(1.0, self.concurrency * DECREASE_FACTOR)
+                self.page_factor = max(MIN_PAGE_FACTOR, self.page_factor * DECREASE_FACTOR)
+            else:
+                self.pause_sec = 0
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.page_factor = min(1.0, self.page_factor + PAGE_INCREASE_STEP)
+            self._last_check = time.perf_counter()
+            self._condition.notify_all()
+
+        if (int(self.concurrency), self.page_factor, self.pause_sec) != previous:
+            reason = f'Server overloaded ({", ".join(overloaded)})' if overloaded else 'Server load is fine'
+            logging.info(f'{reason}, running max {int(self.concurrency)} queries at once, '
+                         f'{self.page_factor:.0%} of the page size, pause {self.pause_sec}s.')
+
+    def _is_check_due(self):
+        with self._condition:
+            if self._checking:
+                return False
+            if self._last_check is not None and time.perf_counter() - self._last_check < self.check_interval_sec:
+                return False
+            # a single thread checks at a time
+            self._checking = True
+            return True
@@ -0,0 +1,414 @@
+import csv
+import gzip
+import io
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from pymysql.constants import FIELD_TYPE
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# chunks waiting for each writer thread, producers block when full
+WRITE_QUEUE_SIZE = 2
+
+COMPRESSION_GZIP = 'gzip'
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+PARQUET_COMPRESSIONS = ['snappy', 'gzip', 'zstd', 'lz4', 'brotli']
+# max rows of a parquet row group, rows are buffered until the group is full or the output is flushed
+ROW_GROUP_ROWS = 100000
+# columns appended to the fetched rows (suffix), the schema name column is dictionary encoded
+SCHEMA_COLUMN = 'schema_nm'
+
+INT_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24,
+             FIELD_TYPE.YEAR}
+FLOAT_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE}
+DECIMAL_TYPES = {FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+DATETIME_TYPES = {FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP}
+DATE_TYPES = {FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE}
+
+_STOP = object()
+
+
+class OutputWriterError(Exception):
+    """
+
+    """
+
+
+class OutputWriter:
+
+    def __init__(self, tables_out_path, writer_threads=1, queue_size=WRITE_QUEUE_SIZE, slice_size_mb=None,
+                 compression=None, metrics=None, output_format=FORMAT_CSV, row_group_rows=ROW_GROUP_ROWS,
+                 suffix_columns=(SCHEMA_COLUMN,)):
+        """
+        Encodes and writes fetched chunks to the output tables in dedicated writer threads, so the fetching
+        continues while the previous chunk is being written. Each table is always handled by the same thread,
+        which keeps the rows of a chunk together and the files free of locks.
+
+        :param tables_out_path: output tables folder
+        :param writer_threads: number of writer threads
+        :param queue_size: max chunks waiting per writer thread, fetching blocks when exceeded (backpressure)
+        :param slice_size_mb: start new slice file of the table once the current one reaches this size (on disk)
+        :param compression: 'gzip' to compress the slices, parquet compression codec (snappy by default)
+        :param metrics: optional TableMetrics collecting encode and write time, chunks are flushed to disk
+        one by one to measure them
+        :param output_format: 'csv' or 'parquet' (requires pyarrow) - typed columns mapped from the cursor
+        description, written in row groups of at most row_group_rows
+        :param suffix_columns: names of the values appended to the rows (suffix), for parquet
+        """
+        self.output_format = output_format or FORMAT_CSV
+        if self.output_format == FORMAT_PARQUET:
+            if pyarrow is None:
+                raise OutputWriterError('Parquet output requires the pyarrow package!')
+            compression = compression or PARQUET_COMPRESSIONS[0]
+            if compression not in PARQUET_COMPRESSIONS:
+                raise OutputWriterError(f'Unsupported parquet compression "{compression}"!')
+        elif self.output_format != FORMAT_CSV:
+            raise OutputWriterError(f'Unsupported output format "{output_format}"!')
+        elif compression not in (None, COMPRESSION_GZIP):
+            raise OutputWriterError(f'Unsupported output compression "{compression}"!')
+        self.tables_out_path = tables_out_path
+        self.slice_size_bytes = int(float(slice_size_mb) * 1024 * 1024) if slice_size_mb else None
+        self.compression = compression
+        self.metrics = metrics
+        self.row_group_rows = max(1, int(row_group_rows or ROW_GROUP_ROWS))
+        self.suffix_columns = list(suffix_columns)
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, int(writer_threads)))]
+        self._files = dict()
+        self._folder_lock = threading.Lock()
+        self._error = None
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._consume, args=(q,), name=f'writer-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def write(self, name, rows, suffix=None, part=None, description=None):
+        """
+        Queue chunk of rows to be written to the output table.
+
+        :param name: output table name
+        :param rows: fetched rows
+        :param suffix: value appended to each row, e.g. schema name, or a tuple of values starting with the schema
+        name. Rows are written as they are if None.
+        :param part: label of a separate file (slice) in the table folder, allows writing one table in parallel
+        :param description: cursor description of the rows, types of the parquet columns. Types of columns described
+        by (name,) only are inferred from the values.
+        """
+        self._raise_if_failed()
+        self._get_queue(name, part).put((name, rows, suffix, part, description))
+
+    def flush(self):
+        """
+        Wait until all the chunks queued so far are written and flushed to disk, parquet slices are finalized
+        so that everything written is readable. Chunks queued meanwhile by other threads are not waited for.
+        """
+        self._raise_if_failed()
+        barriers = [threading.Event() for _ in self._queues]
+        for q, barrier in zip(self._queues, barriers):
+            q.put(barrier)
+        for barrier in barriers:
+            barrier.wait()
+        self._raise_if_failed()
+
+    def close(self):
+        """
+        Write remaining chunks, stop the writer threads and close all output files.
+        """
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join()
+        for f in self._files.values():
+            f.close()
+        self._raise_if_failed()
+
+    def _get_queue(self, name, part):
+        key = f'{name}/{part}' if part else name
+        return self._queues[zlib.crc32(key.encode('utf-8')) % len(self._queues)]
+
+    def _raise_if_failed(self):
+        if self._error:
+            raise OutputWriterError(f'Failed to write output: {self._error}') from self._error
+
+    def _consume(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    break
+                if isinstance(item, threading.Event):
+                    self._flush_files(q)
+                    item.set()
+                elif not self._error:
+                    self._write_chunk(*item)
+            except Exception as e:
+                logging.debug(f'Writer failed: {e}')
+                if isinstance(item, threading.Event):
+                    # release the flushing thread, it raises the error
+                    item.set()
+                # keep draining the queue so the producers are not blocked, they fail on next write
+                self._error = e
+            finally:
+                q.task_done()
+
+    def _flush_files(self, q):
+        """
+        Flush files written by the thread consuming queue q.
+        """
+        for (name, part), f in list(self._files.items()):
+            if self._get_queue(name, part) is q:
+                f.flush()
+
+    def _write_chunk(self, name, rows, suffix, part, description):
+        out = self._get_out_file(name, part)
+        start = time.perf_counter()
+        if self.output_format == FORMAT_PARQUET:
+            suffix_row = () if suffix is None else suffix if isinstance(suffix, tuple) else (suffix,)
+            out.write(rows, suffix_row, self.suffix_columns[:len(suffix_row)], description)
+        elif suffix is None:
+            csv.writer(out.stream).writerows(rows)
+        else:
+            # append schema name, single tuple allocation per row
+            suffix_row = suffix if isinstance(suffix, tuple) else (suffix,)
+            csv.writer(out.stream).writerows(r + suffix_row for r in rows)
+        if self.metrics:
+            encoded = time.perf_counter()
+            if self.output_format == FORMAT_CSV:
+                # parquet rows are buffered up to a full row group, its write is part of the encode time
+                out.flush()
+            schema = suffix[0] if isinstance(suffix, tuple) else suffix
+            self.metrics.add(schema, name, encode_sec=encoded - start, write_sec=time.perf_counter() - encoded)
+        if self.slice_size_bytes:
+            out.roll_over_if_full(self.slice_size_bytes)
+
+    def _get_out_file(self, name, part=None):
+        """
+        Get cached output of the table (part), create it on first access.
+        """
+        out_file = self._files.get((name, part))
+        if not out_file:
+            folder_path = os.path.join(self.tables_out_path, name)
+            # parts of the same table may be created by several writer threads
+            with self._folder_lock:
+                if not os.path.exists(folder_path):
+                    os.mkdir(folder_path)
+            file_name = f'{name}_{part}' if part else name
+            if self.output_format == FORMAT_PARQUET:
+                out_file = _ParquetTableFile(folder_path, file_name, compression=self.compression,
+                                             row_group_rows=self.row_group_rows)
+            else:
+                out_file = _SlicedTableFile(folder_path, file_name, sliced=bool(self.slice_size_bytes),
+                                            compression=self.compression)
+            self._files[(name, part)] = out_file
+        return out_file
+
+
+class _SlicedTableFile:
+
+    def __init__(self, folder_path, name, sliced=False, compression=None):
+        """
+        Output of a single table, a sequence of slice files in the table folder. Slices have no header,
+        columns are listed in the manifest.
+        """
+        self.folder_path = folder_path
+        self.name = name
+        self.sliced = sliced
+        self.compression = compression
+        self.slice_index = 0
+        self._raw = None
+        self._stream = None
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            self._open_slice()
+        return self._stream
+
+    def roll_over_if_full(self, max_bytes):
+        """
+        Close current slice if it reached max_bytes, next write starts a new one.
+        """
+        if self._stream is None:
+            return
+        # push buffered data down to the file to get its real size
+        self._stream.flush()
+        if self._raw.tell() >= max_bytes:
+            self.close()
+
+    def flush(self):
+        if self._stream is not None:
+            self._stream.flush()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            # gzip does not close the underlying file
+            self._raw.close()
+            self._stream = None
+            self._raw = None
+
+    def _open_slice(self):
+        file_name = self.name
+        if self.sliced:
+            self.slice_index += 1
+            file_name += f'_{self.slice_index:04d}'
+        file_name += '.csv'
+        if self.compression == COMPRESSION_GZIP:
+            file_name += '.gz'
+
+        self._raw = open(os.path.join(self.folder_path, file_name), 'wb')
+        binary = self._raw
+        if self.compression == COMPRESSION_GZIP:
+            binary = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=6)
+        self._stream = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+
+class _ParquetTableFile:
+
+    def __init__(self, folder_path, name, compression, row_group_rows):
+        """
+        Parquet output of a single table, a sequence of slice files in the table folder. Column types are mapped
+        from the cursor description of the first chunk, a chunk of different types (tables differing between
+        schemas) starts a new slice with its own types.
+        """
+        self.folder_path = folder_path
+        self.name = name
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self.slice_index = 0
+        self._schema = None
+        self._writer = None
+        self._path = None
+        self._batches = []
+        self._buffered_rows = 0
+        self._invalid_columns = set()
+
+    def write(self, rows, suffix_row, suffix_columns, description):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        description = description or [(f'col_{i}',) for i in range(len(columns))]
+        names = [d[0] for d in description]
+        types = [self._get_type(d, values, i) for i, (d, values) in enumerate(zip(description, columns))]
+        arrays = [self._to_array(n, values, t) for n, values, t in zip(names, columns, types)]
+        arrays = [a.dictionary_encode() if n == SCHEMA_COLUMN and pyarrow.types.is_string(a.type) else a
+                  for n, a in zip(names, arrays)]
+        for column, value in zip(suffix_columns, suffix_row):
+            if column == SCHEMA_COLUMN:
+                # single value per chunk, stored once in the dictionary
+                indices = pyarrow.array([0] * len(rows), type=pyarrow.int32())
+                arrays.append(pyarrow.DictionaryArray.from_arrays(indices, pyarrow.array([value])))
+            else:
+                arrays.append(pyarrow.array([value] * len(rows)))
+        names += suffix_columns
+        batch = pyarrow.RecordBatch.from_arrays(arrays, names=names)
+
+        if self._schema is not None and not batch.schema.equals(self._schema):
+            self.close()
+        if self._writer is None:
+            self._open_slice(batch.schema)
+        self._batches.append(batch)
+        self._buffered_rows += len(rows)
+        if self._buffered_rows >= self.row_group_rows:
+            self._write_buffered()
+
+    def roll_over_if_full(self, max_bytes):
+        if self._writer is not None and os.path.getsize(self._path) >= max_bytes:
+            self.close()
+
+    def flush(self):
+        """
+        Finalize the current slice, a parquet file is readable only once its footer is written on close.
+        The next chunk starts a new slice.
+        """
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._write_buffered()
+            self._writer.close()
+            self._writer = None
+            self._schema = None
+
+    def _open_slice(self, schema):
+        self.slice_index += 1
+        self._path = os.path.join(self.folder_path, f'{self.name}_{self.slice_index:04d}.parquet')
+        self._schema = schema
+        self._writer = pyarrow.parquet.ParquetWriter(self._path, schema, compression=self.compression)
+
+    def _write_buffered(self):
+        if not self._batches:
+            return
+        table = pyarrow.Table.from_batches(self._batches)
+        self._writer.write_table(table, row_group_size=self.row_group_rows)
+        self._batches = []
+        self._buffered_rows = 0
+
+    def _get_type(self, column_description, values, index):
+        """
+        Arrow type of a column by its MySQL type. Text and blob columns are binary if they hold bytes (binary
+        charset), columns without a type (NULL) or without values keep the type of the current slice. Type of
+        columns described by name only is inferred from the values (None).
+        """
+        # name, type_code, display_size, internal_size, precision, scale, null_ok
+        padded = tuple(column_description) + (None,) * 6
+        type_code, internal_size, scale = padded[1], padded[3], padded[5]
+        if type_code in INT_TYPES:
+            return pyarrow.int64()
+        if type_code in FLOAT_TYPES:
+            return pyarrow.float64()
+        if type_code in DECIMAL_TYPES:
+            scale = int(scale or 0)
+            # column length counts the decimal point and the sign, keeping the sign digit is safe
+            precision = max(scale + 1, min(int(internal_size or 65) - (1 if scale else 0), 76))
+            return pyarrow.decimal128(precision, scale) if precision <= 38 else pyarrow.decimal256(precision, scale)
+        if type_code in DATETIME_TYPES:
+            return pyarrow.timestamp('us')
+        if type_code in DATE_TYPES:
+            return pyarrow.date32()
+        if type_code == FIELD_TYPE.TIME:
+            return pyarrow.duration('us')
+        current = self._schema.field(index).type if self._schema is not None and index < len(self._schema) else None
+        value = next((v for v in values if v is not None), None)
+        if value is None:
+            return current or pyarrow.null()
+        if isinstance(value, bytes):
+            return pyarrow.binary()
+        if isinstance(value, str) or type_code is not None:
+            return pyarrow.string()
+        return None
+
+    def _to_array(self, name, values, arrow_type):
+        try:
+            return pyarrow.array(values, type=arrow_type)
+        except (pyarrow.ArrowException, TypeError, ValueError, OverflowError):
+            pass
+        # e.g. zero dates returned as text, converted value by value
+        converted = []
+        for v in values:
+            if v is None:
+                converted.append(v)
+            elif arrow_type is None or pyarrow.types.is_string(arrow_type):
+                converted.append(v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v))
+            elif pyarrow.types.is_binary(arrow_type):
+                converted.append(v if isinstance(v, bytes) else str(v).encode('utf-8'))
+            else:
+                try:
+                    converted.append(pyarrow.scalar(v, type=arrow_type).as_py())
+                except (pyarrow.ArrowException, TypeError, ValueError, OverflowError):
+                    converted.append(None)
+                    if name not in self._invalid_columns:
+                        self._invalid_columns.add(name)
+                        logging.warning(f'Values of column {name} in {self.name} not convertible to {arrow_type} '
+                                        f'are written as null, e.g. "{v}".')
+        return pyarrow.array(converted, type=arrow_type or pyarrow.string())
@@ -0,0 +1,214 @@
+import base64
+import gzip
+import json
+import math
+import sys
+import zlib
+
+STATE_VERSION = 2
+# shard count is derived from the number of schemas at load and once the schemas are known (retain)
+SCHEMAS_PER_SHARD = 1000
+
+
+class StateStoreError(Exception):
+    """
+
+    """
+
+
+class StateStore:
+
+    def __init__(self, shard_count=1):
+        """
+        Values stored per schema and table, e.g. last indexes. Kept in shards by schema, each shard is encoded
+        (json, gzip, base64) separately and only shards changed since the last dump are encoded again, so a single
+        update costs O(1) and a dump O(changed shards).
+
+        Table names are interned to indexes, each schema holds a list of values by table index. Not thread safe.
+
+        :param shard_count: number of shards
+        """
+        self.shard_count = max(1, int(shard_count))
+        self._tables = []
+        self._table_indexes = dict()
+        self._shards = [dict() for _ in range(self.shard_count)]
+        self._encoded = [None] * self.shard_count
+
+    @classmethod
+    def load(cls, value):
+        """
+        Load store from a dump, the legacy format (base64 encoded gzipped json {schema: {table: value}})
+        or empty if value is None.
+        """
+        if not value:
+            return cls()
+        if isinstance(value, str):
+            return cls.from_dict(_decode(value))
+        if value.get('v') != STATE_VERSION:
+            raise StateStoreError(f'Unsupported state version {value.get("v")}!')
+
+        shards = [_decode(s) for s in value['shards']]
+        store = cls(_get_shard_count(sum(len(s) for s in shards)))
+        for t in value['tables']:
+            store._intern_table(t)
+        for shard in shards:
+            for schema, values in shard.items():
+                store._get_shard(schema)[sys.intern(schema)] = values
+        if store.shard_count == len(shards):
+            # same layout, loaded shards are reused until changed
+            store._encoded = list(value['shards'])
+        return store
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        :param state: nested dict {schema: {table: value}}
+        """
+        store = cls(_get_shard_count(len(state)))
+        for schema, tables in state.items():
+            for table, value in tables.items():
+                store.set(schema, table, value)
+        return store
+
+    def get(self, schema, table, default=None):
+        index = self._table_indexes.get(table)
+        values = self._get_shard(schema).get(schema)
+        if index is None or values is None or index >= len(values) or values[index] is None:
+            return default
+        return values[index]
+
+    def set(self, schema, table, value):
+        if value is None:
+            self.delete(schema, table)
+            return
+        index = self._intern_table(table)
+        shard = self._get_shard(schema)
+        values = shard.get(schema)
+        if values is None:
+            values = shard[sys.intern(schema)] = []
+        if index >= len(values):
+            values.extend([None] * (index + 1 - len(values)))
+        elif values[index] == value:
+            return
+        values[index] = value
+        self._mark_dirty(schema)
+
+    def delete(self, schema, table):
+        index = self._table_indexes.get(table)
+        values = self._get_shard(schema).get(schema)
+        if index is None or values is None or index >= len(values) or values[index] is None:
+            return
+        values[index] = None
+        while values and values[-1] is None:
+            values.pop()
+        if not values:
+            del self._get_shard(schema)[schema]
+        self._mark_dirty(schema)
+
+    def items(self, schema):
+        """
+        :return: dict {table: value} of the schema
+        """
+        values = self._get_shard(schema).get(schema) or []
+        return {self._tables[i]: v for i, v in enumerate(values) if v is not None}
+
+    def retain(self, schemas, tables):
+        """
+        Drop values of schemas and tables that are not listed, names of the tables left without values are dropped
+        too. The store is re-sharded for the listed schemas.
+        """
+        schemas = set(schemas)
+        tables = set(tables)
+        for shard in self._shards:
+            for schema in [s for s in shard if s not in schemas]:
+                del shard[schema]
+                self._mark_dirty(schema)
+        for i, table in enumerate(self._tables):
+            if table not in tables:
+                for shard in self._shards:
+                    for schema in [s for s, values in shard.items() if i < len(values) and values[i] is not None]:
+                        self.delete(schema, table)
+        self._compact_tables()
+        self.reshard(len(schemas))
+
+    def reshard(self, schema_count):
+        """
+        Distribute the schemas over the number of shards sized for schema_count schemas, e.g. of a store loaded
+        empty. All shards are encoded again by the next dump if the number changes.
+        """
+        shard_count = _get_shard_count(schema_count)
+        if shard_count == self.shard_count:
+            return
+        shards = self._shards
+        self.shard_count = shard_count
+        self._shards = [dict() for _ in range(shard_count)]
+        self._encoded = [None] * shard_count
+        for shard in shards:
+            for schema, values in shard.items():
+                self._get_shard(schema)[schema] = values
+
+    def to_dict(self):
+        return {schema: self.items(schema) for shard in self._shards for schema in shard}
+
+    def dump(self):
+        """
+        JSON serializable representation of the store, encodes only the shards changed since the last dump.
+        """
+        for i, shard in enumerate(self._shards):
+            if self._encoded[i] is None:
+                self._encoded[i] = _encode(shard)
+        return {'v': STATE_VERSION, 'tables': list(self._tables), 'shards': list(self._encoded)}
+
+    def _intern_table(self, table):
+        index = self._table_indexes.get(table)
+        if index is None:
+            index = self._table_indexes[sys.intern(table)] = len(self._tables)
+            self._tables.append(table)
+        return index
+
+    def _compact_tables(self):
+        """
+        Drop names of the tables without any value, indexes of the remaining tables are remapped. Shards are encoded
+        again only if an index of a table with values changed.
+        """
+        used = set()
+        for shard in self._shards:
+            for values in shard.values():
+                used.update(i for i, v in enumerate(values) if v is not None)
+        if len(used) == len(self._tables):
+            return
+        kept = sorted(used)
+        self._tables = [self._tables[i] for i in kept]
+        self._table_indexes = {t: i for i, t in enumerate(self._tables)}
+        if kept == list(range(len(kept))):
+            # only the last tables were dropped, value lists never end with None so they are not affected
+            return
+        for shard in self._shards:
+            for schema, values in shard.items():
+                remapped = [values[i] if i < len(values) else None for i in kept]
+                while remapped and remapped[-1] is None:
+                    remapped.pop()
+                shard[schema] = remapped
+        self._encoded = [None] * self.shard_count
+
+    def _get_shard(self, schema):
+        return self._shards[self._get_shard_index(schema)]
+
+    def _get_shard_index(self, schema):
+        return zlib.crc32(schema.encode('utf-8')) % self.shard_count
+
+    def _mark_dirty(self, schema):
+        self._encoded[self._get_shard_index(schema)] = None
+
+
+def _get_shard_count(schema_count):
+    return max(1, math.ceil(schema_count / SCHEMAS_PER_SHARD))
+
+
+def _encode(value):
+    data = json.dumps(value, separators=(',', ':'))
+    return str(base64.b64encode(gzip.compress(bytes(data, 'utf-8'), compresslevel=6)), 'utf-8')
+
+
+def _decode(value):
+    return json.loads(gzip.decompress(base64.b64decode(value.encode('utf-8'))).decode())
@@ -0,0 +1,81 @@
+"""
+Stand-in for the KBCEnvHandler of the keboola python library (kbc), used by the component tests when the library
+is not installed. Covers the subset used by the component: parameters, state and manifest files of a data folder.
+"""
+import json
+import logging
+import os
+import sys
+import types
+
+
+class _Configuration:
+
+    def __init__(self, data_path):
+        self.data_path = data_path
+
+    @staticmethod
+    def write_table_manifest(file_name, destination='', primary_key=None, columns=None, incremental=None):
+        with open(file_name + '.manifest', 'w') as f:
+            json.dump({'destination': destination, 'primary_key': primary_key or [], 'columns': columns or [],
+                       'incremental': incremental}, f)
+
+    @staticmethod
+    def write_file_manifest(file_name, file_tags=None, is_public=False, is_permanent=True, notify=False):
+        with open(file_name + '.manifest', 'w') as f:
+            json.dump({'tags': file_tags or [], 'is_permanent': is_permanent}, f)
+
+
+class FakeEnvHandler:
+
+    def __init__(self, mandatory_params, data_path=None):
+        self.data_path = data_path or os.environ.get('KBC_DATADIR', '')
+        config_path = os.path.join(self.data_path, 'config.json')
+        if not os.path.exists(config_path):
+            raise ValueError(f'Configuration file config.json not found, verify that the data directory '
+                             f'{self.data_path} is correct!')
+        with open(config_path) as f:
+            self.cfg_params = json.load(f).get('parameters', {})
+        self.configuration = _Configuration(self.data_path)
+        self.tables_out_path = os.path.join(self.data_path, 'out', 'tables')
+        self.files_out_path = os.path.join(self.data_path, 'out', 'files')
+        os.makedirs(self.tables_out_path, exist_ok=True)
+
+    @staticmethod
+    def set_default_logger(log_level=logging.INFO):
+        logging.getLogger().setLevel(log_level)
+
+    set_gelf_logger = set_default_logger
+
+    def validate_config(self, mandatory_params=None):
+        missing = [p for p in mandatory_params or [] if not (
+            any(self.cfg_params.get(o) is not None for o in p) if isinstance(p, list)
+            else self.cfg_params.get(p) is not None)]
+        if missing:
+            raise ValueError(f'Missing mandatory config parameters fields: [{missing}]')
+
+    def get_state_file(self):
+        state_path = os.path.join(self.data_path, 'in', 'state.json')
+        if not os.path.exists(state_path):
+            return {}
+        with open(state_path) as f:
+            return json.load(f)
+
+    def write_state_file(self, state):
+        with open(os.path.join(self.data_path, 'out', 'state.json'), 'w') as f:
+            json.dump(state, f)
+
+
+def install():
+    """
+    Register the fake as kbc.env_handler unless the kbc library is installed.
+    """
+    try:
+        import kbc.env_handler  # noqa: F401
+    except ImportError:
+        kbc = types.ModuleType('kbc')
+        env_handler = types.ModuleType('kbc.env_handler')
+        env_handler.KBCEnvHandler = FakeEnvHandler
+        kbc.env_handler = env_handler
+        sys.modules['kbc'] = kbc
+        sys.modules['kbc.env_handler'] = env_handler
@@ -0,0 +1,458 @@
+"""
+In-process MySQL stand-in speaking the client/server wire protocol, backed by an in-memory sqlite database.
+
+Real drivers (pymysql, mysqlclient) connect to it over TCP, so the extractor runs end to end without a MySQL
+server. It understands the subset of SQL the extractor generates: `schema.table` references, parenthesized
+UNION ALL branches, information_schema lookups and a few SHOW statements.
+"""
+import datetime
+import logging
+import socket
+import socketserver
+import sqlite3
+import struct
+import threading
+import time
+
+# column type codes, see pymysql.constants.FIELD_TYPE
+TYPE_DECIMAL = 246
+TYPE_DOUBLE = 5
+TYPE_LONGLONG = 8
+TYPE_DATETIME = 12
+TYPE_BLOB = 252
+TYPE_VAR_STRING = 253
+
+SQL_TYPES = {
+    'INT': TYPE_LONGLONG,
+    'BIGINT': TYPE_LONGLONG,
+    'DOUBLE': TYPE_DOUBLE,
+    'DECIMAL': TYPE_DECIMAL,
+    'DATETIME': TYPE_DATETIME,
+    'VARCHAR': TYPE_VAR_STRING,
+    'TEXT': TYPE_VAR_STRING,
+    'BLOB': TYPE_BLOB,
+}
+
+CHARSET_UTF8 = 33
+CHARSET_BINARY = 63
+
+CLIENT_CAPABILITIES = (0x1 | 0x4 | 0x8 | 0x200 | 0x2000 | 0x8000 | 0x20000 | 0x80000)
+
+
+class FakeMySQLServer:
+
+    def __init__(self, latency_sec=0.0, server_status=None, cache_results=False):
+        """
+        :param latency_sec: artificial delay added to each query, simulates the network round trip
+        :param server_status: values returned by SHOW GLOBAL STATUS / SHOW REPLICA STATUS
+        :param cache_results: keep encoded results of repeated queries, so the server side costs
+        next to nothing in benchmarks of the client side
+        """
+        self.latency_sec = latency_sec
+        self.cache_results = cache_results
+        self._result_cache = {}
+        self.server_status = server_status or {'Threads_running': 1}
+        self.replica_lag = None
+        self.query_count = 0
+        self.queries = []
+        self.connections = 0
+        # connections open at the moment and the most of them open at once
+        self.open_connections = 0
+        self.max_open_connections = 0
+        self._connections_lock = threading.Lock()
+        self.fail_next = []
+        # the connection is dropped after sending this many rows of the next results
+        self.drop_after_rows = []
+        # rows of UNION ALL queries are returned in reverse order, as MySQL may ignore ORDER BY of the branches
+        self.reverse_unions = False
+        self._db = sqlite3.connect(':memory:', check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._tables = {}
+        self._schemas = []
+        self._server = None
+        self._thread = None
+        self._execute('CREATE TABLE "information_schema__TABLES" (TABLE_SCHEMA TEXT, TABLE_NAME TEXT, '
+                      'TABLE_ROWS INT, AUTO_INCREMENT INT, UPDATE_TIME DATETIME, DATA_LENGTH INT)')
+        self._execute('CREATE TABLE "information_schema__COLUMNS" (TABLE_SCHEMA TEXT, TABLE_NAME TEXT, '
+                      'COLUMN_NAME TEXT, ORDINAL_POSITION INT, DATA_TYPE TEXT)')
+
+    # ------ data setup
+    def create_table(self, schema, table, columns, rows=()):
+        """
+        :param columns: list of (name, sql_type) tuples, sql_type one of SQL_TYPES keys
+        """
+        if schema not in self._schemas:
+            self._schemas.append(schema)
+        self._tables[(schema, table)] = columns
+        col_defs = ', '.join(f'"{c}" {_sqlite_type(t)}' for c, t in columns)
+        self._execute(f'CREATE TABLE "{schema}__{table}" ({col_defs})')
+        self._execute('INSERT INTO "information_schema__TABLES" VALUES (?, ?, 0, 1, NULL, 0)', (schema, table))
+        for i, (c, t) in enumerate(columns):
+            self._execute('INSERT INTO "information_schema__COLUMNS" VALUES (?, ?, ?, ?, ?)',
+                          (schema, table, c, i + 1, t.lower()))
+        if rows:
+            self.insert_rows(schema, table, rows)
+
+    def insert_rows(self, schema, table, rows):
+        columns = self._tables[(schema, table)]
+        placeholders = ', '.join('?' for _ in columns)
+        rows = [tuple(self._to_sqlite(v) for v in r) for r in rows]
+        with self._db_lock:
+            self._db.executemany(f'INSERT INTO "{schema}__{table}" VALUES ({placeholders})', rows)
+            self._db.execute('UPDATE "information_schema__TABLES" SET TABLE_ROWS = TABLE_ROWS + ?, '
+                             'AUTO_INCREMENT = AUTO_INCREMENT + ?, UPDATE_TIME = ? '
+                             'WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?',
+                             (len(rows), len(rows), datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+                              schema, table))
+
+    def set_update_time(self, update_time):
+        """
+        Set UPDATE_TIME of all the tables, e.g. to a past time so the tables can be fingerprinted.
+        """
+        self._execute('UPDATE "information_schema__TABLES" SET UPDATE_TIME = ?', (update_time,))
+
+    @staticmethod
+    def _to_sqlite(value):
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        if not isinstance(value, (int, float, str, bytes, type(None))):
+            return str(value)
+        return value
+
+    def _execute(self, sql, args=()):
+        with self._db_lock:
+            return self._db.execute(sql, args)
+
+    # ------ server lifecycle
+    def start(self):
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+
+            def handle(self):
+                _Session(fake, self.request).serve()
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_max_open_connections(self, timeout_sec=5):
+        """
+        Wait until the connections closed by the clients are closed by the server too, then start counting
+        the most connections open at once again.
+        """
+        deadline = time.perf_counter() + timeout_sec
+        while self.open_connections and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        with self._connections_lock:
+            self.max_open_connections = self.open_connections
+
+    # ------ query handling
+    def run_query(self, sql):
+        """
+        :return: (column definitions [(name, type, charset)], rows) or None for statements without result
+        """
+        self.query_count += 1
+        self.queries.append(sql)
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        if self.fail_next:
+            raise QueryError(*self.fail_next.pop(0))
+
+        stmt = sql.strip().rstrip(';')
+        upper = stmt.upper()
+        if upper in ('SHOW SCHEMAS', 'SHOW DATABASES'):
+            return [('Database', TYPE_VAR_STRING, CHARSET_UTF8)], [(s,) for s in ['information_schema'] + self._schemas]
+        if upper.startswith('SHOW GLOBAL STATUS'):
+            rows = [(k, str(v)) for k, v in self.server_status.items() if k.upper() in upper or 'LIKE' not in upper]
+            return [('Variable_name', TYPE_VAR_STRING, CHARSET_UTF8),
+                    ('Value', TYPE_VAR_STRING, CHARSET_UTF8)], rows
+        if upper.startswith('SHOW REPLICA STATUS') or upper.startswith('SHOW SLAVE STATUS'):
+            if self.replica_lag is None:
+                return [('Seconds_Behind_Source', TYPE_LONGLONG, CHARSET_BINARY)], []
+            return [('Seconds_Behind_Source', TYPE_LONGLONG, CHARSET_BINARY)], [(self.replica_lag,)]
+        if upper.startswith('SET ') or upper.startswith('USE '):
+            return None
+
+        translated = self._translate(stmt)
+        try:
+            with self._db_lock:
+                cur = self._db.execute(translated)
+                rows = cur.fetchall()
+                names = [d[0] for d in cur.description] if cur.description else []
+        except sqlite3.OperationalError as e:
+            if 'no such table' in str(e):
+                raise QueryError(1146, f"Table doesn't exist: {e}")
+            raise QueryError(1064, f'{e} [{translated}]')
+        if self.reverse_unions and ' UNION ALL ' in translated:
+            rows.reverse()
+        return [self._describe(n, rows, i) for i, n in enumerate(names)], rows
+
+    def _describe(self, name, rows, idx):
+        for (schema, table), columns in self._tables.items():
+            for c, t in columns:
+                if c == name:
+                    sql_type = SQL_TYPES[t.split('(')[0].upper()]
+                    return name, sql_type, CHARSET_BINARY if sql_type == TYPE_BLOB else CHARSET_UTF8
+        sample = next((r[idx] for r in rows if r[idx] is not None), None)
+        if isinstance(sample, int):
+            return name, TYPE_LONGLONG, CHARSET_BINARY
+        if isinstance(sample, float):
+            return name, TYPE_DOUBLE, CHARSET_BINARY
+        if isinstance(sample, bytes):
+            return name, TYPE_BLOB, CHARSET_BINARY
+        return name, TYPE_VAR_STRING, CHARSET_UTF8
+
+    def _translate(self, sql):
+        sql = sql.replace('`', '"')
+        # server time in the same format as UPDATE_TIME
+        sql = sql.replace('NOW()', "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')")
+        for schema in ['information_schema'] + self._schemas:
+            for table in self._table_names(schema):
+                for ref in (f'"{schema}"."{table}"', f'{schema}."{table}"', f'"{schema}".{table}',
+                            f'{schema}.{table}'):
+                    sql = _replace_ref(sql, ref, f'"{schema}__{table}"')
+        if sql.startswith('('):
+            parts = _split_union(sql)
+            sql = ' UNION ALL '.join(f'SELECT * FROM ({p})' for p in parts)
+        return sql
+
+    def _table_names(self, schema):
+        if schema == 'information_schema':
+            return ['TABLES', 'COLUMNS']
+        return [t for s, t in self._tables if s == schema]
+
+
+class QueryError(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+
+def _replace_ref(sql, ref, replacement):
+    """Replace qualified table reference, only where it is not part of a longer identifier"""
+    out = []
+    i = 0
+    while True:
+        j = sql.find(ref, i)
+        if j < 0:
+            out.append(sql[i:])
+            break
+        before = sql[j - 1] if j > 0 else ' '
+        after_idx = j + len(ref)
+        after = sql[after_idx] if after_idx < len(sql) else ' '
+        # inside a string literal, e.g. 'schema.table' label
+        in_literal = sql.count("'", 0, j) % 2 == 1
+        if in_literal or (before.isalnum() or before in '_."') or (after.isalnum() or after == '_'):
+            out.append(sql[i:after_idx])
+        else:
+            out.append(sql[i:j])
+            out.append(replacement)
+        i = after_idx
+    return ''.join(out)
+
+
+def _split_union(sql):
+    """Split `(SELECT ..) UNION ALL (SELECT ..)` into the parenthesized branches"""
+    parts = []
+    depth = 0
+    start = None
+    in_str = False
+    for i, ch in enumerate(sql):
+        if ch == "'" and (i == 0 or sql[i - 1] != '\\'):
+            in_str = not in_str
+        if in_str:
+            continue
+        if ch == '(':
+            if depth == 0:
+                start = i + 1
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                parts.append(sql[start:i])
+    return parts
+
+
+class _Session:
+    """Single client connection"""
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.seq = 0
+
+    def serve(self):
+        with self.server._connections_lock:
+            self.server.connections += 1
+            self.server.open_connections += 1
+            self.server.max_open_connections = max(self.server.max_open_connections, self.server.open_connections)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._handshake()
+            while True:
+                data = self._read_packet()
+                if data is None:
+                    break
+                command = data[0]
+                if command == 0x01:
+                    break
+                elif command == 0x03:
+                    self._handle_query(data[1:].decode('utf-8'))
+                else:
+                    # COM_PING, COM_INIT_DB and others are acknowledged
+                    self._send_ok()
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:  # pragma: no cover - debugging aid
+            logging.exception(e)
+        finally:
+            with self.server._connections_lock:
+                self.server.open_connections -= 1
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    # ------ protocol
+    def _handshake(self):
+        salt = b'abcdefghijklmnopqrst'
+        payload = (b'\x0a' + b'8.0.33-fake\x00' + struct.pack('<I', 1) + salt[:8] + b'\x00'
+                   + struct.pack('<H', CLIENT_CAPABILITIES & 0xffff) + bytes([CHARSET_UTF8])
+                   + struct.pack('<H', 2) + struct.pack('<H', CLIENT_CAPABILITIES >> 16)
+                   + bytes([len(salt) + 1]) + b'\x00' * 10 + salt[8:] + b'\x00'
+                   + b'mysql_native_password\x00')
+        self.seq = 0
+        self._write_packet(payload)
+        self._read_packet()
+        self._send_ok()
+
+    def _handle_query(self, sql):
+        cached = self.server._result_cache.get(sql)
+        if cached:
+            self.server.query_count += 1
+            columns, payloads = cached
+        else:
+            try:
+                result = self.server.run_query(sql)
+            except QueryError as e:
+                self._send_error(e.code, e.message)
+                return
+            if result is None:
+                self._send_ok()
+                return
+            columns, rows = result
+            payloads = [b''.join(_encode_value(v) for v in r) for r in rows]
+            if self.server.cache_results:
+                self.server._result_cache[sql] = (columns, payloads)
+        drop_after = self.server.drop_after_rows.pop(0) if self.server.drop_after_rows else None
+        if drop_after is not None:
+            payloads = payloads[:drop_after]
+        self._write_packet(_lenenc_int(len(columns)))
+        for name, col_type, charset in columns:
+            self._write_packet(_column_definition(name, col_type, charset))
+        self._send_eof()
+        buffer = []
+        for payload in payloads:
+            buffer.append(self._frame(payload))
+            if len(buffer) >= 256:
+                self.sock.sendall(b''.join(buffer))
+                buffer = []
+        if buffer:
+            self.sock.sendall(b''.join(buffer))
+        if drop_after is not None:
+            raise ConnectionError('Connection dropped')
+        self._send_eof()
+
+    def _read_packet(self):
+        header = self._recv(4)
+        if header is None:
+            return None
+        length = header[0] | header[1] << 8 | header[2] << 16
+        self.seq = (header[3] + 1) & 0xff
+        return self._recv(length)
+
+    def _recv(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _frame(self, payload):
+        packet = struct.pack('<I', len(payload))[:3] + bytes([self.seq]) + payload
+        self.seq = (self.seq + 1) & 0xff
+        return packet
+
+    def _write_packet(self, payload):
+        self.sock.sendall(self._frame(payload))
+
+    def _send_ok(self):
+        self._write_packet(b'\x00\x00\x00' + struct.pack('<HH', 2, 0))
+
+    def _send_eof(self):
+        self._write_packet(b'\xfe' + struct.pack('<HH', 0, 2))
+
+    def _send_error(self, code, message):
+        self._write_packet(b'\xff' + struct.pack('<H', code) + b'#42000' + message.encode('utf-8'))
+
+
+def _sqlite_type(sql_type):
+    # keep decimals and dates as text so sqlite does not turn them into floats
+    if sql_type.split('(')[0].upper() in ('DECIMAL', 'DATETIME', 'VARCHAR'):
+        return 'TEXT'
+    return sql_type
+
+
+def _lenenc_int(i):
+    if i < 251:
+        return bytes([i])
+    if i < 2 ** 16:
+        return b'\xfc' + struct.pack('<H', i)
+    if i < 2 ** 24:
+        return b'\xfd' + struct.pack('<I', i)[:3]
+    return b'\xfe' + struct.pack('<Q', i)
+
+
+def _lenenc_str(b):
+    return _lenenc_int(len(b)) + b
+
+
+def _column_definition(name, col_type, charset):
+    name = name.encode('utf-8')
+    return (_lenenc_str(b'def') + _lenenc_str(b'') + _lenenc_str(b'') + _lenenc_str(b'') + _lenenc_str(name)
+            + _lenenc_str(name) + b'\x0c' + struct.pack('<HIBHB', charset, 255, col_type, 0,
+                                                        4 if col_type == TYPE_DECIMAL else 0)
+            + b'\x00\x00')
+
+
+def _encode_value(v):
+    if v is None:
+        return b'\xfb'
+    if isinstance(v, bytes):
+        return _lenenc_str(v)
+    if isinstance(v, float):
+        return _lenenc_str(repr(v).encode('ascii'))
+    return _lenenc_str(str(v).encode('utf-8'))
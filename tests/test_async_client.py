@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import unittest
+
+from tests.fake_mysql_server import FakeMySQLServer
+from mysql_connect.async_client import AsyncClientPool
+from mysql_connect.client import Client
+
+COLUMNS = [('id', 'INT'), ('amount', 'DECIMAL(10,2)'), ('created', 'DATETIME')]
+
+ROWS = [(i, f'{i}.50', datetime.datetime(2020, 1, i)) for i in range(1, 6)]
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMySQLServer(latency_sec=0.01).start()
+        for i in range(10):
+            cls.server.create_table(f'tenant_{i}', 'orders', COLUMNS, ROWS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def _run(self, coro_fn, max_size=2):
+        async def run():
+            pool = await AsyncClientPool('127.0.0.1', self.server.port, 'user', 'pass', max_size=max_size).open()
+            try:
+                return await coro_fn(pool)
+            finally:
+                await pool.close_all()
+        return asyncio.run(run())
+
+    @staticmethod
+    async def _read(client, schema, **kwargs):
+        return [chunk async for chunk in client.get_table_data_chunks('orders', schema, sort_key_col='id', **kwargs)]
+
+    def test_chunks_match_sync_client(self):
+        chunks = self._run(lambda pool: self._read(pool.client(), 'tenant_0', since_index='2'))
+        client = Client('127.0.0.1', self.server.port, 'user', 'pass')
+        self.addCleanup(client.db.close)
+        expected = list(client.get_table_data_chunks('orders', 'tenant_0', since_index='2', sort_key_col='id'))
+        self.assertEqual(expected, chunks)
+        self.assertEqual('5', chunks[-1][2])
+
+    def test_concurrent_queries_capped_by_pool_size(self):
+        connections = self.server.connections
+
+        async def read_all(pool):
+            return await asyncio.gather(*(self._read(pool.client(), f'tenant_{i}') for i in range(10)))
+
+        results = self._run(read_all, max_size=3)
+        self.assertEqual([5] * 10, [sum(len(rows) for rows, _, _ in chunks) for chunks in results])
+        self.assertLessEqual(self.server.connections - connections, 3)
+
+    def test_missing_table_returns_no_chunks(self):
+        with self.assertLogs(level='WARNING'):
+            chunks = self._run(lambda pool: self._read(pool.client(), 'missing'))
+        self.assertEqual([], chunks)
+
+    def test_row_counts(self):
+        rows, col_names = self._run(lambda pool: pool.client().get_table_row_counts(
+            [('tenant_1', 'orders', '3', 'id', 'numeric')]))
+        self.assertEqual([(3, '3', 'id', 'tenant_1.orders', 0)], [tuple(r) for r in rows])
+        self.assertEqual('cnt', col_names[0])
+
+    def test_row_counts_of_dropped_table_skipped(self):
+        with self.assertLogs(level='WARNING') as logs:
+            rows, _ = self._run(lambda pool: pool.client().get_table_row_counts(
+                [('tenant_1', 'orders', '3', 'id', 'numeric'), ('missing', 'orders', '3', 'id', 'numeric'),
+                 ('tenant_2', 'orders', None, 'id', 'numeric')]))
+        self.assertIn('does not exist in schema missing', logs.output[0])
+        self.assertEqual([(3, '3', 'id', 'tenant_1.orders', 0), (5, 'None', 'id', 'tenant_2.orders', 0)],
+                         sorted(tuple(r) for r in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
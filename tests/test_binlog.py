@@ -0,0 +1,51 @@
+import datetime
+import decimal
+import json
+import os
+import tempfile
+import unittest
+
+from mysql_connect.binlog import BinlogFileReader, _to_json_value
+
+EVENTS = [
+    {'type': 'write', 'schema': 'tenant_a', 'table': 'orders', 'rows': [{'id': 1}], 'log_file': 'bin.000001',
+     'log_pos': 100},
+    {'type': 'commit', 'log_file': 'bin.000001', 'log_pos': 120},
+    {'type': 'delete', 'schema': 'tenant_b', 'table': 'orders', 'rows': [{'id': 2}], 'log_file': 'bin.000001',
+     'log_pos': 200},
+    {'type': 'write', 'schema': 'tenant_a', 'table': 'audit', 'rows': [{'id': 3}], 'log_file': 'bin.000001',
+     'log_pos': 250},
+    {'type': 'write', 'schema': 'other', 'table': 'orders', 'rows': [{'id': 4}], 'log_file': 'bin.000001',
+     'log_pos': 300},
+    {'type': 'commit', 'log_file': 'bin.000002', 'log_pos': 4},
+]
+
+
+class TestBinlogFileReader(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(fd, 'w') as f:
+            for e in EVENTS:
+                f.write(json.dumps(e) + '\n')
+
+    def test_replays_events_of_the_tables_after_position(self):
+        reader = BinlogFileReader(self.path, ['tenant_a', 'tenant_b'], ['orders'], 'bin.000001', 120)
+        events = list(reader.read())
+        self.assertEqual([('delete', 'tenant_b', [{'id': 2}]), ('commit', None, None)],
+                         [(e['type'], e.get('schema'), e.get('rows')) for e in events])
+        self.assertEqual(('bin.000002', 4), (events[-1]['log_file'], events[-1]['log_pos']))
+
+    def test_replays_from_beginning_without_position(self):
+        reader = BinlogFileReader(self.path, ['tenant_a'], ['orders'])
+        self.assertEqual(['write', 'commit', 'commit'], [e['type'] for e in reader.read()])
+
+    def test_captured_values_are_json_serializable(self):
+        values = {'d': datetime.datetime(2020, 1, 1), 'n': decimal.Decimal('1.50'), 'b': b'x', 'i': 1}
+        self.assertEqual({'d': '2020-01-01 00:00:00', 'n': '1.50', 'b': 'x', 'i': 1},
+                         json.loads(json.dumps(values, default=_to_json_value)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import csv
+import datetime
+import decimal
+import io
+import unittest
+
+from tests.fake_mysql_server import FakeMySQLServer
+from metrics import TableMetrics
+from mysql_connect.client import ChunkSizer, Client, ClientError, INITIAL_CHUNK_SIZE, to_key_value
+
+COLUMNS = [('id', 'INT'), ('amount', 'DECIMAL(10,2)'), ('created', 'DATETIME'), ('note', 'VARCHAR(50)')]
+
+ROWS = [(1, '1.50', datetime.datetime(2020, 1, 1), 'plain'),
+        (2, '2.00', datetime.datetime(2020, 1, 1), 'comma, "quoted"'),
+        (3, '3.25', datetime.datetime(2020, 1, 2), None),
+        (4, '4.00', datetime.datetime(2020, 1, 2), 'multi\nline'),
+        (5, '5.00', datetime.datetime(2020, 1, 3), '')]
+
+# above 2^53, not exact as doubles
+BIG_IDS = [2 ** 53 + i for i in range(1, 6)]
+
+
+class TestClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMySQLServer().start()
+        for schema in ('tenant_a', 'tenant_b'):
+            cls.server.create_table(schema, 'orders', COLUMNS, ROWS)
+        cls.server.create_table('tenant_a', 'big', [('id', 'BIGINT'), ('amount', 'DECIMAL(10,2)')],
+                                [(i, '1.50') for i in BIG_IDS])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def _client(self, **kwargs):
+        client = Client('127.0.0.1', self.server.port, 'user', 'pass', **kwargs)
+        self.addCleanup(client.db.close)
+        return client
+
+    @staticmethod
+    def _to_csv(rows):
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        return out.getvalue()
+
+    def test_raw_values_produce_identical_csv(self):
+        typed = [r for data, _, _ in self._client().get_table_data_chunks('orders', 'tenant_a', sort_key_col='id')
+                 for r in data]
+        raw = [r for data, _, _ in self._client(raw_values=True).get_table_data_chunks('orders', 'tenant_a',
+                                                                                        sort_key_col='id')
+               for r in data]
+        self.assertIsInstance(raw[0][1], str)
+        self.assertEqual(self._to_csv(typed), self._to_csv(raw))
+
+    def test_pages_with_duplicate_sort_key_read_each_row_once(self):
+        pages = list(self._client().get_table_data_pages('orders', 'tenant_a', sort_key_col='created', page_size=2,
+                                                         key_cols=['created', 'id']))
+        ids = [r[0] for data, _, _ in pages for r in data]
+        self.assertEqual([1, 2, 3, 4, 5], ids)
+        self.assertEqual('2020-01-03 00:00:00', pages[-1][2])
+
+    def test_page_repeated_after_connection_lost_while_fetching(self):
+        client = self._client()
+        # dropped in the middle of the second page
+        self.server.drop_after_rows = [None, 1]
+        self.addCleanup(setattr, self.server, 'drop_after_rows', [])
+        with self.assertLogs(level='WARNING'):
+            pages = list(client.get_table_data_pages('orders', 'tenant_a', sort_key_col='id', page_size=2))
+        self.assertEqual([1, 2, 3, 4, 5], [r[0] for data, _, _ in pages for r in data])
+        self.assertIn('(id) > (2)', self.server.queries[-2])
+
+    def test_page_retries_bounded(self):
+        self.server.drop_after_rows = [0, 0, 0]
+        self.addCleanup(setattr, self.server, 'drop_after_rows', [])
+        with self.assertRaises(ClientError), self.assertLogs(level='WARNING'):
+            list(self._client().get_table_data_pages('orders', 'tenant_a', sort_key_col='id', page_size=2))
+
+    def test_numeric_page_keys_of_raw_values_unquoted(self):
+        pages = list(self._client(raw_values=True).get_table_data_pages('big', 'tenant_a', sort_key_col='id',
+                                                                        page_size=2, key_cols=['id']))
+        self.assertEqual([str(i) for i in BIG_IDS], [r[0] for data, _, _ in pages for r in data])
+        self.assertIn(f'(id) > ({BIG_IDS[1]})', self.server.queries[-2])
+
+    def test_key_values_of_numeric_columns_converted(self):
+        self.assertEqual(BIG_IDS[0], to_key_value(str(BIG_IDS[0]), 8))
+        self.assertEqual(decimal.Decimal('1.50'), to_key_value(b'1.50', 246))
+        self.assertEqual('2020-01-01 00:00:00', to_key_value('2020-01-01 00:00:00', 12))
+
+    def test_union_splits_last_ids_per_schema(self):
+        chunks = list(self._client().get_union_table_data_chunks('orders', ['tenant_a', 'tenant_b'],
+                                                                 since_indexes={'tenant_a': '4'},
+                                                                 sort_key_col='id'))
+        rows = [r for data, _, _ in chunks for r in data]
+        last_ids = {}
+        for _, col_names, ids in chunks:
+            self.assertEqual('schema_nm', col_names[-1])
+            last_ids.update(ids)
+        self.assertEqual(2 + 5, len(rows))
+        self.assertEqual({'tenant_a': '5', 'tenant_b': '5'}, last_ids)
+
+    def test_table_dropped_after_metadata_skipped(self):
+        client = self._client()
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual([], list(client.get_table_data_chunks('orders', 'missing', sort_key_col='id')))
+            chunks = list(client.get_union_table_data_chunks('orders', ['tenant_a', 'missing', 'tenant_b'],
+                                                             sort_key_col='id'))
+        self.assertEqual(2, len([m for m in logs.output if 'does not exist in schema missing' in m]))
+        self.assertEqual(10, len([r for data, _, _ in chunks for r in data]))
+        self.assertEqual({'tenant_a', 'tenant_b'}, {s for _, _, ids in chunks for s in ids})
+
+    def test_tables_metadata_lists_existing_tables_only(self):
+        metadata = self._client().get_tables_metadata(['tenant_a', 'tenant_b', 'missing'], ['orders', 'customers'])
+        self.assertEqual({'tenant_a': ['orders'], 'tenant_b': ['orders']},
+                         {s: list(tables) for s, tables in metadata.items()})
+        update_time, table_rows, auto_increment, checked_at = metadata['tenant_a']['orders']
+        self.assertEqual(5, table_rows)
+        self.assertLessEqual(str(update_time), str(checked_at))
+
+    def test_tables_columns_in_table_order(self):
+        columns = self._client().get_tables_columns(['tenant_a', 'tenant_b', 'missing'], ['orders'])
+        self.assertEqual({'tenant_a': {'orders': ['id', 'amount', 'created', 'note']},
+                          'tenant_b': {'orders': ['id', 'amount', 'created', 'note']}}, columns)
+
+    def test_row_counts_of_several_tables_in_one_query(self):
+        client = self._client()
+        queries = self.server.query_count
+        rows, col_names = client.get_table_row_counts([('tenant_a', 'orders', '3', 'id', 'numeric'),
+                                                       ('tenant_b', 'orders', '2020-01-02 00:00:00', 'created',
+                                                        'string')])
+        self.assertEqual(['cnt', 'last_index', 'sort_key_col', 'table', 'is_estimate'], col_names)
+        self.assertEqual([(3, '3', 'id', 'tenant_a.orders', 0),
+                          (4, '2020-01-02 00:00:00', 'created', 'tenant_b.orders', 0)],
+                         sorted(tuple(r) for r in rows))
+        self.assertEqual(1, self.server.query_count - queries)
+
+    def test_row_counts_of_dropped_table_skipped(self):
+        client = self._client()
+        with self.assertLogs(level='WARNING') as logs:
+            rows, col_names = client.get_table_row_counts([('tenant_a', 'orders', '3', 'id', 'numeric'),
+                                                           ('missing', 'orders', '3', 'id', 'numeric')])
+        self.assertIn('does not exist in schema missing', logs.output[0])
+        self.assertEqual([(3, '3', 'id', 'tenant_a.orders', 0)], [tuple(r) for r in rows])
+        self.assertEqual('cnt', col_names[0])
+        # the connection is still usable
+        self.assertEqual(1, len(client.get_table_row_counts([('tenant_b', 'orders', '1', 'id', 'numeric')])[0]))
+
+    def test_load_signals(self):
+        self.server.server_status = {'Threads_running': 12}
+        self.server.replica_lag = 40
+        self.addCleanup(setattr, self.server, 'replica_lag', None)
+        self.assertEqual((12, 40), self._client().get_load_signals())
+
+    def test_metrics_recorded_per_table(self):
+        metrics = TableMetrics()
+        list(self._client(metrics=metrics).get_table_data_pages('orders', 'tenant_a', sort_key_col='id',
+                                                                page_size=2))
+        row, = metrics.get_rows()
+        self.assertEqual(('tenant_a', 'orders', 3, 5), (row['schema'], row['table'], row['queries'], row['rows']))
+        self.assertGreater(row['bytes'], 0)
+        self.assertGreaterEqual(row['first_row_sec'], 0)
+
+
+class TestChunkSizer(unittest.TestCase):
+
+    def test_chunks_sized_by_budget(self):
+        narrow = [(1, 'a')] * 50
+        wide = [(1, 'a' * 10000)] * 50
+        budget = ChunkSizer.estimate_row_size(wide) * 20
+        sizer = ChunkSizer(budget)
+        # probe before the row width is known
+        self.assertEqual(INITIAL_CHUNK_SIZE, sizer.size)
+        self.assertLessEqual(INITIAL_CHUNK_SIZE, 20)
+
+        sizer.observe(wide)
+        self.assertEqual(20, sizer.size)
+        self.assertEqual(ChunkSizer.estimate_row_size(wide) * 50, sizer.chunk_bytes)
+        # narrower rows grow the chunk gradually, wider ones shrink it at once
+        sizer.observe(narrow)
+        self.assertLess(20, sizer.size)
+        self.assertGreater(budget // ChunkSizer.estimate_row_size(narrow), sizer.size)
+        sizer.observe(wide)
+        self.assertEqual(20, sizer.size)
+
+    def test_size_bounds(self):
+        sizer = ChunkSizer(1, max_size=5)
+        sizer.observe([(1, 'a' * 100)])
+        self.assertEqual(1, sizer.size)
+        sizer = ChunkSizer(10 ** 12, max_size=5)
+        self.assertEqual(5, sizer.size)
+        sizer.observe([(1,)])
+        self.assertEqual(5, sizer.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
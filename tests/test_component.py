@@ -3,12 +3,60 @@ Created on 12. 11. 2018
 
 @author: esner
 '''
+import csv
+import decimal
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
 import unittest
 import mock
-import os
+import pyarrow.parquet
 from freezegun import freeze_time
 
-from component import Component
+from tests.fake_env_handler import install
+from tests.fake_mysql_server import FakeMySQLServer
+
+install()
+
+from component import Component, QUERY_COST_SEC, ROW_COST_SEC  # noqa: E402
+from mysql_connect.pool import ClientPool  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+ORDERS = [('id', 'INT'), ('amount', 'DECIMAL(10,2)')]
+CUSTOMERS = [('id', 'INT'), ('name', 'VARCHAR(20)')]
+
+TABLES = [{'name': 'orders', 'columns': [], 'pkey': ['id']},
+          {'name': 'customers', 'columns': [], 'pkey': ['id']}]
+
+
+class TimingOutComponent(Component):
+    """
+    Reaches the max runtime once a chunk of the given table has been written.
+    """
+    timeout_table = None
+
+    def store_table_data(self, data, name, schema=None, description=None):
+        super().store_table_data(data, name, schema=schema, description=description)
+        if name == self.timeout_table:
+            self._timed_out = True
+
+    def is_timed_out(self):
+        return getattr(self, '_timed_out', False)
+
+
+class FailingComponent(Component):
+    """
+    Fails when a chunk of the given table is written.
+    """
+    fail_table = None
+
+    def store_table_data(self, data, name, schema=None, description=None):
+        if name == self.fail_table:
+            raise RuntimeError('Write failed')
+        super().store_table_data(data, name, schema=schema, description=description)
 
 
 class TestComponent(unittest.TestCase):
@@ -23,6 +71,456 @@ class TestComponent(unittest.TestCase):
             comp.run()
 
 
+class TestScheduling(unittest.TestCase):
+
+    @staticmethod
+    def _component(table_rows, timings=None, max_runtime_sec=100, elapsed_sec=0):
+        """
+        Component with the state of the metadata pre-pass, without a run.
+
+        :param table_rows: dict {schema: {table: TABLE_ROWS}}
+        """
+        comp = Component.__new__(Component)
+        comp._schedule_by_cost = True
+        comp._skip_unchanged = True
+        comp._fingerprints = StateStore()
+        comp._loaded = StateStore()
+        comp._streamed_schemas = set()
+        comp._timings = StateStore.from_dict(timings or {})
+        comp._tables_metadata = {s: {t: (None, rows, None, '2020-01-01 00:00:00') for t, rows in tables.items()}
+                                 for s, tables in table_rows.items()}
+        comp.max_runtime_sec = max_runtime_sec
+        comp.start_time = time.perf_counter() - elapsed_sec
+        return comp
+
+    def test_cost_from_timings_then_row_counts(self):
+        comp = self._component({'tenant_a': {'orders': 1000, 'customers': '500'}},
+                               timings={'tenant_a': {'orders': 7.5}})
+        self.assertEqual(7.5, comp._estimate_cost('tenant_a', 'orders', None))
+        # raw values metadata is text
+        self.assertAlmostEqual(QUERY_COST_SEC + 500 * ROW_COST_SEC, comp._estimate_cost('tenant_a', 'customers', None))
+        self.assertAlmostEqual(QUERY_COST_SEC + 100 * ROW_COST_SEC, comp._estimate_cost('tenant_a', 'customers', 100))
+        self.assertEqual(0, comp._estimate_cost('tenant_a', 'missing', None))
+
+    def test_longest_batches_first(self):
+        # medium took long to download last run
+        comp = self._component({'small': {'orders': 10}, 'large': {'orders': 10 ** 6},
+                                'medium': {'orders': 10 ** 4, 'customers': 10}}, timings={'medium': {'customers': 50}})
+        params = {}
+        schema_queue = comp._get_schema_queue(['small', 'large', 'medium'], 1, ['orders', 'customers'], params)
+        self.assertEqual([['medium'], ['large'], ['small']], list(schema_queue.queue))
+
+        schema_queue = comp._get_schema_queue(['small', 'large', 'medium'], 2, ['orders', 'customers'], params)
+        self.assertEqual([['medium'], ['small', 'large']], list(schema_queue.queue))
+
+        comp._schedule_by_cost = False
+        schema_queue = comp._get_schema_queue(['small', 'large', 'medium'], 1, ['orders', 'customers'], params)
+        self.assertEqual([['small'], ['large'], ['medium']], list(schema_queue.queue))
+
+    def test_deferred_only_if_cost_exceeds_remaining_runtime(self):
+        timings = {'tenant_a': {'fits': 30, 'too_long': 50, 'longer_than_run': 150}}
+        comp = self._component({'tenant_a': {t: 0 for t in timings['tenant_a']}}, timings=timings, elapsed_sec=60)
+        self.assertFalse(comp._is_deferred(['tenant_a'], 'fits', None))
+        self.assertTrue(comp._is_deferred(['tenant_a'], 'too_long', None))
+        # would not fit even a whole run, started anyway
+        self.assertFalse(comp._is_deferred(['tenant_a'], 'longer_than_run', None))
+
+        comp._schedule_by_cost = False
+        self.assertFalse(comp._is_deferred(['tenant_a'], 'too_long', None))
+
+
+class ComponentRunTestCase(unittest.TestCase):
+    """
+    Runs of the component against the fake server, each run reads the state written by the previous one.
+    """
+
+    def setUp(self):
+        self.server = FakeMySQLServer().start()
+        self.addCleanup(self.server.stop)
+        for schema in ('tenant_a', 'tenant_b'):
+            self.server.create_table(schema, 'orders', ORDERS, [(i, f'{i}.50') for i in range(1, 6)])
+            self.server.create_table(schema, 'customers', CUSTOMERS, [(i, f'c{i}') for i in range(1, 4)])
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        os.makedirs(os.path.join(self.data_dir, 'in'))
+        self.host_id = f'127.0.0.1:{self.server.port}'
+
+    def _run(self, params, state=None, component_class=Component):
+        """
+        :param params: parameters over the defaults, None removes the parameter
+        :param state: state of the previous run, the output state of the last run if None
+        :return: output state
+        """
+        config = {'#password': 'pass', 'user': 'user', 'host': '127.0.0.1', 'port': self.server.port,
+                  'schema_pattern': '^tenant_', 'tables': TABLES, **params}
+        config = {k: v for k, v in config.items() if v is not None}
+        with open(os.path.join(self.data_dir, 'config.json'), 'w') as f:
+            json.dump({'parameters': config}, f)
+        state_path = os.path.join(self.data_dir, 'out', 'state.json')
+        if state is None and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        with open(os.path.join(self.data_dir, 'in', 'state.json'), 'w') as f:
+            json.dump(state or {}, f)
+        shutil.rmtree(os.path.join(self.data_dir, 'out'), ignore_errors=True)
+
+        with mock.patch.dict(os.environ, {'KBC_DATADIR': self.data_dir}):
+            component_class().run()
+        with open(state_path) as f:
+            return json.load(f)
+
+    def _read_output(self, name):
+        rows = []
+        for path in sorted(glob.glob(os.path.join(self.data_dir, 'out', 'tables', name, '*.csv'))):
+            with open(path) as f:
+                rows.extend(csv.reader(f))
+        return rows
+
+    @staticmethod
+    def _state_values(state, key):
+        return StateStore.load(state.get(key)).to_dict()
+
+
+class TestHosts(ComponentRunTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # replica of tenant_b listed after the primary
+        self.replica = FakeMySQLServer().start()
+        self.addCleanup(self.replica.stop)
+        for schema in ('tenant_b', 'tenant_c'):
+            self.replica.create_table(schema, 'orders', ORDERS, [(i, f'{i}.50') for i in range(100, 102)])
+            self.replica.create_table(schema, 'customers', CUSTOMERS, [])
+
+    def test_hosts_inherit_top_level_parameters(self):
+        params = {'user': 'root', '#password': 'secret', 'port': 3307, 'max_workers': 4,
+                  'hosts': [{'host': 'shard1'},
+                            {'host': 'shard2', 'port': 3308, 'user': 'ro', '#password': 'ro', 'max_connections': 2,
+                             'compress': True}]}
+        hosts = Component.__new__(Component)._get_hosts(params)
+        self.assertEqual([{'host': 'shard1', 'user': 'root', '#password': 'secret', 'port': 3307, 'compress': False,
+                           'max_connections': 4, 'max_workers': 4},
+                          {'host': 'shard2', 'user': 'ro', '#password': 'ro', 'port': 3308, 'compress': True,
+                           'max_connections': 2, 'max_workers': 2}], hosts)
+
+    def test_credentials_validated_per_host(self):
+        comp = Component.__new__(Component)
+        hosts = comp._get_hosts({'hosts': [{'host': 'shard1', 'user': 'a', '#password': 'x'},
+                                           {'host': 'shard2', 'user': 'b', '#password': ''}]})
+        self.assertEqual(['a', 'b'], [h['user'] for h in hosts])
+        with self.assertRaisesRegex(ValueError, '#password of host shard2'):
+            comp._get_hosts({'hosts': [{'host': 'shard1', 'user': 'a', '#password': 'x'},
+                                       {'host': 'shard2', 'user': 'b'}]})
+        with self.assertRaisesRegex(ValueError, 'Host is not specified'):
+            comp._get_hosts({'hosts': [{'user': 'a', '#password': 'x'}]})
+
+    def test_schema_found_on_several_hosts_extracted_from_first(self):
+        comp = Component.__new__(Component)
+        comp._schema_pools = dict()
+        pools = [ClientPool('127.0.0.1', s.port, 'user', 'pass') for s in (self.server, self.replica)]
+        for pool in pools:
+            self.addCleanup(pool.close_all)
+        with self.assertLogs(level='WARNING'):
+            schemas = [comp._discover_schemas(p, {'schema_pattern': '^tenant_'}, True) for p in pools]
+        self.assertEqual([['tenant_a', 'tenant_b'], ['tenant_c']], schemas)
+
+        comp._schema_pools = dict()
+        params = {'schema_list': ['tenant_b', 'tenant_c', 'missing']}
+        with self.assertLogs(level='WARNING'):
+            schemas = [comp._discover_schemas(p, params, True) for p in pools]
+        self.assertEqual([['tenant_b'], ['tenant_c']], schemas)
+        self.assertEqual({'tenant_b': pools[0], 'tenant_c': pools[1]}, comp._schema_pools)
+
+    def test_run_with_credentials_of_each_host(self):
+        hosts = [{'host': '127.0.0.1', 'port': s.port, 'user': 'user', '#password': 'pass'}
+                 for s in (self.server, self.replica)]
+        self._run({'hosts': hosts, 'host': None, 'port': None, 'user': None, '#password': None})
+
+        rows = sorted((r[-1], int(r[0])) for r in self._read_output('orders'))
+        self.assertEqual([('tenant_a', i) for i in range(1, 6)] + [('tenant_b', i) for i in range(1, 6)]
+                         + [('tenant_c', 100), ('tenant_c', 101)], rows)
+
+
+class TestInterruptedRun(ComponentRunTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.initial_state = {'indexes': StateStore.from_dict({'tenant_b': {'orders': '3'}}).dump()}
+
+    def test_timed_out_run_resumes_from_last_written_key(self):
+        TimingOutComponent.timeout_table = 'orders'
+        self.addCleanup(setattr, TimingOutComponent, 'timeout_table', None)
+        params = {'page_size': 2, 'schedule': 'config'}
+        state = self._run(params, state=self.initial_state, component_class=TimingOutComponent)
+
+        # stopped after the first page, tenant_b not reached keeps its index
+        self.assertEqual([['1', '1.50', 'tenant_a'], ['2', '2.50', 'tenant_a']], self._read_output('orders'))
+        self.assertEqual({'tenant_a': {'orders': '2'}, 'tenant_b': {'orders': '3'}},
+                         self._state_values(state, 'indexes'))
+
+        state = self._run(params)
+        self.assertEqual(['2', '3', '4', '5', '3', '4', '5'], [r[0] for r in self._read_output('orders')])
+        self.assertEqual({s: {'orders': '5', 'customers': '3'} for s in ('tenant_a', 'tenant_b')},
+                         self._state_values(state, 'indexes'))
+
+    def test_checkpoint_of_failed_run(self):
+        FailingComponent.fail_table = 'customers'
+        self.addCleanup(setattr, FailingComponent, 'fail_table', None)
+        with self.assertRaises(RuntimeError):
+            self._run({'checkpoint_interval_sec': 0, 'schedule': 'config'}, state=self.initial_state,
+                      component_class=FailingComponent)
+
+        # checkpoint after the first table, its rows are flushed
+        with open(os.path.join(self.data_dir, 'out', 'state.json')) as f:
+            state = json.load(f)
+        self.assertEqual({'tenant_a': {'orders': '5'}, 'tenant_b': {'orders': '3'}},
+                         self._state_values(state, 'indexes'))
+        self.assertEqual(5, len(self._read_output('orders')))
+
+    def test_parquet_checkpoint_of_failed_run(self):
+        FailingComponent.fail_table = 'customers'
+        self.addCleanup(setattr, FailingComponent, 'fail_table', None)
+        with self.assertRaises(RuntimeError):
+            self._run({'checkpoint_interval_sec': 0, 'schedule': 'config', 'output_format': 'parquet'},
+                      state=self.initial_state, component_class=FailingComponent)
+
+        # rows covered by the checkpoint are in finalized slices
+        with open(os.path.join(self.data_dir, 'out', 'state.json')) as f:
+            state = json.load(f)
+        self.assertEqual({'tenant_a': {'orders': '5'}, 'tenant_b': {'orders': '3'}},
+                         self._state_values(state, 'indexes'))
+        paths = glob.glob(os.path.join(self.data_dir, 'out', 'files', 'orders', '*.parquet'))
+        self.assertEqual(5, sum(pyarrow.parquet.read_table(p).num_rows for p in paths))
+
+
+class TestDeferredTables(ComponentRunTestCase):
+
+    def test_tables_deferred_only_if_scheduled_by_cost(self):
+        # took almost the whole runtime last run
+        state = {'timings': StateStore.from_dict({'tenant_a': {'orders': 99.99}}).dump()}
+        params = {'max_runtime_sec': 100}
+        self._run(params, state=state)
+        self.assertEqual(10, len(self._read_output('orders')))
+
+        with self.assertLogs(level='INFO') as logs:
+            self._run({**params, 'schedule': 'largest_first'}, state=state)
+        self.assertEqual(['tenant_b'] * 5, [r[-1] for r in self._read_output('orders')])
+        self.assertTrue(any('Deferring to the next run' in m for m in logs.output))
+
+
+class TestExclusiveBoundary(ComponentRunTestCase):
+
+    def test_numeric_keys_of_raw_values_stored_as_numbers(self):
+        ids = [2 ** 53 + i for i in range(1, 4)]
+        self.server.create_table('tenant_a', 'big', [('id', 'BIGINT'), ('amount', 'DECIMAL(10,2)')],
+                                 [(i, f'{i % 10}.00') for i in ids])
+        params = {'raw_values': True, 'boundary_mode': 'exclusive', 'schema_pattern': '^tenant_a$',
+                  'skip_unchanged_tables': False,
+                  'tables': [{'name': 'big', 'columns': [], 'pkey': ['id'],
+                              'sort_key': {'col_name': 'amount,id', 'sort_key_type': 'numeric'}}]}
+        state = self._run(params)
+        self.assertEqual({'tenant_a': {'big': [5, ids[-1]]}}, self._state_values(state, 'indexes'))
+
+        self._run(params)
+        self.assertIn(f'(amount,id) > (5,{ids[-1]})', self.server.queries[-1])
+
+
+class TestParallelRanges(ComponentRunTestCase):
+
+    def test_split_points(self):
+        self.assertEqual([3, 5, 7], Component._get_split_points(1, 10, 4))
+        self.assertEqual([decimal.Decimal('1.0')], Component._get_split_points(decimal.Decimal('0.5'),
+                                                                               decimal.Decimal('1.5'), 2))
+        # integral points of a narrow interval collapse
+        self.assertEqual([1], Component._get_split_points(0, 2, 4))
+        self.assertEqual([], Component._get_split_points(5, 5, 4))
+
+    def test_progress_stops_at_first_unfinished_range(self):
+        def ranges(*progress):
+            return [{'last': last, 'finished': finished} for last, finished in progress]
+
+        self.assertEqual(('9', True), Component._get_ranges_progress(ranges(('3', True), ('9', True)), '1'))
+        self.assertEqual(('4', False),
+                         Component._get_ranges_progress(ranges(('3', True), ('4', False), ('9', True)), '1'))
+        # nothing read in the first range
+        self.assertEqual(('1', False), Component._get_ranges_progress(ranges((None, False), ('9', True)), '1'))
+
+    def test_row_limit_splits_first_rows(self):
+        self.server.create_table('tenant_a', 'events', ORDERS, [(i, f'{i}.50') for i in range(1, 21)])
+        params = {'schema_pattern': '^tenant_a$', 'row_limit': 10, 'max_connections': 4,
+                  'tables': [{'name': 'events', 'columns': [], 'pkey': ['id'], 'parallel_ranges': 4}]}
+        state = self._run(params)
+
+        # ranges [1, 3), [3, 5), [5, 7) and the rest of the limit from 7
+        self.assertEqual(list(range(1, 10)), sorted(int(r[0]) for r in self._read_output('events')))
+        self.assertEqual({'tenant_a': {'events': '9'}}, self._state_values(state, 'indexes'))
+
+        self._run(params)
+        self.assertEqual(list(range(9, 18)), sorted(int(r[0]) for r in self._read_output('events')))
+
+
+class TestParallelWorkers(ComponentRunTestCase):
+
+    def test_workers_within_connection_cap(self):
+        for i in range(3, 9):
+            self.server.create_table(f'tenant_{i}', 'orders', ORDERS, [(j, f'{j}.50') for j in range(1, i)])
+        params = {'validation_mode': True, 'skip_unchanged_tables': False}
+        state = self._run({**params, 'max_workers': 1})
+        expected = {name: sorted(self._read_output(name)) for name in ('orders', 'customers', 'row_counts')}
+
+        # the row count worker shares the connections with the extraction workers
+        self.server.latency_sec = 0.01
+        self.server.reset_max_open_connections()
+        parallel_state = self._run({**params, 'max_workers': 2, 'max_connections': 2}, state={})
+        self.assertEqual(expected, {name: sorted(self._read_output(name)) for name in expected})
+        self.assertEqual(self._state_values(state, 'indexes'), self._state_values(parallel_state, 'indexes'))
+        self.assertEqual(2, self.server.max_open_connections)
+
+
+class TestUnionBatches(ComponentRunTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # branches without LIMIT are not returned in their order
+        self.server.reverse_unions = True
+
+    def test_last_ids_are_greatest_keys_of_each_schema(self):
+        params = {'union_batch_size': 2, 'skip_unchanged_tables': False}
+        state = self._run(params)
+        self.assertEqual([(s, i) for s in ('tenant_a', 'tenant_b') for i in range(1, 6)],
+                         sorted((r[-1], int(r[0])) for r in self._read_output('orders')))
+        self.assertEqual({s: {'orders': '5', 'customers': '3'} for s in ('tenant_a', 'tenant_b')},
+                         self._state_values(state, 'indexes'))
+
+        self.server.insert_rows('tenant_a', 'orders', [(6, '6.50'), (7, '7.50')])
+        state = self._run(params)
+        # inclusive boundary, the last row is read again
+        self.assertEqual([('tenant_a', 5), ('tenant_a', 6), ('tenant_a', 7), ('tenant_b', 5)],
+                         sorted((r[-1], int(r[0])) for r in self._read_output('orders')))
+        self.assertEqual({'tenant_a': {'orders': '7', 'customers': '3'}, 'tenant_b': {'orders': '5', 'customers': '3'}},
+                         self._state_values(state, 'indexes'))
+
+    def test_exclusive_keys_are_greatest_keys_of_each_schema(self):
+        params = {'union_batch_size': 2, 'skip_unchanged_tables': False, 'boundary_mode': 'exclusive'}
+        state = self._run(params)
+        self.assertEqual({s: {'orders': [5], 'customers': [3]} for s in ('tenant_a', 'tenant_b')},
+                         self._state_values(state, 'indexes'))
+
+        self.server.insert_rows('tenant_b', 'customers', [(4, 'c4')])
+        state = self._run(params)
+        self.assertEqual([['4', 'c4', 'tenant_b']], self._read_output('customers'))
+        self.assertEqual([], self._read_output('orders'))
+        self.assertEqual({'tenant_a': {'orders': [5], 'customers': [3]}, 'tenant_b': {'orders': [5], 'customers': [4]}},
+                         self._state_values(state, 'indexes'))
+
+
+class TestAsyncEngine(ComponentRunTestCase):
+
+    def _outputs(self):
+        return {name: sorted(self._read_output(name)) for name in ('orders', 'customers', 'row_counts')}
+
+    def test_output_identical_to_threads_within_connection_cap(self):
+        for i in range(3, 8):
+            self.server.create_table(f'tenant_{i}', 'orders', ORDERS, [(j, f'{j}.50') for j in range(1, i)])
+        params = {'max_connections': 2, 'validation_mode': True, 'skip_unchanged_tables': False}
+        state = self._run(params)
+        expected = self._outputs()
+
+        self.server.reset_max_open_connections()
+        async_state = self._run({**params, 'engine': 'async'}, state={})
+        self.assertEqual(expected, self._outputs())
+        self.assertEqual(7 + 2, len(expected['row_counts']))
+        self.assertEqual(self._state_values(state, 'indexes'), self._state_values(async_state, 'indexes'))
+        self.assertLessEqual(self.server.max_open_connections, 2)
+
+
+class TestColumnOrder(ComponentRunTestCase):
+
+    def _read_manifest(self, name):
+        with open(os.path.join(self.data_dir, 'out', 'tables', f'{name}.manifest')) as f:
+            return json.load(f)
+
+    def test_missing_columns_selected_as_null_in_canonical_order(self):
+        self.server.create_table('tenant_a', 'items', ORDERS, [(1, '1.50')])
+        # extra column, in a different position
+        self.server.create_table('tenant_b', 'items', [('id', 'INT'), ('note', 'VARCHAR(20)'), ORDERS[1]],
+                                 [(2, 'b', '2.50')])
+        params = {'skip_unchanged_tables': False, 'tables': [{'name': 'items', 'columns': [], 'pkey': ['id']}]}
+        state = self._run(params)
+
+        self.assertEqual(['id', 'amount', 'note', 'schema_nm'], self._read_manifest('items')['columns'])
+        self.assertEqual([['1', '1.50', '', 'tenant_a'], ['2', '2.50', 'b', 'tenant_b']],
+                         sorted(self._read_output('items')))
+        self.assertEqual({'items': ['id', 'amount', 'note']}, state['columns'])
+
+        # order of the last run is kept, though the only schema orders the columns differently
+        state = self._run({**params, 'schema_pattern': '^tenant_b$'})
+        self.assertEqual(['id', 'amount', 'note', 'schema_nm'], self._read_manifest('items')['columns'])
+        self.assertEqual([['2', '2.50', 'b', 'tenant_b']], self._read_output('items'))
+        self.assertEqual({'items': ['id', 'amount', 'note']}, state['columns'])
+
+
+class TestValidation(ComponentRunTestCase):
+
+    def _row_counts(self):
+        return sorted((r[3], int(r[0])) for r in self._read_output('row_counts'))
+
+    def test_tables_downloaded_by_the_run_counted(self):
+        # payments of tenant_a were dropped since the last run
+        self.server.create_table('tenant_b', 'payments', ORDERS, [(1, '1.00'), (2, '2.00')])
+        self.server.set_update_time('2020-01-01 00:00:00')
+        params = {'validation_mode': True, 'skip_unchanged_tables': True,
+                  'tables': TABLES + [{'name': 'payments', 'columns': [], 'pkey': ['id']}]}
+        state = {'indexes': StateStore.from_dict({'tenant_a': {'payments': '7'}}).dump()}
+        with self.assertLogs(level='WARNING'):
+            state = self._run(params, state=state)
+
+        self.assertEqual([('tenant_a.customers', 3), ('tenant_a.orders', 5), ('tenant_b.customers', 3),
+                          ('tenant_b.orders', 5), ('tenant_b.payments', 2)], self._row_counts())
+        self.assertEqual('7', self._state_values(state, 'indexes')['tenant_a']['payments'])
+
+        # unchanged tables are not downloaded nor counted again
+        self._run(params)
+        self.assertEqual([], self._row_counts())
+
+
+class TestBinlogInitialLoad(ComponentRunTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.replay_path = os.path.join(self.data_dir, 'binlog.jsonl')
+        open(self.replay_path, 'w').close()
+
+    def _run_binlog(self, loaded=None, component_class=Component):
+        # position stored, changes of the loaded tables are read from the (empty) replayed binlog
+        state = {'binlog': {self.host_id: ['bin.000001', 4]}}
+        if loaded:
+            state['loaded'] = StateStore.from_dict(loaded).dump()
+        return self._run({'sync_mode': 'binlog', 'binlog_replay_path': self.replay_path}, state=state,
+                         component_class=component_class)
+
+    def test_table_added_later_is_loaded(self):
+        state = self._run_binlog(loaded={'tenant_a': {'orders': 1}, 'tenant_b': {'orders': 1}})
+
+        self.assertEqual([], self._read_output('orders'))
+        self.assertEqual(6, len(self._read_output('customers')))
+        self.assertEqual({s: {'orders': 1, 'customers': 1} for s in ('tenant_a', 'tenant_b')},
+                         self._state_values(state, 'loaded'))
+
+    def test_table_timed_out_mid_load_is_loaded_next_run(self):
+        TimingOutComponent.timeout_table = 'orders'
+        self.addCleanup(setattr, TimingOutComponent, 'timeout_table', None)
+        state = self._run_binlog(component_class=TimingOutComponent)
+
+        # stopped after the first table of the first schema
+        self.assertEqual({}, self._state_values(state, 'loaded'))
+        self.assertEqual(5, len(self._read_output('orders')))
+
+        state = self._run_binlog(loaded=self._state_values(state, 'loaded'))
+        self.assertEqual({s: {'orders': 1, 'customers': 1} for s in ('tenant_a', 'tenant_b')},
+                         self._state_values(state, 'loaded'))
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
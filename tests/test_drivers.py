@@ -0,0 +1,82 @@
+import csv
+import datetime
+import io
+import unittest
+
+from tests.fake_mysql_server import FakeMySQLServer
+from mysql_connect.client import Client, ClientError
+from mysql_connect.drivers import DRIVER_MYSQLCLIENT, DRIVER_PYMYSQL, get_driver
+
+try:
+    import MySQLdb  # noqa: F401
+    MYSQLCLIENT_INSTALLED = True
+except ImportError:
+    MYSQLCLIENT_INSTALLED = False
+
+COLUMNS = [('id', 'INT'), ('amount', 'DECIMAL(10,2)'), ('ratio', 'DOUBLE'), ('created', 'DATETIME'),
+           ('note', 'VARCHAR(50)'), ('payload', 'BLOB')]
+
+ROWS = [(1, '1.50', 0.25, datetime.datetime(2020, 1, 1, 12, 30), 'plain', b'\x00\x01'),
+        (2, '-2.00', -1e-7, '0000-00-00 00:00:00', 'comma, "quoted"\nmulti line', None),
+        (3, None, None, None, 'žluťoučký kůň', b''),
+        (4, '4.00', 1e20, datetime.datetime(2020, 1, 2), '', b'bytes')]
+
+
+class TestDriverConformance(unittest.TestCase):
+    """
+    Output of each driver must be identical to the output of the default pymysql driver.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMySQLServer().start()
+        cls.server.create_table('tenant_a', 'orders', COLUMNS, ROWS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def _extract(self, **kwargs):
+        client = Client('127.0.0.1', self.server.port, 'user', 'pass', **kwargs)
+        self.addCleanup(client.db.close)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for data, col_names, last_id in client.get_table_data_chunks('orders', 'tenant_a', since_index='1',
+                                                                     sort_key_col='id'):
+            writer.writerow(col_names + [last_id])
+            writer.writerows(data)
+        metadata = client.get_tables_metadata(['tenant_a'], ['orders'])
+        return out.getvalue(), list(metadata['tenant_a'])
+
+    def _assert_conformant(self, **kwargs):
+        for raw_values in (False, True):
+            with self.subTest(raw_values=raw_values):
+                self.assertEqual(self._extract(raw_values=raw_values),
+                                 self._extract(raw_values=raw_values, **kwargs))
+
+    def test_pymysql_reference(self):
+        output, tables = self._extract()
+        self.assertIn('0000-00-00 00:00:00', output)
+        self.assertIn('žluťoučký kůň', output)
+        self.assertEqual(['orders'], tables)
+
+    @unittest.skipUnless(MYSQLCLIENT_INSTALLED, 'mysqlclient is not installed')
+    def test_mysqlclient_identical_to_pymysql(self):
+        self._assert_conformant(driver=DRIVER_MYSQLCLIENT)
+
+    @unittest.skipUnless(MYSQLCLIENT_INSTALLED, 'mysqlclient is not installed')
+    def test_mysqlclient_compressed_identical_to_pymysql(self):
+        self._assert_conformant(driver=DRIVER_MYSQLCLIENT, compress=True)
+
+    def test_unsupported_options(self):
+        with self.assertRaises(ValueError):
+            get_driver('odbc')
+        with self.assertRaises(ValueError):
+            Client('127.0.0.1', self.server.port, 'user', 'pass', driver=DRIVER_PYMYSQL, compress=True)
+        if not MYSQLCLIENT_INSTALLED:
+            with self.assertRaises(ClientError):
+                Client('127.0.0.1', self.server.port, 'user', 'pass', driver=DRIVER_MYSQLCLIENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import datetime
+import decimal
+import glob
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import pyarrow
+import pyarrow.parquet
+
+from tests.fake_mysql_server import FakeMySQLServer
+from mysql_connect.client import Client
+from output_writer import OutputWriter, OutputWriterError, FORMAT_PARQUET
+
+COLUMNS = [('id', 'INT'), ('amount', 'DECIMAL(10,2)'), ('created', 'DATETIME'), ('note', 'VARCHAR(50)')]
+
+ROWS = [(1, '1.50', datetime.datetime(2020, 1, 1), 'plain'),
+        (2, '2.00', datetime.datetime(2020, 1, 2, 10, 30), None)]
+
+
+class TestParquetOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _read(self, name):
+        return [pyarrow.parquet.read_table(p) for p in sorted(glob.glob(os.path.join(self.path, name, '*.parquet')))]
+
+    def test_columns_typed_by_cursor_description(self):
+        server = FakeMySQLServer().start()
+        self.addCleanup(server.stop)
+        server.create_table('tenant_a', 'orders', COLUMNS, ROWS)
+        client = Client('127.0.0.1', server.port, 'user', 'pass')
+        self.addCleanup(client.db.close)
+
+        writer = OutputWriter(self.path, output_format=FORMAT_PARQUET)
+        for data, _, _ in client.get_table_data_chunks('orders', 'tenant_a', sort_key_col='id'):
+            writer.write('orders', data, suffix='tenant_a', description=client.description)
+        writer.close()
+
+        table, = self._read('orders')
+        self.assertEqual(['id', 'amount', 'created', 'note', 'schema_nm'], table.column_names)
+        self.assertEqual(pyarrow.int64(), table.schema.field('id').type)
+        self.assertTrue(pyarrow.types.is_decimal(table.schema.field('amount').type))
+        self.assertEqual(pyarrow.timestamp('us'), table.schema.field('created').type)
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('schema_nm').type))
+        self.assertEqual({'id': 2, 'amount': decimal.Decimal('2.00'), 'created': datetime.datetime(2020, 1, 2, 10, 30),
+                          'note': None, 'schema_nm': 'tenant_a'}, table.to_pylist()[1])
+
+    def test_new_slice_on_different_types_and_row_groups(self):
+        writer = OutputWriter(self.path, output_format=FORMAT_PARQUET, row_group_rows=2)
+        writer.write('orders', [(1, 'a'), (2, None), (3, 'c')], suffix='tenant_a', description=[('id',), ('note',)])
+        # the same table of another schema with a binary note
+        writer.write('orders', [(4, b'\x00')], suffix='tenant_b', description=[('id',), ('note',)])
+        writer.close()
+
+        first, second = self._read('orders')
+        self.assertEqual(pyarrow.string(), first.schema.field('note').type)
+        self.assertEqual(pyarrow.binary(), second.schema.field('note').type)
+        self.assertEqual([1, 2, 3, 4], first.column('id').to_pylist() + second.column('id').to_pylist())
+        first_path = sorted(glob.glob(os.path.join(self.path, 'orders', '*.parquet')))[0]
+        self.assertEqual(2, pyarrow.parquet.ParquetFile(first_path).num_row_groups)
+
+    def test_flush_finalizes_slice(self):
+        writer = OutputWriter(self.path, output_format=FORMAT_PARQUET)
+        writer.write('orders', [(1, 'a'), (2, 'b')], suffix='tenant_a', description=[('id',), ('note',)])
+        writer.flush()
+        # readable before the writer is closed, the footer is written
+        table, = self._read('orders')
+        self.assertEqual([1, 2], table.column('id').to_pylist())
+
+        writer.write('orders', [(3, 'c')], suffix='tenant_a', description=[('id',), ('note',)])
+        writer.close()
+        self.assertEqual([[1, 2], [3]], [t.column('id').to_pylist() for t in self._read('orders')])
+
+
+class TestCsvOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _read(self, name):
+        content = ''
+        for p in sorted(glob.glob(os.path.join(self.path, name, '*.csv'))):
+            with open(p, newline='') as f:
+                content += f.read()
+        return content
+
+    def _blocking_writer(self, **kwargs):
+        """
+        Writer whose threads wait until the returned event is set before writing each chunk.
+
+        :return: writer, release event, semaphore released whenever a thread starts writing a chunk
+        """
+        writer = OutputWriter(self.path, **kwargs)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+        write_chunk = writer._write_chunk
+
+        def blocked_write_chunk(*args):
+            started.release()
+            release.wait()
+            write_chunk(*args)
+
+        writer._write_chunk = blocked_write_chunk
+        self.addCleanup(release.set)
+        return writer, release, started
+
+    def test_rows_with_suffix(self):
+        writer = OutputWriter(self.path)
+        writer.write('orders', [(1, 'comma, "quoted"'), (2, None)], suffix='tenant_a')
+        writer.write('orders', [(3, 'x')], suffix=('tenant_b', 0))
+        writer.close()
+        self.assertEqual('1,"comma, ""quoted""",tenant_a\r\n2,,tenant_a\r\n3,x,tenant_b,0\r\n', self._read('orders'))
+
+    def test_full_queue_blocks_producer(self):
+        writer, release, started = self._blocking_writer(queue_size=1)
+        # taken by the writer thread, then queued
+        writer.write('orders', [(1,)])
+        self.assertTrue(started.acquire(timeout=5))
+        writer.write('orders', [(2,)])
+        producer = threading.Thread(target=writer.write, args=('orders', [(3,)]))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+
+        release.set()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        writer.close()
+        self.assertEqual('1\r\n2\r\n3\r\n', self._read('orders'))
+
+    def test_flush_waits_for_queued_chunks(self):
+        writer, release, _ = self._blocking_writer(writer_threads=2, queue_size=4)
+        for i in range(4):
+            writer.write(f'table_{i}', [(i,)] * 100)
+        flushing = threading.Thread(target=writer.flush)
+        flushing.start()
+        flushing.join(0.2)
+        self.assertTrue(flushing.is_alive())
+
+        release.set()
+        flushing.join(5)
+        # on disk before the files are closed
+        self.assertEqual(['0\r\n' * 100, '1\r\n' * 100, '2\r\n' * 100, '3\r\n' * 100],
+                         [self._read(f'table_{i}') for i in range(4)])
+        writer.close()
+
+    def test_error_raised_on_next_write_and_flush(self):
+        writer = OutputWriter(self.path)
+        write_chunk = writer._write_chunk
+
+        def failing_write_chunk(name, *args):
+            if name == 'broken':
+                raise OSError('No space left on device')
+            write_chunk(name, *args)
+
+        writer._write_chunk = failing_write_chunk
+        writer.write('broken', [(1,)])
+        with self.assertRaisesRegex(OutputWriterError, 'No space left'):
+            writer.flush()
+        with self.assertRaises(OutputWriterError):
+            writer.write('orders', [(2,)])
+        with self.assertRaises(OutputWriterError):
+            writer.close()
+        # the writer threads are stopped
+        self.assertFalse(any(t.is_alive() for t in writer._threads))
+
+    def test_close_writes_remaining_chunks_into_slices(self):
+        writer = OutputWriter(self.path, slice_size_mb=0.001, compression='gzip')
+        for i in range(10):
+            # random values, gzip does not shrink them below the slice size
+            writer.write('orders', [(i, os.urandom(100).hex()) for _ in range(10)], suffix='tenant_a')
+        writer.close()
+
+        rows = []
+        paths = sorted(glob.glob(os.path.join(self.path, 'orders', '*.csv.gz')))
+        for p in paths:
+            with gzip.open(p, 'rt', newline='') as f:
+                rows.extend(f.read().splitlines())
+        self.assertGreater(len(paths), 1)
+        self.assertEqual(100, len(rows))
+        self.assertFalse(any(t.is_alive() for t in writer._threads))
+
+
+if __name__ == "__main__":
+    unittest.main()
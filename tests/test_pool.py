@@ -0,0 +1,46 @@
+import threading
+import unittest
+
+from tests.fake_mysql_server import FakeMySQLServer
+from mysql_connect.pool import ClientPool
+
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeMySQLServer().start()
+        self.addCleanup(self.server.stop)
+        self.pool = ClientPool('127.0.0.1', self.server.port, 'user', 'pass', max_size=2)
+        self.addCleanup(self.pool.close_all)
+
+    def test_connections_capped_by_max_size(self):
+        clients = [self.pool.acquire(), self.pool.acquire()]
+        self.assertIsNone(self.pool.acquire(block=False))
+        self.assertIsNone(self.pool.acquire(timeout=0.1))
+        self.assertEqual(2, self.server.connections)
+
+        acquired = []
+        waiting = threading.Thread(target=lambda: acquired.append(self.pool.acquire()))
+        waiting.start()
+        waiting.join(0.1)
+        self.assertTrue(waiting.is_alive())
+        # released connection is reused
+        self.pool.release(clients[0])
+        waiting.join(5)
+        self.assertEqual([clients[0]], acquired)
+        self.assertEqual(2, self.server.connections)
+
+    def test_closed_connections_can_be_opened_again(self):
+        with self.pool.connection() as client:
+            self.assertEqual([], client.get_schemas_by_pattern('^tenant_'))
+        self.pool.close_all()
+        self.assertFalse(client.db.open)
+        clients = [self.pool.acquire(), self.pool.acquire()]
+        self.assertTrue(all(c.db.open for c in clients))
+        self.assertIsNone(self.pool.acquire(block=False))
+        for c in clients:
+            self.pool.release(c)
+
+
+if __name__ == "__main__":
+    unittest.main()
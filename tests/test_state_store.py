@@ -0,0 +1,93 @@
+import base64
+import gzip
+import json
+import unittest
+
+from state_store import SCHEMAS_PER_SHARD, StateStore
+
+SCHEMAS = 20000
+TABLES = 5
+
+
+def _legacy_state(state):
+    return str(base64.b64encode(gzip.compress(bytes(json.dumps(state), 'utf-8'))), 'utf-8')
+
+
+class TestStateStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.state = {f'tenant_{i:05d}': {f'table_{j}': str(1000000 + i * 7 + j) for j in range(TABLES)}
+                     for i in range(SCHEMAS)}
+
+    def test_loads_legacy_format(self):
+        store = StateStore.load(_legacy_state({'a': {'orders': '5', 'customers': [3, 'x']}}))
+        self.assertEqual('5', store.get('a', 'orders'))
+        self.assertEqual([3, 'x'], store.get('a', 'customers'))
+        self.assertIsNone(store.get('b', 'orders'))
+
+    def test_dump_round_trip(self):
+        store = StateStore.from_dict({'a': {'orders': '5', 'customers': '3'}, 'b': {'customers': '1'}})
+        store.delete('a', 'customers')
+        store.retain(['a', 'b'], ['orders'])
+        dump = store.dump()
+        self.assertEqual(['orders'], dump['tables'])
+        loaded = StateStore.load(json.loads(json.dumps(dump)))
+        self.assertEqual({'a': {'orders': '5'}}, loaded.to_dict())
+
+    def test_tables_without_values_dropped(self):
+        store = StateStore.from_dict({'a': {'orders': '5', 'customers': '3'}, 'b': {'customers': '1', 'items': '2'}})
+        store.retain(['a', 'b'], ['customers', 'items'])
+        dump = store.dump()
+        self.assertEqual(['customers', 'items'], dump['tables'])
+        self.assertEqual({'a': {'customers': '3'}, 'b': {'customers': '1', 'items': '2'}},
+                         StateStore.load(json.loads(json.dumps(dump))).to_dict())
+
+        # last table without values, the other values keep their indexes and the shards are not encoded again
+        store.delete('b', 'items')
+        dump = store.dump()
+        store.retain(['a', 'b'], ['customers', 'items'])
+        self.assertEqual(dump['shards'], store._encoded)
+        self.assertEqual(['customers'], store.dump()['tables'])
+
+    def test_empty_store_sharded_by_retained_schemas(self):
+        schemas = list(self.state)
+        store = StateStore.load(None)
+        store.retain(schemas, ['table_1'])
+        self.assertEqual(SCHEMAS // SCHEMAS_PER_SHARD, store.shard_count)
+
+        for schema in schemas:
+            store.set(schema, 'table_1', '1')
+        dump = store.dump()
+        store.set('tenant_00001', 'table_1', 'changed')
+        dump_after = store.dump()
+        self.assertEqual(1, sum(1 for a, b in zip(dump['shards'], dump_after['shards']) if a != b))
+
+        # fewer schemas merge the shards, values are kept
+        store.retain(schemas[:10], ['table_1'])
+        self.assertEqual(1, store.shard_count)
+        loaded = StateStore.load(json.loads(json.dumps(store.dump())))
+        self.assertEqual('changed', loaded.get('tenant_00001', 'table_1'))
+        self.assertEqual(10, len(loaded.to_dict()))
+
+    def test_large_state_size_and_update_cost(self):
+        store = StateStore.from_dict(self.state)
+        dump = store.dump()
+
+        # not larger than the legacy single blob
+        self.assertLessEqual(len(json.dumps(dump)), len(_legacy_state(self.state)) * 1.05)
+
+        updated = [f'tenant_{i * 1000:05d}' for i in range(10)]
+        for schema in updated:
+            store.set(schema, 'table_1', 'changed')
+            dump_after = store.dump()
+
+        # single update re-encodes only its own shard
+        changed = sum(1 for a, b in zip(dump['shards'], dump_after['shards']) if a != b)
+        self.assertEqual(len({store._get_shard_index(s) for s in updated}), changed)
+        self.assertLess(changed, store.shard_count)
+        self.assertEqual('changed', StateStore.load(dump_after).get('tenant_01000', 'table_1'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from mysql_connect.throttle import Throttle, MIN_PAGE_FACTOR
+
+
+class _StatusClient:
+
+    def __init__(self, threads_running=1, replica_lag=None):
+        self.threads_running = threads_running
+        self.replica_lag = replica_lag
+
+    def get_load_signals(self):
+        return self.threads_running, self.replica_lag
+
+
+class TestThrottle(unittest.TestCase):
+
+    def _check(self, throttle, client, times=1):
+        for _ in range(times):
+            throttle.acquire(client)
+            throttle.release()
+            throttle._last_check = None
+
+    def test_backs_off_on_overload_and_recovers(self):
+        throttle = Throttle(8, max_threads_running=20, max_replica_lag_sec=30, check_interval_sec=0)
+        client = _StatusClient(threads_running=50)
+        self._check(throttle, client)
+        self.assertEqual((4, 5000), (int(throttle.concurrency), throttle.get_page_size(10000)))
+
+        client.threads_running, client.replica_lag = 5, 120
+        self._check(throttle, client, times=2)
+        self.assertEqual(1, int(throttle.concurrency))
+
+        client.replica_lag = 0
+        self._check(throttle, client, times=20)
+        self.assertEqual((8, 10000), (int(throttle.concurrency), throttle.get_page_size(10000)))
+        self.assertEqual(0, throttle.pause_sec)
+
+    def test_pauses_once_at_minimum(self):
+        throttle = Throttle(2, max_query_latency_sec=1, check_interval_sec=0)
+        client = _StatusClient()
+        for _ in range(10):
+            throttle.acquire(client)
+            throttle.release(latency_sec=5)
+            throttle._last_check = None
+            if throttle.pause_sec:
+                break
+        self.assertEqual(MIN_PAGE_FACTOR, throttle.page_factor)
+        self.assertEqual(1, throttle.pause_sec)
+
+    def test_limits_concurrent_queries(self):
+        throttle = Throttle(4, max_threads_running=10, check_interval_sec=3600)
+        throttle.acquire(_StatusClient(threads_running=100))
+        throttle.release()
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def query():
+            throttle.acquire(None)
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+            throttle.release()
+
+        threads = [threading.Thread(target=query) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(2, max(peak))
+
+
+if __name__ == "__main__":
+    unittest.main()